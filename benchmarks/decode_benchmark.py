@@ -0,0 +1,140 @@
+"""
+Compare peak memory and latency of the crop decode strategies in
+`scripts.decoding` against a full decode of the page image.
+
+Each strategy is run in a fresh process so that peak RSS figures are not
+polluted by earlier runs.  Synthetic page images are generated unless
+existing ones are given:
+
+    $ python benchmarks/decode_benchmark.py
+    $ python benchmarks/decode_benchmark.py --jpeg page.jpg --tiff page.tif
+"""
+
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from scripts.decoding import (  # noqa: E402
+    decode_region, open_reduced, reduced_box, reduction_for_scale)
+
+
+def full_decode(path, box, scale):
+    image = Image.open(path)
+    image_crop = image.crop(box)
+    if scale != 1:
+        image_crop = image_crop.resize(
+            [round(_ * scale) for _ in image_crop.size], Image.LANCZOS)
+    image_crop.load()
+
+
+def draft_decode(path, box, scale):
+    reduce = reduction_for_scale(scale)
+    image_crop = open_reduced(path, reduce).crop(reduced_box(box, reduce))
+    image_crop.load()
+
+
+def region_decode(path, box, scale):
+    decode_region(path, box).load()
+
+
+STRATEGIES = {
+    'full': full_decode,
+    'draft': draft_decode,
+    'region': region_decode,
+}
+
+
+def peak_rss_kb():
+    """ Peak resident set size of this process in KB.  On Linux, ru_maxrss
+        is inherited from the parent across fork/exec, so read VmHWM (which
+        belongs to the process' own address space) instead when possible.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(strategy, path, box, scale, repeat, results):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        STRATEGIES[strategy](path, box, scale)
+        timings.append(time.perf_counter() - start)
+    peak_rss = peak_rss_kb()
+    results.put((min(timings), sum(timings) / len(timings), peak_rss))
+
+
+def measure(strategy, path, box, scale, repeat):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(
+        target=run, args=(strategy, path, box, scale, repeat, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--jpeg', help='JPEG page image')
+    parser.add_argument('--tiff', help='uncompressed TIFF page image')
+    parser.add_argument('--size', default='4000x6000',
+                        help='size of generated page images (WxH)')
+    parser.add_argument('--box', default='1500,2500,40,60',
+                        help='crop box as x,y,w,h')
+    parser.add_argument('--scale', type=float, default=0.25,
+                        help='output scale for the draft strategy')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    x, y, w, h = (int(_) for _ in args.box.split(','))
+    box = (x, y, x + w, y + h)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not (args.jpeg and args.tiff):
+            width, height = (int(_) for _ in args.size.split('x'))
+            page = Image.effect_noise((width, height), 64).convert('RGB')
+            if not args.jpeg:
+                args.jpeg = os.path.join(tmp_dir, 'page.jpg')
+                page.save(args.jpeg, quality=90)
+            if not args.tiff:
+                args.tiff = os.path.join(tmp_dir, 'page.tif')
+                page.save(args.tiff)
+            del page
+
+        cases = [
+            ('full', args.jpeg, 1),
+            ('full', args.jpeg, args.scale),
+            ('draft', args.jpeg, args.scale),
+            ('full', args.tiff, 1),
+            ('region', args.tiff, 1),
+        ]
+
+        print(f'{"strategy":<10}{"image":<8}{"scale":>7}'
+              f'{"best (ms)":>12}{"mean (ms)":>12}{"peak RSS (MB)":>16}')
+        for strategy, path, scale in cases:
+            best, mean, peak_rss = measure(
+                strategy, path, box, scale, args.repeat)
+            image_type = os.path.splitext(path)[1][1:]
+            print(f'{strategy:<10}{image_type:<8}{scale:>7}'
+                  f'{best * 1000:>12.1f}{mean * 1000:>12.1f}'
+                  f'{peak_rss / 1024:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
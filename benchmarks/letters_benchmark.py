@@ -0,0 +1,85 @@
+"""
+Compare the size and latency of the v1 (`/api/letters`) and v2
+(`/api/v2/letters`) script chart formats.
+
+The chart of every manuscript and letter (or those given) is requested in
+each format, with the response cache disabled, from the configured database
+or -- with --fixture -- from a throwaway test database loaded with a
+fixture:
+
+    $ python benchmarks/letters_benchmark.py
+    $ python benchmarks/letters_benchmark.py \\
+        --fixture scripts/tests/test_fixtures.json --count 5
+"""
+
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scriptchart.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from scripts.letter_endpoint import get_letters, get_letters_v2  # noqa: E402
+from scripts.models import Letter, Manuscript  # noqa: E402
+from scripts.renderers import MessagePackRenderer  # noqa: E402
+
+
+FORMATS = [
+    ('v1 json', get_letters, 'application/json'),
+    ('v2 json', get_letters_v2, 'application/json'),
+]
+if MessagePackRenderer:
+    FORMATS.append(('v2 msgpack', get_letters_v2, 'application/x-msgpack'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--fixture', help='load this fixture into a test db')
+    parser.add_argument('--ms-ids', help='pipe-delimited manuscript ids')
+    parser.add_argument('--letter-ids', help='pipe-delimited letter ids')
+    parser.add_argument('--count', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.fixture:
+        connection.creation.create_test_db(verbosity=0)
+        call_command('loaddata', args.fixture, verbosity=0)
+
+    ms_ids = args.ms_ids or '|'.join(
+        str(_) for _ in Manuscript.objects.values_list('id', flat=True))
+    letter_ids = args.letter_ids or '|'.join(
+        str(_) for _ in Letter.objects.values_list('id', flat=True))
+    url = f'/api/letters?ms_ids={ms_ids}&letter_ids={letter_ids}'
+    url += f'&count={args.count}'
+
+    factory = RequestFactory()
+    print(f'{"format":<12}{"bytes":>10}{"gzipped":>10}'
+          f'{"best (ms)":>12}{"mean (ms)":>12}')
+    with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+        for name, view, accept in FORMATS:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = view(factory.get(url, HTTP_ACCEPT=accept))
+                response.render()
+                timings.append(time.perf_counter() - start)
+            content = response.content
+            print(f'{name:<12}{len(content):>10}'
+                  f'{len(gzip.compress(content)):>10}'
+                  f'{min(timings) * 1000:>12.1f}'
+                  f'{sum(timings) / len(timings) * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
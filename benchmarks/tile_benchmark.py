@@ -0,0 +1,100 @@
+"""
+Compare the latency of reading crops from a page image pyramid (see
+`scripts.pyramid`) against decoding the page image.
+
+Random crop boxes are read from a synthetic page image (unless an existing
+one is given), at full resolution and downscaled:
+
+    $ python benchmarks/tile_benchmark.py
+    $ python benchmarks/tile_benchmark.py --jpeg page.jpg --tile-size 512
+"""
+
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scriptchart.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from PIL import Image  # noqa: E402
+
+from scripts.crops import scale_crop  # noqa: E402
+from scripts.decoding import open_reduced, reduction_for_scale  # noqa: E402
+from scripts.pyramid import PYRAMID_TILE_FORMATS, PyramidStore  # noqa: E402
+
+
+def decode_crop(store, path, page_url, box, scale):
+    reduce = reduction_for_scale(scale)
+    scale_crop(open_reduced(path, reduce), box, reduce, scale).load()
+
+
+def tile_crop(store, path, page_url, box, scale):
+    scale_crop(*store.read_tiles(page_url, box, scale), scale=scale).load()
+
+
+STRATEGIES = {
+    'decode': decode_crop,
+    'tiles': tile_crop,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--jpeg', help='JPEG page image')
+    parser.add_argument('--size', default='4000x6000',
+                        help='size of the generated page image (WxH)')
+    parser.add_argument('--crop-size', default='60x80',
+                        help='size of the crops (WxH)')
+    parser.add_argument('--tile-size', type=int, default=256)
+    parser.add_argument('--tile-format', default='png',
+                        choices=PYRAMID_TILE_FORMATS.keys())
+    parser.add_argument('--scale', type=float, default=0.25,
+                        help='output scale of the downscaled crops')
+    parser.add_argument('--crops', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not args.jpeg:
+            width, height = (int(_) for _ in args.size.split('x'))
+            args.jpeg = os.path.join(tmp_dir, 'page.jpg')
+            Image.effect_noise((width, height), 64).convert('RGB').save(
+                args.jpeg, quality=90)
+
+        page_url = 'file://' + os.path.abspath(args.jpeg)
+        store = PyramidStore(
+            os.path.join(tmp_dir, 'pyramids'), args.tile_size,
+            args.tile_format)
+        start = time.perf_counter()
+        image = Image.open(args.jpeg)
+        store.build(page_url, image)
+        print(f'Built the pyramid in {time.perf_counter() - start:.1f}s')
+
+        crop_width, crop_height = (int(_) for _ in args.crop_size.split('x'))
+        boxes = []
+        for _ in range(args.crops):
+            x = random.randrange(image.width - crop_width)
+            y = random.randrange(image.height - crop_height)
+            boxes.append((x, y, x + crop_width, y + crop_height))
+
+        print(f'{"strategy":<10}{"scale":>7}{"best (ms)":>12}{"mean (ms)":>12}')
+        for scale in (1, args.scale):
+            for strategy, crop in STRATEGIES.items():
+                timings = []
+                for box in boxes:
+                    start = time.perf_counter()
+                    crop(store, args.jpeg, page_url, box, scale)
+                    timings.append(time.perf_counter() - start)
+                print(f'{strategy:<10}{scale:>7}'
+                      f'{min(timings) * 1000:>12.1f}'
+                      f'{sum(timings) / len(timings) * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
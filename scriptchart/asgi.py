@@ -0,0 +1,52 @@
+"""
+ASGI config for scriptchart project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be run by an ASGI server, e.g.:
+
+    uvicorn scriptchart.asgi:application
+
+Crop requests (/api/crop) are served asynchronously by
+`scripts.async_views.letter_image`; everything else is passed on to the WSGI
+application (see `scriptchart.wsgi`), which is run in a thread pool.
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scriptchart.settings')
+
+from scriptchart.wsgi import application as wsgi_application  # noqa: E402
+from scripts.async_views import letter_image  # noqa: E402
+
+
+ASYNC_ROUTES = {
+    '/api/crop': letter_image,
+}
+
+
+class ScriptchartASGIApplication:
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = WsgiToAsgi(wsgi_application)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] in ASYNC_ROUTES:
+            await ASYNC_ROUTES[scope['path']](scope, receive, send)
+        else:
+            await self.wsgi_application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = ScriptchartASGIApplication(wsgi_application)
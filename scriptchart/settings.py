@@ -128,6 +128,19 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.dummy.DummyCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+TEST_RUNNER = 'scriptchart.test_runner.TestRunner'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -156,6 +169,57 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 STATIC_ROOT = os.getenv('STATIC_ROOT', 'static')
 STATIC_URL = os.getenv('STATIC_URL', '/static/')
 IMAGES_ROOT = os.getenv('IMAGES_ROOT', None)
+IMAGE_FETCH_CONNECT_TIMEOUT = float(
+    os.getenv('IMAGE_FETCH_CONNECT_TIMEOUT', 5))
+IMAGE_FETCH_READ_TIMEOUT = float(os.getenv('IMAGE_FETCH_READ_TIMEOUT', 30))
+IMAGE_FETCH_RETRIES = int(os.getenv('IMAGE_FETCH_RETRIES', 2))
+IMAGE_FETCH_BACKOFF_FACTOR = 0.5
+IMAGE_FETCH_POOL_SIZE = int(os.getenv('IMAGE_FETCH_POOL_SIZE', 16))
+IMAGE_FETCH_MAX_PER_HOST = int(os.getenv('IMAGE_FETCH_MAX_PER_HOST', 8))
+IMAGE_FETCH_FAILURE_THRESHOLD = 5
+IMAGE_FETCH_RESET_TIMEOUT = 30
+ASYNC_CROP_IO_WORKERS = int(os.getenv('ASYNC_CROP_IO_WORKERS', 64))
+ASYNC_CROP_CPU_WORKERS = int(
+    os.getenv('ASYNC_CROP_CPU_WORKERS', os.cpu_count() or 1))
+PAGE_FETCH_SPOOL_ROOT = os.getenv(
+    'PAGE_FETCH_SPOOL_ROOT', os.path.join(BASE_DIR, 'tmp', 'page_spool'))
+PAGE_FETCH_SPOOL_TTL = int(os.getenv('PAGE_FETCH_SPOOL_TTL', 60))
+PAGE_IMAGE_CACHE_BYTES = int(
+    os.getenv('PAGE_IMAGE_CACHE_BYTES', 256 * 1024 * 1024))
+CROP_CACHE_ROOT = os.getenv(
+    'CROP_CACHE_ROOT', os.path.join(BASE_DIR, 'tmp', 'crop_cache'))
+CROP_CACHE_MAX_BYTES = int(
+    os.getenv('CROP_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+CROP_CACHE_CONTROL_MAX_AGE = int(
+    os.getenv('CROP_CACHE_CONTROL_MAX_AGE', 30 * 24 * 60 * 60))
+CROP_BATCH_MAX_SIZE = int(os.getenv('CROP_BATCH_MAX_SIZE', 1000))
+LETTER_ZIP_FETCH_WORKERS = int(os.getenv('LETTER_ZIP_FETCH_WORKERS', 4))
+PRERENDERED_CROPS_ROOT = os.getenv(
+    'PRERENDERED_CROPS_ROOT', os.path.join(BASE_DIR, 'tmp', 'crops'))
+PRERENDERED_CROPS_URL = os.getenv('PRERENDERED_CROPS_URL', '/crops/')
+PYRAMID_ROOT = os.getenv(
+    'PYRAMID_ROOT', os.path.join(BASE_DIR, 'tmp', 'pyramids'))
+PYRAMID_TILE_SIZE = int(os.getenv('PYRAMID_TILE_SIZE', 256))
+PYRAMID_TILE_FORMAT = os.getenv('PYRAMID_TILE_FORMAT', 'png')
+BINARIZED_ROOT = os.getenv(
+    'BINARIZED_ROOT', os.path.join(BASE_DIR, 'tmp', 'binarized'))
+BINARIZED_URL = os.getenv('BINARIZED_URL', None)
+STREAMING_THRESHOLD = int(os.getenv('STREAMING_THRESHOLD', 1000))
+CHART_SNAPSHOTS_ROOT = os.getenv(
+    'CHART_SNAPSHOTS_ROOT', os.path.join(BASE_DIR, 'tmp', 'snapshots'))
+CHART_SNAPSHOTS_URL = os.getenv('CHART_SNAPSHOTS_URL', '/snapshots/')
+CHART_SNAPSHOTS_DELAY = int(os.getenv('CHART_SNAPSHOTS_DELAY', 30))
+THUMBNAIL_SIZE = 100
+THUMBNAIL_CACHE_ROOT = os.getenv(
+    'THUMBNAIL_CACHE_ROOT', os.path.join(BASE_DIR, 'tmp', 'thumbnail_cache'))
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.getenv('THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+ATLAS_CACHE_ROOT = os.getenv(
+    'ATLAS_CACHE_ROOT', os.path.join(BASE_DIR, 'tmp', 'atlas_cache'))
+ATLAS_CACHE_MAX_BYTES = int(
+    os.getenv('ATLAS_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+ATLAS_CACHE_CONTROL_MAX_AGE = 365 * 24 * 60 * 60
+ATLAS_MAX_WIDTH = 2048
 
 ADMINS = [tuple(_.split(',')) for _ in os.getenv('ADMINS', None).split(';')] \
             if os.getenv('ADMINS', None) else []
@@ -0,0 +1,48 @@
+"""
+Test runner for the scriptchart project.
+
+Runs the tests with every directory the project writes to -- the page fetch
+spool (see `scripts.single_flight`), the crop, thumbnail and atlas caches,
+pyramids, binarized and prerendered images, and chart snapshots -- in a
+temporary directory, so nothing tests write that they don't set up
+themselves ends up in the project's tmp directory.  The snapshot directory
+isn't created, so snapshots are only rebuilt by tests that build them; any
+rebuild still pending when the tests end is cancelled.
+
+The cache is a local-memory one, whatever settings.CACHES says, so the tests
+don't share (or clear) a deployment's cache.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from scripts.snapshots import snapshot_rebuilds
+
+
+TEMPORARY_ROOTS = (
+    'PAGE_FETCH_SPOOL_ROOT', 'CROP_CACHE_ROOT', 'THUMBNAIL_CACHE_ROOT',
+    'ATLAS_CACHE_ROOT', 'PYRAMID_ROOT', 'BINARIZED_ROOT',
+    'PRERENDERED_CROPS_ROOT', 'CHART_SNAPSHOTS_ROOT')
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.temp_root = tempfile.mkdtemp(prefix='scriptchart_tests')
+        self.settings_override = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            **dict((name, os.path.join(self.temp_root, name.lower()))
+                   for name in TEMPORARY_ROOTS))
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        snapshot_rebuilds.cancel()
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -2,15 +2,17 @@
 from django.conf import settings
 from django.conf.urls import url
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 # drf
 from rest_framework.urlpatterns import format_suffix_patterns
 from rest_framework.documentation import include_docs_urls
 
 # dash
+import scripts.iiif
 import scripts.views
 import scripts.letter_endpoint
+import scripts.thumbnails
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -22,11 +24,39 @@ urlpatterns = [
     path('api/coordinates', scripts.views.CoordinatesList.as_view()),
     path('api/coordinates/<int:pk>', scripts.views.CoordinatesDetail.as_view()),
     path('api/crop', scripts.views.LetterImage.as_view()),
-    path('api/letters', scripts.letter_endpoint.get_letters)
+    path('api/crops', scripts.views.LetterImageBatch.as_view()),
+    path('api/letters', scripts.letter_endpoint.get_letters),
+    path('api/letters/atlas', scripts.letter_endpoint.get_letters_atlas),
+    path('api/v2/letters', scripts.letter_endpoint.get_letters_v2),
+    path('api/atlases/<slug:digest>.png',
+         scripts.letter_endpoint.get_atlas_image),
+    path('api/pyramids/<slug:name>.dzi', scripts.views.get_pyramid_descriptor),
+    path('api/pyramids/<slug:name>_files/<int:level>/'
+         '<int:column>_<int:row>.<slug:tile_format>',
+         scripts.views.get_pyramid_tile),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
 
+# admin thumbnails are always JPEGs
+urlpatterns += [
+    path('api/thumbnails/coordinates/<int:pk>',
+         scripts.thumbnails.coordinates_thumbnail,
+         name='coordinates-thumbnail'),
+    path('api/thumbnails/images', scripts.thumbnails.image_thumbnail,
+         name='image-thumbnail'),
+]
+
+# IIIF Image API; its URLs end in their own format extensions
+iiif_image = r'^iiif/(?P<kind>pages|coordinates)/(?P<pk>\d+)'
+urlpatterns += [
+    re_path(iiif_image + r'$', scripts.iiif.iiif_base),
+    re_path(iiif_image + r'/info\.json$', scripts.iiif.iiif_info),
+    re_path(iiif_image + r'/(?P<region>[^/]+)/(?P<size>[^/]+)/'
+            r'(?P<rotation>[^/]+)/(?P<quality>[^/.]+)\.(?P<extension>[^/.]+)$',
+            scripts.iiif.iiif_image),
+]
+
 if settings.DEBUG:
     import debug_toolbar
     urlpatterns = [
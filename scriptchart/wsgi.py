@@ -8,9 +8,45 @@ https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
 """
 
 import os
+from urllib.parse import urlsplit
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
+from whitenoise import WhiteNoise
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scriptchart.settings')
 
 application = get_wsgi_application()
+
+# serve crops rendered by `manage.py prerender_crops`, which rewrites and
+#  prunes them while the application runs, so whitenoise looks files up on
+#  each request
+if os.path.isdir(settings.PRERENDERED_CROPS_ROOT):
+    application = WhiteNoise(
+        application,
+        root=settings.PRERENDERED_CROPS_ROOT,
+        prefix=settings.PRERENDERED_CROPS_URL,
+        autorefresh=True,
+        max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+
+# serve examples binarized by `manage.py binarize_coordinates`, which adds
+#  images while the application runs, so whitenoise looks files up on each
+#  request
+if settings.BINARIZED_URL and os.path.isdir(settings.BINARIZED_ROOT):
+    application = WhiteNoise(
+        application,
+        root=settings.BINARIZED_ROOT,
+        prefix=urlsplit(settings.BINARIZED_URL).path,
+        autorefresh=True,
+        max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+
+# serve the chart snapshots written by `manage.py build_chart_snapshots`,
+#  and their precompressed variants; they're rewritten in place as the data
+#  changes, so whitenoise re-checks the (few) files on each request
+if os.path.isdir(settings.CHART_SNAPSHOTS_ROOT):
+    application = WhiteNoise(
+        application,
+        root=settings.CHART_SNAPSHOTS_ROOT,
+        prefix=settings.CHART_SNAPSHOTS_URL,
+        autorefresh=True,
+        max_age=0)
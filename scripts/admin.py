@@ -3,7 +3,7 @@ from pytz import datetime
 from django.contrib import admin, messages
 from django.contrib.admin.widgets import AdminURLFieldWidget
 from django.db import models
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.template.response import TemplateResponse
 from django.urls import reverse, re_path as url
 from django.utils.html import format_html
@@ -13,12 +13,13 @@ from rangefilter.filter import DateRangeFilter
 
 from .forms import PageCoordinatesForm
 from .models import Coordinates, Letter, Manuscript, Page
-from .utils import create_letter_zip
+from .thumbnails import coordinates_thumbnail_url, image_thumbnail_url
+from .utils import stream_letter_zip
 
 
 def page_image(page):
     return mark_safe(f"""
-    <img src="{page.url}"
+    <img src="{image_thumbnail_url(page.url)}"
          loading="lazy" width=100 style="border: 1px solid lightgrey;">
     """)
 
@@ -27,49 +28,11 @@ page_image.safe = True
 
 
 def coordinates_image(coordinates, context_pixels=0):
-    max_pixels = 100 + 2 * context_pixels
-    min_pixels = 5
-    if coordinates.width > max_pixels:
-        ratio = max_pixels / coordinates.width
-    else:
-        ratio = 1
+    if coordinates.id is None:
+        return ''
     return mark_safe(f"""
-    <style>
-    .coords-img-container-{coordinates.id} {{
-        position: relative;
-        width: {coordinates.width + 2 * context_pixels}px;
-        height: {coordinates.height + 2 * context_pixels}px;
-        border: 1px solid lightgrey;
-        overflow: hidden;
-        max-width: {max_pixels}px;
-        max-height: {max_pixels}px;
-        min-width: {min_pixels}px;
-        min-height: {min_pixels}px;
-    }}
-    .coords-img-container-{coordinates.id}:before {{
-        border: {context_pixels}px solid #000;
-        content: "";
-        position: absolute;
-        top: 0;
-        bottom: 0;
-        left: 0;
-        right: 0;
-        z-index: 100;
-        opacity: 0.5;
-    }}
-    </style>
-    <div class="coords-img-container-{coordinates.id}"
-        style="{
-            'transform: rotate(180deg);'
-            if coordinates.orientation == 2 else ''}">
-        <img src="{coordinates.page.url}" style="
-            position: absolute;
-            top: -{ratio * coordinates.top - context_pixels}px;
-            left: -{ratio * coordinates.left - context_pixels}px;
-            transform: scale({ratio});
-            transform-origin: 0 0;
-        ">
-    </div>
+    <img src="{coordinates_thumbnail_url(coordinates, context_pixels)}"
+         loading="lazy" style="border: 1px solid lightgrey;">
     """)
 
 
@@ -83,7 +46,7 @@ class AdminURLImageWidget(AdminURLFieldWidget):
             style = "border: 1px solid lightgrey; max-width: 100px;"
             output.append(
                 f'<a href="{value}" target="_blank">'
-                f'<img src="{value}" loading="lazy" '
+                f'<img src="{image_thumbnail_url(value)}" loading="lazy" '
                 f'alt="{value}" style="{style}"/></a>')
         output.append(super().render(name, value, attrs, renderer))
         return mark_safe(u''.join(output))
@@ -114,12 +77,10 @@ class CoordinatesInline(admin.TabularInline):
 
 class DownloadCoordinatesMixin:
     def download_as_zip(self, request, queryset):
-        zip_file = create_letter_zip(
-            queryset.order_by('letter__letter').distinct()
+        response = StreamingHttpResponse(
+            stream_letter_zip(queryset.order_by('letter__letter').distinct()),
+            content_type="application/zip"
         )
-        response = HttpResponse(zip_file.getvalue(),
-                                content_type="application/zip")
-        response['Content-Length'] = len(response.content)
         response['Content-Disposition'] = (
             f'attachment; filename="Coordinates@{datetime.datetime.now()}.zip"'
         )
@@ -131,9 +92,11 @@ class DownloadCoordinatesMixin:
 class CoordinatesAdmin(admin.ModelAdmin, DownloadCoordinatesMixin):
 
     def trimmed_img_tag(self, obj):
-        if obj.binary_url is None:
+        if not obj.binary_url:
             return '-'
-        return format_html(f'<img src="{obj.binary_url}" />')
+        return format_html(
+            '<img src="{}" loading="lazy" />',
+            image_thumbnail_url(obj.binary_url))
 
     trimmed_img_tag.short_description = 'Trimmed Image'
 
@@ -238,12 +201,11 @@ class PageAdmin(admin.ModelAdmin):
     def coordinates_download(self, request, page_id, *args, **kwargs):
 
         page = Page.objects.get(id=page_id)
-        zip_file = create_letter_zip(
-            page.coordinates.order_by('letter__letter').distinct()
+        response = StreamingHttpResponse(
+            stream_letter_zip(
+                page.coordinates.order_by('letter__letter').distinct()),
+            content_type="application/zip"
         )
-        response = HttpResponse(zip_file.getvalue(),
-                                content_type="application/zip")
-        response['Content-Length'] = len(response.content)
         response['Content-Disposition'] = f'attachment; filename="{page}.zip"'
         return response
 
@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ScriptsConfig(AppConfig):
     name = 'scripts'
+
+    def ready(self):
+        from scripts.models import Coordinates, Letter, Manuscript, Page
+        from scripts.priority_field import priorities_shifted
+        from scripts.response_cache import bump_generation
+        from scripts.snapshots import schedule_chart_snapshots
+
+        def bump(sender, **kwargs):
+            bump_generation(sender)
+            schedule_chart_snapshots()
+
+        # invalidate cached API responses and chart snapshots
+        for model in (Coordinates, Letter, Manuscript, Page):
+            post_save.connect(bump, sender=model, weak=False)
+            post_delete.connect(bump, sender=model, weak=False)
+        priorities_shifted.connect(bump, sender=Coordinates, weak=False)
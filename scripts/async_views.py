@@ -0,0 +1,188 @@
+"""
+ASGI version of the crop endpoint (`scripts.views.LetterImage`).
+
+Django (2.2) only serves requests synchronously, so a worker is tied up for
+as long as a crop takes, most of which may be spent waiting on the upstream
+image server.  `letter_image` is a plain ASGI application, routed to by
+`scriptchart.asgi`, which serves the same requests from the event loop:
+
+* crop cache lookups and upstream fetches (through the shared
+  `scripts.image_client.ImageClient`, with its timeouts, retries and circuit
+  breaking, and coalesced by `scripts.single_flight`) run on an I/O
+  executor of `settings.ASYNC_CROP_IO_WORKERS` threads
+* decoding, cropping and encoding run on a CPU executor of
+  `settings.ASYNC_CROP_CPU_WORKERS` threads (PIL releases the GIL while
+  decoding, resizing and encoding), so that the decoded page image cache is
+  shared with the rest of the process
+
+so a request waiting on its page image holds no thread of its own, and a
+single process can keep many crop requests in flight.
+
+As the requests bypass Django's middleware, the CORS headers (and preflight
+responses) of `corsheaders.middleware.CorsMiddleware` are applied here.
+
+"""
+
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.http import (
+    HttpRequest, HttpResponse, HttpResponseNotModified, QueryDict)
+
+from corsheaders.middleware import CorsMiddleware
+
+from scripts.crop_cache import get_crop_cache
+from scripts.crops import crop_options_key, encode_crop, get_crop, scale_crop
+from scripts.decoding import open_reduced, reduction_for_scale
+from scripts.image_cache import (
+    local_image_path, page_image_cache, page_image_key)
+from scripts.image_client import ImageFetchError
+from scripts.pyramid import get_pyramid_store
+from scripts.single_flight import fetch_page_content
+from scripts.views import (
+    error_response, fetch_error_response, get_crop_options, is_not_modified,
+    patch_crop_response)
+
+
+cors_middleware = CorsMiddleware()
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name):
+    """ Return the 'io' or 'cpu' executor. """
+    with _executors_lock:
+        if name not in _executors:
+            workers = {
+                'io': settings.ASYNC_CROP_IO_WORKERS,
+                'cpu': settings.ASYNC_CROP_CPU_WORKERS,
+            }[name]
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f'crop-{name}')
+        return _executors[name]
+
+
+async def run_in(name, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(name), func, *args)
+
+
+def asgi_request(scope):
+    """ Return an `HttpRequest` with the query params and headers of an ASGI
+        HTTP scope.
+    """
+    request = HttpRequest()
+    request.method = scope['method']
+    request.path = request.path_info = scope['path']
+    request.GET = QueryDict(scope.get('query_string', b'').decode('latin-1'))
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        request.META[f'HTTP_{name}'] = value.decode('latin-1')
+    return request
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.encode('latin-1'), str(value).encode('latin-1'))
+                    for name, value in response.items()],
+    })
+    await send({'type': 'http.response.body', 'body': response.content})
+
+
+def is_page_available(page_url, reduce):
+    """ Whether the page can be cropped without going to the network: it's
+        a local image, has a pyramid or has already been decoded.
+    """
+    img_path = local_image_path(page_url)
+    pyramid_store = get_pyramid_store()
+    return ((img_path is not None and img_path.exists()) or
+            bool(pyramid_store and pyramid_store.exists(page_url)) or
+            page_image_key(page_url, reduce) in page_image_cache)
+
+
+def crop_fetched_page(content, page_url, x, y, w, h, options, key):
+    """ Return the encoded crop of the fetched page image content, caching
+        the decoded page image and the crop.
+    """
+    reduce = reduction_for_scale(options.scale)
+    image = open_reduced(BytesIO(content), reduce)
+    image.load()
+    page_image_cache.put(page_image_key(page_url, reduce), image)
+
+    crop = encode_crop(
+        scale_crop(image, (x, y, x + w, y + h), reduce, options.scale),
+        options)
+    crop_cache = get_crop_cache()
+    if crop_cache:
+        crop_cache.put(key, crop)
+    return crop
+
+
+async def get_crop_async(page_url, x, y, w, h, options, key):
+    crop_cache = get_crop_cache()
+    if crop_cache:
+        content = await run_in('io', crop_cache.get, key)
+        if content is not None:
+            return content
+
+    if is_page_available(page_url, reduction_for_scale(options.scale)):
+        return await run_in(
+            'cpu', get_crop, page_url, x, y, w, h, options, key)
+
+    page_content = await run_in('io', fetch_page_content, page_url)
+    return await run_in(
+        'cpu', crop_fetched_page, page_content, page_url, x, y, w, h,
+        options, key)
+
+
+async def get_crop_response(request):
+    """ Return the response to a crop request (see `LetterImage`). """
+    page_url = request.GET.get('page_url')
+    try:
+        x = int(request.GET.get('x', 0))
+        y = int(request.GET.get('y', 0))
+        w = int(request.GET.get('w', 0))
+        h = int(request.GET.get('h', 0))
+        options, negotiated = get_crop_options(request, w, h)
+    except ValueError as e:
+        return error_response(f'Invalid crop options: {e}', 400)
+
+    key = crop_options_key(page_url, x, y, w, h, options)
+    etag = f'"{key}"'
+
+    if is_not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            content = await get_crop_async(page_url, x, y, w, h, options, key)
+        except ImageFetchError as e:
+            return fetch_error_response(e)
+        response = HttpResponse(content, content_type=options.content_type)
+        response['Content-Length'] = len(content)
+
+    return patch_crop_response(response, etag, negotiated)
+
+
+async def letter_image(scope, receive, send):
+    """ ASGI application serving GET /api/crop. """
+    request = asgi_request(scope)
+    # answers CORS preflight requests
+    response = cors_middleware.process_request(request)
+    if response is None:
+        if request.method not in ('GET', 'HEAD'):
+            response = error_response(
+                f'Method "{request.method}" not allowed.', 405)
+            response['Allow'] = 'GET, HEAD'
+        else:
+            response = await get_crop_response(request)
+            if request.method == 'HEAD':
+                response.content = b''
+    response = cors_middleware.process_response(request, response)
+    await send_response(send, response)
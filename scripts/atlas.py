@@ -0,0 +1,165 @@
+"""
+Pre-composed sprite atlases for the script chart.
+
+For a given set of manuscripts, letters and count (see
+`scripts.letter_endpoint.get_letters`), every example crop is composed into a
+single atlas image, along with an offset map that locates each example in it.
+
+Atlases are generated lazily and cached on disk in `settings.ATLAS_CACHE_ROOT`
+under a digest of everything that went into them: the request and, for each
+contributing example, its id, priority, bounding box, modification date and
+page URL.  Any change to those rows therefore produces a new digest (and a new
+atlas); stale atlases are simply never requested again and are evicted once
+the cache exceeds `settings.ATLAS_CACHE_MAX_BYTES`.
+
+"""
+
+
+import hashlib
+import json
+from io import BytesIO
+
+from django.conf import settings
+
+from PIL import Image
+
+from scripts.crop_cache import DiskCropCache
+from scripts.image_cache import load_page_image
+from scripts.models import Coordinates
+
+
+ATLAS_FIELDS = ('id', 'manuscript_id', 'letter_id', 'priority',
+                'left', 'top', 'width', 'height', 'modified_date', 'page__url')
+
+
+_atlas_cache = None
+
+
+def get_atlas_cache():
+    global _atlas_cache
+
+    if (_atlas_cache is None or
+            str(_atlas_cache.root) != str(settings.ATLAS_CACHE_ROOT) or
+            _atlas_cache.max_bytes != settings.ATLAS_CACHE_MAX_BYTES):
+        _atlas_cache = DiskCropCache(
+            settings.ATLAS_CACHE_ROOT, settings.ATLAS_CACHE_MAX_BYTES)
+    return _atlas_cache
+
+
+def get_examples(ms_ids, letter_ids, count):
+    """ Return the chart examples (as dicts of `ATLAS_FIELDS`) in a stable
+        order.
+    """
+    return list(
+        Coordinates.objects
+        .filter(manuscript_id__in=ms_ids, letter_id__in=letter_ids,
+                priority__lte=count)
+        .order_by('manuscript_id', 'letter_id', 'priority', 'id')
+        .values(*ATLAS_FIELDS)
+    )
+
+
+def atlas_digest(ms_ids, letter_ids, count, examples):
+    spec = {
+        'request': [ms_ids, letter_ids, count],
+        'examples': [[example[field] for field in ATLAS_FIELDS]
+                     for example in examples],
+        'max_width': settings.ATLAS_MAX_WIDTH,
+    }
+    serialized = json.dumps(spec, default=str, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def layout(examples, max_width):
+    """ Shelf-pack the examples into rows no wider than max_width (unless a
+        single example is wider); return a list of (x, y) positions and the
+        overall atlas size.
+    """
+    positions = []
+    x = y = row_height = atlas_width = 0
+    for example in examples:
+        if x and x + example['width'] > max_width:
+            x, y, row_height = 0, y + row_height, 0
+        positions.append((x, y))
+        x += example['width']
+        row_height = max(row_height, example['height'])
+        atlas_width = max(atlas_width, x)
+    return positions, (atlas_width, y + row_height)
+
+
+def compose_atlas(examples, positions, size):
+    """ Return the encoded atlas image; each page image is loaded once. """
+    atlas = Image.new('RGB', size, 'white')
+
+    examples_by_page = {}
+    for example, position in zip(examples, positions):
+        examples_by_page.setdefault(example['page__url'], []).append(
+            (example, position))
+
+    for page_url, page_examples in examples_by_page.items():
+        image = load_page_image(page_url)
+        for example, position in page_examples:
+            x, y = example['left'], example['top']
+            w, h = example['width'], example['height']
+            atlas.paste(image.crop([x, y, x + w, y + h]), position)
+
+    output = BytesIO()
+    atlas.save(output, 'PNG')
+    return output.getvalue()
+
+
+def get_atlas(ms_ids, letter_ids, count):
+    """ Return the offset map of the atlas for the given chart, generating
+        (and caching) the atlas image if required.
+
+        The map has the shape:
+          {
+            "digest": <atlas digest>,
+            "width": <atlas width>,
+            "height": <atlas height>,
+            "mss": {
+              "<ms_id>": {
+                "<letter_id>": [
+                  {"id": <coords id>, "x": <x>, "y": <y>,
+                   "width": <width>, "height": <height>},
+                  ...
+                ],
+                ...
+              },
+              ...
+            }
+          }
+    """
+    examples = get_examples(ms_ids, letter_ids, count)
+    digest = atlas_digest(ms_ids, letter_ids, count, examples)
+    atlas_cache = get_atlas_cache()
+
+    offset_map = atlas_cache.get(f'{digest}.json')
+    if offset_map is not None and (
+            not examples or atlas_cache.path(f'{digest}.png').exists()):
+        return json.loads(offset_map)
+
+    positions, (width, height) = layout(examples, settings.ATLAS_MAX_WIDTH)
+
+    mss = dict(
+        (int(ms_id), dict((int(letter_id), []) for letter_id in letter_ids))
+        for ms_id in ms_ids
+    )
+    for example, (x, y) in zip(examples, positions):
+        mss[example['manuscript_id']][example['letter_id']].append({
+            'id': example['id'],
+            'x': x,
+            'y': y,
+            'width': example['width'],
+            'height': example['height'],
+        })
+    offset_map = {'digest': digest, 'width': width, 'height': height,
+                  'mss': mss}
+
+    if examples:
+        atlas_cache.put(
+            f'{digest}.png', compose_atlas(examples, positions, (width, height)))
+    atlas_cache.put(f'{digest}.json', json.dumps(offset_map).encode('utf-8'))
+
+    # round-trip so that cached and fresh maps have the same (string) keys
+    return json.loads(json.dumps(offset_map))
@@ -0,0 +1,173 @@
+"""
+Binarization of letter examples, for `Coordinates.binary_url`.
+
+Each crop is converted to grayscale and thresholded into ink (black) and
+background (white), all with vectorized NumPy operations:
+
+* Otsu's method picks the single threshold that best separates the crop's
+  histogram into two classes
+* Sauvola's method thresholds each pixel against the mean and standard
+  deviation of a window around it (computed from integral images), which
+  copes better with stained or unevenly lit parchment
+
+The result can then be despeckled (isolated ink pixels are removed) and
+trimmed to the bounding box of the ink.  Crops are turned the right way up
+if their orientation requires it.
+
+`binarize_page` processes all the examples on a page from a single decode of
+the page image; see `manage.py binarize_coordinates`.
+
+"""
+
+
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from scripts.image_cache import load_page_image
+
+
+BINARIZATION_METHODS = ('otsu', 'sauvola')
+
+
+class BinarizationOptions(namedtuple(
+        'BinarizationOptions', 'method window k despeckle trim')):
+    """ Options for `binarize`:
+
+        method:    one of `BINARIZATION_METHODS`
+        window:    side of the Sauvola window, in pixels (odd)
+        k:         Sauvola's k parameter; higher values make less ink
+        despeckle: whether to remove isolated ink pixels
+        trim:      whether to trim the result to the bounding box of the ink
+    """
+
+    def __new__(cls, method='sauvola', window=25, k=0.2, despeckle=True,
+                trim=True):
+        if method not in BINARIZATION_METHODS:
+            raise ValueError(f'Unsupported method: {method}')
+        if window < 3 or window % 2 == 0:
+            raise ValueError('Window must be an odd number, at least 3')
+        return super().__new__(cls, method, window, k, despeckle, trim)
+
+
+DEFAULT_BINARIZATION_OPTIONS = BinarizationOptions()
+
+
+def otsu_threshold(gray):
+    """ Return the threshold that maximizes the between-class variance of
+        the histogram of gray (a uint8 array).
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+
+    weight_background = np.cumsum(histogram)
+    weight_foreground = weight_background[-1] - weight_background
+    sum_background = np.cumsum(histogram * levels)
+    sum_foreground = sum_background[-1] - sum_background
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_background = sum_background / weight_background
+        mean_foreground = sum_foreground / weight_foreground
+        variance = (weight_background * weight_foreground *
+                    (mean_background - mean_foreground) ** 2)
+    return int(np.argmax(np.nan_to_num(variance)))
+
+
+def window_sums(values, window):
+    """ Return the sums of values over a window centred on each element,
+        computed from an integral image of values padded by reflection.
+    """
+    half = window // 2
+    padded = np.pad(values, half, mode='symmetric')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+    height, width = values.shape
+    return (integral[window:window + height, window:window + width] -
+            integral[:height, window:window + width] -
+            integral[window:window + height, :width] +
+            integral[:height, :width])
+
+
+def sauvola_threshold(gray, window=25, k=0.2, dynamic_range=128):
+    """ Return the per-pixel Sauvola thresholds of gray. """
+    values = gray.astype(np.float64)
+    count = window * window
+    mean = window_sums(values, window) / count
+    variance = window_sums(values ** 2, window) / count - mean ** 2
+    deviation = np.sqrt(np.maximum(variance, 0))
+    return mean * (1 + k * (deviation / dynamic_range - 1))
+
+
+def despeckle(ink):
+    """ Return the ink mask without the ink pixels that have no ink among
+        their 8 neighbours.
+    """
+    padded = np.pad(ink, 1).astype(np.uint8)
+    height, width = ink.shape
+    neighbours = sum(
+        padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+    return ink & (neighbours > 0)
+
+
+def ink_bounds(ink):
+    """ Return the (left, upper, right, lower) bounding box of the ink, or
+        None if there's none.
+    """
+    rows = np.flatnonzero(ink.any(axis=1))
+    columns = np.flatnonzero(ink.any(axis=0))
+    if not len(rows):
+        return None
+    return (int(columns[0]), int(rows[0]),
+            int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+
+def binarize(image, options=DEFAULT_BINARIZATION_OPTIONS):
+    """ Return a bilevel ('1' mode) image of the ink in image. """
+    gray = np.asarray(image.convert('L'))
+    if options.method == 'otsu':
+        ink = gray <= otsu_threshold(gray)
+    else:
+        ink = gray <= sauvola_threshold(gray, options.window, options.k)
+
+    if options.despeckle:
+        ink = despeckle(ink)
+    if options.trim:
+        bounds = ink_bounds(ink)
+        if bounds is not None:
+            left, upper, right, lower = bounds
+            ink = ink[upper:lower, left:right]
+
+    return Image.fromarray(~ink)
+
+
+def encode_binarized(image):
+    output = BytesIO()
+    image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def binarized_filename(coords_id, content):
+    """ Name binarized images by content, so that their URLs change (and
+        caches never serve a stale image) when they're regenerated.
+    """
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f'{coords_id}-{digest}.png'
+
+
+def binarize_page(page_url, coordinates, options=DEFAULT_BINARIZATION_OPTIONS):
+    """ Binarize the examples on the page at page_url, decoding the page
+        image once.  coordinates is a list of (id, left, top, width, height,
+        rotated) tuples; return a dict of id: encoded PNG.
+    """
+    page = load_page_image(page_url)
+    results = {}
+    for coords_id, left, top, width, height, rotated in coordinates:
+        crop = page.crop((left, top, left + width, top + height))
+        if rotated:
+            crop = crop.transpose(Image.ROTATE_180)
+        results[coords_id] = encode_binarized(binarize(crop, options))
+    return results
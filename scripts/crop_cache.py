@@ -0,0 +1,116 @@
+"""
+Persistent on-disk cache of rendered letter crops.
+
+Rendered crops are stored under `settings.CROP_CACHE_ROOT`, content-addressed
+by a hash of everything that determines their bytes (page URL, bounding box
+and output options).  The same hash doubles as the crop's (strong) ETag, so a
+conditional request can be answered without looking at the disk at all.
+
+The cache is capped at `settings.CROP_CACHE_MAX_BYTES`; reading an entry
+refreshes its modification time, and when the cap is exceeded the least
+recently used entries are removed until the cache is back to 90% of the cap.
+
+"""
+
+
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from django.conf import settings
+
+from scripts.files import write_file
+
+
+def crop_cache_key(page_url, x, y, w, h, **options):
+    """ Return a stable hex digest identifying a rendered crop. """
+    spec = {'page_url': page_url, 'box': [x, y, w, h], 'options': options}
+    serialized = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class DiskCropCache:
+
+    def __init__(self, root, max_bytes):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self._approx_bytes = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return content
+
+    def put(self, key, content):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # readers never see partial crops
+        write_file(path, content)
+
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self.size()
+            else:
+                self._approx_bytes += len(content)
+            if self._approx_bytes > self.max_bytes:
+                self._approx_bytes = self.evict(int(self.max_bytes * 0.9))
+
+    def entries(self):
+        for path in self.root.glob('??/*'):
+            if path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_mtime, stat.st_size
+
+    def size(self):
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self, target_bytes):
+        """ Remove least recently used entries until no more than
+            target_bytes remain; return the remaining size.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= target_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_crop_cache = None
+
+
+def get_crop_cache():
+    """ Return the configured crop cache, or None if it's disabled. """
+    global _crop_cache
+
+    root = settings.CROP_CACHE_ROOT
+    if not root:
+        return None
+    if (_crop_cache is None or
+            _crop_cache.root != pathlib.Path(root) or
+            _crop_cache.max_bytes != settings.CROP_CACHE_MAX_BYTES):
+        _crop_cache = DiskCropCache(root, settings.CROP_CACHE_MAX_BYTES)
+    return _crop_cache
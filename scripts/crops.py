@@ -0,0 +1,260 @@
+"""
+Rendering of letter crops from manuscript page images.
+"""
+
+
+import json
+import struct
+from collections import OrderedDict, namedtuple
+from io import BytesIO
+
+from PIL import Image
+
+from scripts.crop_cache import crop_cache_key, get_crop_cache
+from scripts.decoding import decode_region, reduced_box, reduction_for_scale
+from scripts.image_cache import (
+    load_page_image, local_image_path, page_image_cache, page_image_key)
+from scripts.pyramid import get_pyramid_store
+
+
+CROP_BATCH_CONTENT_TYPE = 'application/x-scriptchart-crops'
+
+# output formats, in order of preference: (PIL format, content type)
+CROP_FORMATS = OrderedDict([
+    ('webp', ('WEBP', 'image/webp')),
+    ('png', ('PNG', 'image/png')),
+    ('jpeg', ('JPEG', 'image/jpeg')),
+])
+CROP_MODES = ('color', 'gray', 'bitonal')
+
+
+class CropOptions(namedtuple('CropOptions', 'format quality scale mode')):
+    """ Output options for a crop:
+
+        format:  one of `CROP_FORMATS`
+        quality: 1-100, for lossy formats (None for PNG)
+        scale:   0 < scale <= 1
+        mode:    one of `CROP_MODES`; bitonal crops are thresholded to 1 bit
+                 per pixel (8 for JPEG)
+    """
+
+    def __new__(cls, format='png', quality=85, scale=1.0, mode='color'):
+        if format not in CROP_FORMATS:
+            raise ValueError(f'Unsupported format: {format}')
+        if format == 'png':
+            quality = None
+        elif not 1 <= quality <= 100:
+            raise ValueError('Quality must be between 1 and 100')
+        if not 0 < scale <= 1:
+            raise ValueError('Scale must be greater than 0 and at most 1')
+        if mode not in CROP_MODES:
+            raise ValueError(f'Unsupported mode: {mode}')
+        return super().__new__(cls, format, quality, float(scale), mode)
+
+    @property
+    def content_type(self):
+        return CROP_FORMATS[self.format][1]
+
+
+DEFAULT_CROP_OPTIONS = CropOptions()
+
+
+def crop_variant_path(coords_id, options=DEFAULT_CROP_OPTIONS):
+    """ Return the path, relative to `settings.PRERENDERED_CROPS_ROOT`, of
+        the prerendered crop of a Coordinates object (see
+        `manage.py prerender_crops`), e.g. `png/123.png` for the default
+        options or `webp-q85-s0.5-gray/123.webp`.
+    """
+    variant = options.format
+    if options.quality is not None:
+        variant += f'-q{options.quality}'
+    if options.scale != 1:
+        variant += f'-s{options.scale:g}'
+    if options.mode != 'color':
+        variant += f'-{options.mode}'
+    extension = 'jpg' if options.format == 'jpeg' else options.format
+    return f'{variant}/{coords_id}.{extension}'
+
+
+def crop_options_key(page_url, x, y, w, h, options=DEFAULT_CROP_OPTIONS):
+    return crop_cache_key(page_url, x, y, w, h, **options._asdict())
+
+
+def encode_crop(image_crop, options=DEFAULT_CROP_OPTIONS):
+    """ Return image_crop converted and encoded as specified by options. """
+    if options.mode == 'gray':
+        image_crop = image_crop.convert('L')
+    elif options.mode == 'bitonal':
+        image_crop = image_crop.convert('L').convert('1', dither=Image.NONE)
+        if options.format == 'jpeg':
+            image_crop = image_crop.convert('L')
+    elif image_crop.mode not in ('RGB', 'L'):
+        image_crop = image_crop.convert('RGB')
+
+    save_kwargs = {}
+    if options.quality is not None:
+        save_kwargs['quality'] = options.quality
+    if options.format == 'png':
+        save_kwargs['optimize'] = True
+
+    output = BytesIO()
+    image_crop.save(output, CROP_FORMATS[options.format][0], **save_kwargs)
+    return output.getvalue()
+
+
+def scale_crop(image, box, reduce=1, scale=1.0):
+    """ Return the crop at box (in full page coordinates) of image, which
+        has been reduced in size by a factor of reduce, scaled by scale.
+    """
+    image_crop = image.crop(reduced_box(box, reduce))
+    if scale != 1:
+        x0, y0, x1, y1 = box
+        size = (max(1, round((x1 - x0) * scale)),
+                max(1, round((y1 - y0) * scale)))
+        if image_crop.size != size:
+            image_crop = image_crop.resize(size, Image.LANCZOS)
+    return image_crop
+
+
+def partial_crop(page_url, box, scale=1.0):
+    """ Return the crop of the page at page_url at box, scaled by scale,
+        read from the page's pyramid or decoded from just the region of a
+        local image file around it; or None if neither is possible.
+    """
+    pyramid_store = get_pyramid_store()
+    if pyramid_store:
+        try:
+            tiles = pyramid_store.read_tiles(page_url, box, scale)
+        except OSError:
+            # being rebuilt
+            tiles = None
+        if tiles is not None:
+            return scale_crop(*tiles, scale=scale)
+
+    img_path = local_image_path(page_url)
+    if reduction_for_scale(scale) == 1 and img_path and img_path.exists():
+        image_crop = decode_region(img_path, box)
+        if image_crop is not None:
+            x0, y0, x1, y1 = box
+            return scale_crop(image_crop, (0, 0, x1 - x0, y1 - y0), scale=scale)
+    return None
+
+
+def crop_page_boxes(page_url, boxes, scale=1.0):
+    """ Yield the crops of the page at page_url at each of boxes (x, y, w,
+        h), scaled by scale, decoding as little of the page image as
+        possible:
+
+        * if the page image has already been decoded, it's simply cropped
+        * if the page has a pyramid (see `scripts.pyramid`), a crop is read
+          from just the tiles it needs
+        * a local, full scale crop is decoded from just the part of the image
+          file around the box, if the format allows it
+        * otherwise the page image is decoded (at a reduced size, for a
+          downscaled JPEG crop), once for all the remaining boxes, and kept
+          in the page image cache
+    """
+    reduce = reduction_for_scale(scale)
+    image = None
+    for x, y, w, h in boxes:
+        box = (x, y, x + w, y + h)
+        image_crop = None
+        if (image is None and
+                page_image_key(page_url, reduce) not in page_image_cache):
+            image_crop = partial_crop(page_url, box, scale)
+        if image_crop is None:
+            if image is None:
+                image = load_page_image(page_url, reduce)
+            image_crop = scale_crop(image, box, reduce, scale)
+        yield image_crop
+
+
+def crop_page(page_url, x, y, w, h, scale=1.0):
+    """ Return the crop of the page at page_url at the given bounding box,
+        scaled by scale (see `crop_page_boxes`).
+    """
+    return next(crop_page_boxes(page_url, [(x, y, w, h)], scale))
+
+
+def get_crop(page_url, x, y, w, h, options=DEFAULT_CROP_OPTIONS, key=None):
+    """ Return the encoded crop of the page at page_url, from the crop cache
+        if possible.
+    """
+    crop_cache = get_crop_cache()
+    if key is None:
+        key = crop_options_key(page_url, x, y, w, h, options)
+
+    content = crop_cache.get(key) if crop_cache else None
+    if content is None:
+        content = encode_crop(
+            crop_page(page_url, x, y, w, h, options.scale), options)
+        if crop_cache:
+            crop_cache.put(key, content)
+    return content
+
+
+def get_crops(specs, options=DEFAULT_CROP_OPTIONS):
+    """ Return the encoded crops for a list of (page_url, x, y, w, h) specs,
+        in the same order.
+
+        Specs are grouped by page so that each page image is loaded (and
+        decoded) at most once, if its crops can't be read from a pyramid or
+        decoded region by region (see `crop_page_boxes`).  If a page can't
+        be loaded, the exception raised is returned in place of each of its
+        crops.
+    """
+    crop_cache = get_crop_cache()
+    results = [None] * len(specs)
+
+    specs_by_page = OrderedDict()
+    for i, spec in enumerate(specs):
+        specs_by_page.setdefault(spec[0], []).append(i)
+
+    for page_url, indices in specs_by_page.items():
+        uncached = []
+        for i in indices:
+            key = crop_options_key(page_url, *specs[i][1:], options)
+            results[i] = crop_cache.get(key) if crop_cache else None
+            if results[i] is None:
+                uncached.append((i, key))
+
+        crops = crop_page_boxes(
+            page_url, [specs[i][1:] for i, _ in uncached], options.scale)
+        try:
+            for (i, key), image_crop in zip(uncached, crops):
+                results[i] = encode_crop(image_crop, options)
+                if crop_cache:
+                    crop_cache.put(key, results[i])
+        except Exception as e:  # pylint: disable=broad-except
+            for i, _ in uncached:
+                results[i] = results[i] or e
+
+    return results
+
+
+def pack_crops(entries, results, content_type='image/png'):
+    """ Pack a batch of crops into a single binary container:
+
+        * a 4-byte big-endian unsigned integer, the length of the index
+        * the index, UTF-8 encoded JSON: `{"crops": [<entry>, ...]}`, where
+          each entry is a copy of the corresponding item in entries with
+          either `offset`, `length` and `content_type` keys locating the crop
+          in the data section, or an `error` key
+        * the data section: the encoded crops, concatenated
+    """
+    index = []
+    offset = 0
+    for entry, result in zip(entries, results):
+        entry = dict(entry)
+        if isinstance(result, (bytes, bytearray)):
+            entry.update(
+                offset=offset, length=len(result), content_type=content_type)
+            offset += len(result)
+        else:
+            entry['error'] = str(result)
+        index.append(entry)
+
+    header = json.dumps({'crops': index}, separators=(',', ':')).encode()
+    data = b''.join(
+        result for result in results if isinstance(result, (bytes, bytearray)))
+    return struct.pack('>I', len(header)) + header + data
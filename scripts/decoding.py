@@ -0,0 +1,127 @@
+"""
+Decode strategies for cropping manuscript page images.
+
+Page scans are multi-megapixel images, while crops are tiny, so decoding the
+whole image to extract a glyph is wasteful.  These helpers decode as little
+of an image as its format allows:
+
+* JPEG images can be decoded at 1/2, 1/4 or 1/8 scale by libjpeg (the
+  "draft" mode), which is used when a downscaled crop is requested
+* uncompressed (raw) images -- e.g. TIFF, PPM -- are read only for the rows
+  that intersect the crop box
+* images stored as multiple tiles or strips have only the tiles intersecting
+  the crop box decoded
+
+Anything else falls back to a full decode.  See
+`benchmarks/decode_benchmark.py` for a comparison of the strategies.
+
+"""
+
+
+import math
+
+from PIL import Image
+
+
+JPEG_REDUCTIONS = (8, 4, 2, 1)
+
+RAW_BYTES_PER_PIXEL = {
+    'L': 1, 'P': 1, 'RGB': 3, 'BGR': 3, 'RGBA': 4, 'RGBX': 4, 'CMYK': 4,
+}
+
+
+def reduction_for_scale(scale):
+    """ Return the largest JPEG draft reduction factor that still yields at
+        least the requested scale.
+    """
+    for reduce in JPEG_REDUCTIONS:
+        if reduce * scale <= 1:
+            return reduce
+    return 1
+
+
+def reduced_size(size, reduce):
+    return tuple(int(math.ceil(dimension / reduce)) for dimension in size)
+
+
+def reduced_box(box, reduce):
+    """ Return box (left, upper, right, lower) mapped to an image reduced by
+        a factor of reduce.
+    """
+    left, upper, right, lower = box
+    return (left // reduce, upper // reduce,
+            int(math.ceil(right / reduce)), int(math.ceil(lower / reduce)))
+
+
+def open_reduced(fp, reduce=1):
+    """ Open the image in fp, reduced in size by a factor of reduce (the
+        image is always exactly `reduced_size(original size, reduce)`).
+        JPEG images are decoded directly at the reduced size; other formats
+        are decoded in full and then reduced.
+    """
+    image = Image.open(fp)
+    if reduce > 1:
+        size = reduced_size(image.size, reduce)
+        if image.format == 'JPEG':
+            image.draft(image.mode, size)
+        if image.size != size:
+            image = image.resize(size, Image.BOX)
+    return image
+
+
+def _intersects(extents, box):
+    return not (extents[2] <= box[0] or extents[0] >= box[2] or
+                extents[3] <= box[1] or extents[1] >= box[3])
+
+
+def decode_raw_region(image, box):
+    """ Return the crop of a single-tile, uncompressed image at box, having
+        read only the rows of the file that intersect it.
+    """
+    if len(image.tile) != 1:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+
+    if (codec != 'raw' or orientation != 1 or
+            tuple(extents) != (0, 0) + image.size or
+            rawmode not in RAW_BYTES_PER_PIXEL):
+        return None
+
+    left, upper, right, lower = box
+    stride = stride or image.width * RAW_BYTES_PER_PIXEL[rawmode]
+    image.fp.seek(offset + upper * stride)
+    data = image.fp.read((lower - upper) * stride)
+    strip = Image.frombytes(
+        image.mode, (image.width, lower - upper), data,
+        'raw', rawmode, stride, 1)
+    return strip.crop((left, 0, right, lower - upper))
+
+
+def decode_tiled_region(image, box):
+    """ Return the crop of a tiled (or stripped) image at box, having decoded
+        only the tiles that intersect it.
+    """
+    if len(image.tile) < 2:
+        return None
+    image.tile = [tile for tile in image.tile if _intersects(tile[1], box)]
+    image.load()
+    return image.crop(box)
+
+
+def decode_region(fp, box):
+    """ Return the crop of the image in fp at box, decoding only the part of
+        the image that intersects box; return None if the image's format
+        doesn't allow it, or if box isn't entirely within the image.
+    """
+    image = Image.open(fp)
+    left, upper, right, lower = box
+    if not (0 <= left < right <= image.width and
+            0 <= upper < lower <= image.height):
+        return None
+    region = decode_raw_region(image, box)
+    if region is None:
+        region = decode_tiled_region(image, box)
+    return region
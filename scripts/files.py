@@ -0,0 +1,44 @@
+"""
+Atomic writes of files that may be served straight from disk.
+
+Files are written to a temporary file beside them and then moved into place,
+so readers never see a partial file.  `tempfile` creates files readable by
+their owner only; as a front-end web server may run as another user, they're
+given the permissions of a newly created file (0o666, less the umask)
+before they're published.
+
+"""
+
+
+import os
+import tempfile
+
+
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = get_umask()
+FILE_MODE = 0o666 & ~UMASK
+DIRECTORY_MODE = 0o777 & ~UMASK
+
+
+def write_file(path, content):
+    """ Atomically write content (bytes) to path, whose directory must
+        exist.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,332 @@
+""" IIIF Image API (2.1, level 1) endpoints over pages and letter examples.
+
+    Two kinds of image are available:
+
+    * /iiif/pages/<page id>: the page image
+    * /iiif/coordinates/<coords id>: the part of its page image a Coordinates
+      object outlines, turned the right way up if its orientation says the
+      letter was written upside down (rotated through 180 degrees)
+
+    Each has an info.json, and image requests of the form
+    `{region}/{size}/{rotation}/{quality}.{format}` where:
+
+    * region is full, square, x,y,w,h or pct:x,y,w,h
+    * size is full, max, w, ,h, pct:n, w,h or !w,h (no upscaling)
+    * rotation is 0, 90, 180 or 270, optionally preceded by ! (mirroring)
+    * quality is default, color, gray or bitonal
+    * format is jpg, png or webp
+
+    Responses carry a `rel="canonical"` Link to the canonical form of the
+    request and a strong ETag, and are cached on disk with the crops.
+"""
+
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect)
+from django.utils.cache import patch_cache_control
+
+from PIL import Image
+
+from scripts.crop_cache import crop_cache_key, get_crop_cache
+from scripts.crops import CropOptions, crop_page, encode_crop
+from scripts.image_client import ImageFetchError
+from scripts.models import Coordinates, Page
+from scripts.pyramid import get_pyramid_store, max_level
+from scripts.views import error_response, fetch_error_response, is_not_modified
+
+
+IIIF_CONTEXT = 'http://iiif.io/api/image/2/context.json'
+IIIF_PROTOCOL = 'http://iiif.io/api/image'
+IIIF_PROFILE = 'http://iiif.io/api/image/2/level1.json'
+
+# IIIF format: crop format
+IIIF_FORMATS = {'jpg': 'jpeg', 'png': 'png', 'webp': 'webp'}
+# IIIF quality: crop mode
+IIIF_QUALITIES = {
+    'default': 'color', 'color': 'color', 'gray': 'gray', 'bitonal': 'bitonal',
+}
+IIIF_ROTATIONS = {
+    0: None,
+    90: Image.ROTATE_270,
+    180: Image.ROTATE_180,
+    270: Image.ROTATE_90,
+}
+IIIF_SUPPORTS = [
+    'mirroring', 'regionByPct', 'regionByPx', 'regionSquare', 'rotationBy90s',
+    'sizeByConfinedWh', 'sizeByDistortedWh', 'sizeByH', 'sizeByPct',
+    'sizeByW', 'sizeByWh',
+]
+
+
+class IIIFError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class SourceImage(namedtuple(
+        'SourceImage', 'page_url left top width height rotated version')):
+    """ The image behind a IIIF identifier: the box (left, top, width,
+        height) of the page image at page_url, rotated through 180 degrees
+        if rotated.  version changes whenever the image does.
+    """
+
+    def page_box(self, region):
+        """ Return the box (x, y, w, h) of the page image corresponding to
+            region (x, y, w, h) of this image.
+        """
+        x, y, w, h = region
+        if self.rotated:
+            x, y = self.width - x - w, self.height - y - h
+        return (self.left + x, self.top + y, w, h)
+
+
+def get_source_image(kind, pk):
+    """ Return the `SourceImage` of a IIIF identifier; raise `Http404` if
+        there's no such object, or its size isn't known (yet: see `manage.py
+        probe_page_sizes`).
+    """
+    if kind == 'pages':
+        try:
+            page = Page.objects.get(pk=pk)
+        except Page.DoesNotExist:
+            raise Http404('Page not found')
+        source = SourceImage(
+            page.url, 0, 0, page.width, page.height, False,
+            page.modified_date.isoformat())
+    else:
+        source = get_coordinates_image(pk)
+
+    if source.width <= 0 or source.height <= 0:
+        raise Http404('Image size unknown')
+    return source
+
+
+def get_coordinates_image(pk):
+    try:
+        coordinates = Coordinates.objects.select_related('page').get(pk=pk)
+    except Coordinates.DoesNotExist:
+        raise Http404('Coordinates not found')
+    return SourceImage(
+        coordinates.page.url, coordinates.left, coordinates.top,
+        coordinates.width, coordinates.height,
+        coordinates.orientation == Coordinates.ORIENTATION_CHOICES['180DEG'][0],
+        f'{coordinates.modified_date.isoformat()}/'
+        f'{coordinates.page.modified_date.isoformat()}')
+
+
+def parse_numbers(value, convert=int):
+    try:
+        return [convert(_) for _ in value.split(',')]
+    except ValueError:
+        raise IIIFError(f'Invalid numbers: {value}')
+
+
+def parse_region(region, width, height):
+    """ Return the (x, y, w, h) of region within an image of width and
+        height.
+    """
+    if region == 'full':
+        return (0, 0, width, height)
+    if region == 'square':
+        side = min(width, height)
+        return ((width - side) // 2, (height - side) // 2, side, side)
+    if region.startswith('pct:'):
+        numbers = parse_numbers(region[4:], float)
+        if len(numbers) == 4:
+            x, y, w, h = numbers
+            numbers = [round(x * width / 100), round(y * height / 100),
+                       round(w * width / 100), round(h * height / 100)]
+    else:
+        numbers = parse_numbers(region)
+    if len(numbers) != 4:
+        raise IIIFError(f'Invalid region: {region}')
+
+    x, y, w, h = numbers
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x >= width or y >= height:
+        raise IIIFError(f'Invalid region: {region}')
+    return (x, y, min(w, width - x), min(h, height - y))
+
+
+def parse_size(size, width, height):
+    """ Return the (w, h) of size for a region of width and height. """
+    if size in ('full', 'max'):
+        return (width, height)
+
+    if size.startswith('pct:'):
+        try:
+            pct = float(size[4:])
+        except ValueError:
+            raise IIIFError(f'Invalid size: {size}')
+        w, h = round(width * pct / 100), round(height * pct / 100)
+    else:
+        confined = size.startswith('!')
+        w, _, h = size.lstrip('!').partition(',')
+        try:
+            w = int(w) if w else None
+            h = int(h) if h else None
+        except ValueError:
+            raise IIIFError(f'Invalid size: {size}')
+        if (w is None and h is None) or (confined and None in (w, h)):
+            raise IIIFError(f'Invalid size: {size}')
+        if confined:
+            scale = min(w / width, h / height)
+            w, h = round(width * scale), round(height * scale)
+        elif h is None:
+            h = round(height * w / width)
+        elif w is None:
+            w = round(width * h / height)
+
+    w, h = max(w, 1), max(h, 1)
+    if w > width or h > height:
+        raise IIIFError(f'Size {size} is larger than the region')
+    return (w, h)
+
+
+def parse_rotation(rotation):
+    """ Return the (clockwise) rotation in degrees and whether to mirror. """
+    mirror = rotation.startswith('!')
+    try:
+        degrees = float(rotation.lstrip('!'))
+    except ValueError:
+        raise IIIFError(f'Invalid rotation: {rotation}')
+    if degrees not in IIIF_ROTATIONS:
+        raise IIIFError(f'Unsupported rotation: {rotation}', status=501)
+    return int(degrees), mirror
+
+
+def canonical_request(source, region, size, degrees, mirror, quality,
+                      extension):
+    """ Return the canonical form (see the IIIF Image API 2.1, section 4.7)
+        of a parsed image request.
+    """
+    x, y, w, h = region
+    canonical_region = ('full' if region == (0, 0, source.width, source.height)
+                        else f'{x},{y},{w},{h}')
+    if size == (w, h):
+        canonical_size = 'full'
+    elif size[1] == max(round(h * size[0] / w), 1):
+        canonical_size = f'{size[0]},'
+    else:
+        canonical_size = f'{size[0]},{size[1]}'
+    canonical_quality = 'default' if quality == 'color' else quality
+    return (f'{canonical_region}/{canonical_size}/'
+            f'{"!" if mirror else ""}{degrees}/'
+            f'{canonical_quality}.{extension}')
+
+
+def render(source, region, size, degrees, mirror, options):
+    x, y, w, h = source.page_box(region)
+    scale = min(1, max(size[0] / w, size[1] / h))
+    image = crop_page(source.page_url, x, y, w, h, scale)
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    if source.rotated:
+        image = image.transpose(Image.ROTATE_180)
+    if mirror:
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+    if IIIF_ROTATIONS[degrees] is not None:
+        image = image.transpose(IIIF_ROTATIONS[degrees])
+    return encode_crop(image, options)
+
+
+def iiif_base_uri(request, kind, pk):
+    return request.build_absolute_uri(f'/iiif/{kind}/{pk}')
+
+
+def iiif_base(request, kind, pk):
+    """ Redirect to the image information. """
+    response = HttpResponseRedirect(
+        f'{iiif_base_uri(request, kind, pk)}/info.json')
+    response.status_code = 303
+    return response
+
+
+def iiif_info(request, kind, pk):
+    """ Return the IIIF image information (info.json). """
+    source = get_source_image(kind, pk)
+    info = {
+        '@context': IIIF_CONTEXT,
+        '@id': iiif_base_uri(request, kind, pk),
+        'protocol': IIIF_PROTOCOL,
+        'width': source.width,
+        'height': source.height,
+        'profile': [IIIF_PROFILE, {
+            'formats': list(IIIF_FORMATS),
+            'qualities': list(IIIF_QUALITIES),
+            'supports': IIIF_SUPPORTS,
+        }],
+    }
+
+    pyramid_store = get_pyramid_store()
+    if kind == 'pages' and pyramid_store and pyramid_store.exists(
+            source.page_url):
+        # requests for pyramid tiles only read those tiles
+        info['tiles'] = [{
+            'width': pyramid_store.tile_size,
+            'scaleFactors': [
+                2 ** level for level in range(
+                    max_level((source.width, source.height)) + 1)],
+        }]
+
+    content_type = (
+        'application/ld+json'
+        if 'application/ld+json' in request.META.get('HTTP_ACCEPT', '')
+        else 'application/json')
+    response = HttpResponse(json.dumps(info), content_type=content_type)
+    response['Link'] = f'<{IIIF_PROFILE}>;rel="profile"'
+    patch_cache_control(
+        response, public=True, max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+    return response
+
+
+def iiif_image(request, kind, pk, region, size, rotation, quality, extension):
+    """ Return an image, as requested by the IIIF Image API. """
+    source = get_source_image(kind, pk)
+
+    try:
+        if quality not in IIIF_QUALITIES:
+            raise IIIFError(f'Unsupported quality: {quality}')
+        if extension not in IIIF_FORMATS:
+            raise IIIFError(f'Unsupported format: {extension}', status=501)
+        region = parse_region(region, source.width, source.height)
+        size = parse_size(size, *region[2:])
+        degrees, mirror = parse_rotation(rotation)
+    except IIIFError as e:
+        return error_response(str(e), e.status)
+
+    options = CropOptions(
+        format=IIIF_FORMATS[extension], mode=IIIF_QUALITIES[quality])
+    canonical = canonical_request(
+        source, region, size, degrees, mirror, options.mode, extension)
+    key = crop_cache_key(
+        source.page_url, *source.page_box(region), iiif=canonical,
+        version=source.version, rotated=source.rotated)
+    etag = f'"{key}"'
+
+    if is_not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        crop_cache = get_crop_cache()
+        content = crop_cache.get(key) if crop_cache else None
+        if content is None:
+            try:
+                content = render(source, region, size, degrees, mirror, options)
+            except ImageFetchError as e:
+                return fetch_error_response(e)
+            if crop_cache:
+                crop_cache.put(key, content)
+        response = HttpResponse(content, content_type=options.content_type)
+        response['Content-Length'] = len(content)
+
+    response['ETag'] = etag
+    response['Link'] = (
+        f'<{iiif_base_uri(request, kind, pk)}/{canonical}>;rel="canonical", '
+        f'<{IIIF_PROFILE}>;rel="profile"')
+    patch_cache_control(
+        response, public=True, max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+    return response
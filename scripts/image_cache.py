@@ -0,0 +1,151 @@
+"""
+In-process cache of decoded manuscript page images.
+
+A script chart asks for many crops from a handful of pages, so the crop
+endpoint keeps recently used page images around, decoded, in a
+least-recently-used cache bounded by an (approximate) memory budget:
+
+* entries are keyed by page URL, local path (if `IMAGES_ROOT` is set) and
+  the factor by which the image was reduced when decoded (see
+  `scripts.decoding.open_reduced`)
+* the budget is set in bytes by `settings.PAGE_IMAGE_CACHE_BYTES`; a value of
+  0 disables the cache
+* images bigger than the whole budget are never cached
+* hit, miss and eviction counts are kept for monitoring
+* concurrent loads of the same image wait on a single fetch and decode (see
+  `scripts.single_flight`)
+
+"""
+
+
+import pathlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+
+from scripts.decoding import open_reduced
+from scripts.single_flight import SingleFlight, fetch_page_content
+
+
+IMAGES_HOST = 'https://images.syriac.reclaim.hosting/'
+
+
+def image_nbytes(image):
+    """ Approximate size in memory of a decoded PIL image. """
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class PageImageCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        nbytes = image_nbytes(image)
+        if nbytes > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._images:
+                self.current_bytes -= image_nbytes(self._images.pop(key))
+            self._images[key] = image
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.current_bytes -= image_nbytes(evicted)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._images),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+page_image_cache = PageImageCache(settings.PAGE_IMAGE_CACHE_BYTES)
+
+
+def local_image_path(page_url):
+    """ Return the path under `settings.IMAGES_ROOT` at which the image for
+        page_url would be found, or None if `IMAGES_ROOT` is not set.
+    """
+    if settings.IMAGES_ROOT is None:
+        return None
+    img_base = pathlib.Path(settings.IMAGES_ROOT)
+    return img_base / page_url.replace(IMAGES_HOST, '')
+
+
+def open_page_image(page_url, reduce=1):
+    """ Open the image for page_url (reduced by a factor of reduce), from the
+        local filesystem if it's available there and over HTTP otherwise.
+    """
+    img_path = local_image_path(page_url)
+    if img_path and img_path.exists():
+        return open_reduced(img_path, reduce)
+    content = fetch_page_content(page_url)
+    return open_reduced(BytesIO(content), reduce)
+
+
+def page_image_key(page_url, reduce=1):
+    img_path = local_image_path(page_url)
+    return (page_url, str(img_path) if img_path else None, reduce)
+
+
+page_image_loads = SingleFlight()
+
+
+def _load_page_image(key, page_url, reduce):
+    image = open_page_image(page_url, reduce)
+    image.load()
+    page_image_cache.put(key, image)
+    return image
+
+
+def load_page_image(page_url, reduce=1):
+    """ Return the decoded image for page_url, reduced by a factor of reduce,
+        from the cache if possible.  Concurrent loads of the same image are
+        coalesced into one.
+    """
+    key = page_image_key(page_url, reduce)
+
+    image = page_image_cache.get(key)
+    if image is None:
+        image = page_image_loads.do(
+            key, _load_page_image, key, page_url, reduce)
+    return image
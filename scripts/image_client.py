@@ -0,0 +1,176 @@
+"""
+Shared HTTP client for fetching upstream page images.
+
+All page image fetches go through a single `ImageClient`, which provides:
+
+* keep-alive connection pooling (one `requests.Session`)
+* connect and read timeouts
+* bounded retries, with exponential backoff, of connection errors and
+  502/503/504 responses
+* a limit on the number of concurrent requests to each host
+* a circuit breaker per host: after a number of consecutive failures the
+  host is considered down, and requests to it fail fast (raising
+  `CircuitOpenError`) until a cool-down period has passed, after which a
+  single trial request is let through
+
+The client is configured by the `IMAGE_FETCH_*` settings.
+
+"""
+
+
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+class CircuitOpenError(ImageFetchError):
+    def __init__(self, host, retry_after):
+        super().__init__(
+            f'{host} is unavailable; not retrying for {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """ Raise CircuitOpenError if requests to host shouldn't be made. """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(host, max(remaining, 0))
+            # half-open: let a single trial request through
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class ImageClient:
+
+    def __init__(self, connect_timeout, read_timeout, retries, backoff_factor,
+                 pool_size, max_per_host, failure_threshold, reset_timeout):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_per_host = max_per_host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        retry = Retry(
+            total=retries, backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (
+                    threading.BoundedSemaphore(self.max_per_host),
+                    CircuitBreaker(self.failure_threshold, self.reset_timeout))
+            return self._hosts[host]
+
+    def circuit_breaker(self, url):
+        return self._host(urlsplit(url).netloc)[1]
+
+    @contextmanager
+    def stream(self, url, headers=None):
+        """ Yield the (streamed) response to a GET request for url; a slot
+            for its host is held until the response is closed.
+        """
+        host = urlsplit(url).netloc
+        semaphore, breaker = self._host(host)
+
+        if not semaphore.acquire(timeout=self.timeout[1]):
+            raise ImageFetchError(f'Too many concurrent requests to {host}')
+        try:
+            breaker.before_request(host)
+            try:
+                response = self.session.get(
+                    url, headers=headers, stream=True, timeout=self.timeout)
+            except requests.RequestException as e:
+                breaker.record_failure()
+                raise ImageFetchError(f'Failed to fetch {url}: {e}') from e
+
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                response.close()
+                raise ImageFetchError(f'Failed to fetch {url}: {e}') from e
+
+            try:
+                yield response
+            except requests.RequestException as e:
+                # reading the response body failed
+                breaker.record_failure()
+                raise ImageFetchError(f'Failed to fetch {url}: {e}') from e
+            finally:
+                response.close()
+        finally:
+            semaphore.release()
+
+    def get(self, url, headers=None):
+        """ Return the content of url. """
+        with self.stream(url, headers) as response:
+            return response.content
+
+
+_image_client = None
+_image_client_lock = threading.Lock()
+
+
+def get_image_client():
+    global _image_client
+
+    with _image_client_lock:
+        if _image_client is None:
+            _image_client = ImageClient(
+                connect_timeout=settings.IMAGE_FETCH_CONNECT_TIMEOUT,
+                read_timeout=settings.IMAGE_FETCH_READ_TIMEOUT,
+                retries=settings.IMAGE_FETCH_RETRIES,
+                backoff_factor=settings.IMAGE_FETCH_BACKOFF_FACTOR,
+                pool_size=settings.IMAGE_FETCH_POOL_SIZE,
+                max_per_host=settings.IMAGE_FETCH_MAX_PER_HOST,
+                failure_threshold=settings.IMAGE_FETCH_FAILURE_THRESHOLD,
+                reset_timeout=settings.IMAGE_FETCH_RESET_TIMEOUT)
+        return _image_client
@@ -2,30 +2,63 @@
     script chart.
 """
 
-# TODO:
-# These changes all need to be made in coordination with frontend changes
-# * remove empty lists from response
-# * change top-level key from 'mss' to 'examples'
-# * remove unnecessary fields from response
-#   all that's required, I think, is:
-#   - height, width, top, left
-#   - maybe that's it (becasue ms_id / ms_slug is already available)?
-#   - consider pre-composing the url(s), or are these best composed
-#     on the frontend?
+# The v1 format (`get_letters`) is what the frontend currently uses; the
+#  more compact, columnar v2 format (`get_letters_v2`) drops empty lists and
+#  repeated page fields.
 
 
 # pylint: disable=import-error
 
+from itertools import groupby
+from operator import itemgetter
+
+# django
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_cache_control
+
 # drf
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 # dash
-from scripts.models import Coordinates
+from scripts.atlas import get_atlas, get_atlas_cache
+from scripts.models import ChartExample, Coordinates, Page
+from scripts.renderers import MessagePackRenderer
+from scripts.response_cache import cache_response
+from scripts.streaming import (
+    STREAMING_CHUNK_SIZE, accepts_streaming, render_json,
+    streaming_json_response)
+
+
+DEFAULT_EXAMPLE_COUNT = 3
+
+
+def parse_chart_params(request):
+    """ Return (ms_ids, letter_ids, count) from the request's query params,
+        or an error Response if they're missing or invalid.
+    """
+    if 'ms_ids' not in request.query_params:
+        return Response(
+            {'error': 'No Manuscripts Specified!'},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    if 'letter_ids' not in request.query_params:
+        return Response(
+            {'error': 'No Letters Specified!'},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    count = int(request.query_params.get('count', DEFAULT_EXAMPLE_COUNT))
+    ms_ids = request.query_params['ms_ids'].split('|')
+    letter_ids = request.query_params['letter_ids'].split('|')
+
+    return ms_ids, letter_ids, count
 
 
 @api_view(http_method_names=['GET'])
+@cache_response(Coordinates, Page)
 def get_letters(request):
     """
     Query Params:
@@ -55,25 +88,59 @@ def get_letters(request):
           ...
         }
       }
+
+    Charts that may have more than `settings.STREAMING_THRESHOLD` examples
+    are streamed (see `scripts.streaming`).
     """
 
-    if 'ms_ids' not in request.query_params:
-        return Response(
-            {'error': 'No Manuscripts Specified!'},
-            status=status.HTTP_400_BAD_REQUEST)
+    params = parse_chart_params(request)
+    if isinstance(params, Response):
+        return params
+    ms_ids, letter_ids, count = params
 
-    if 'letter_ids' not in request.query_params:
-        return Response(
-            {'error': 'No Letters Specified!'},
-            status=status.HTTP_400_BAD_REQUEST)
+    if (accepts_streaming(request) and len(ms_ids) * len(letter_ids) * count >
+            settings.STREAMING_THRESHOLD):
+        return streaming_json_response(stream_chart_examples(
+            [int(_) for _ in ms_ids], [int(_) for _ in letter_ids], count))
+
+    return Response(get_chart_examples(ms_ids, letter_ids, count))
 
-    count = int(request.query_params.get('count', 3))
-    ms_ids = request.query_params['ms_ids'].split('|')
-    letter_ids = request.query_params['letter_ids'].split('|')
 
-    examples = Coordinates.objects.select_related('page').filter(
+def chart_example_rows(ms_ids, letter_ids, count):
+    # a range scan of the chart examples' index; no model instances
+    return ChartExample.objects.filter(
         manuscript_id__in=ms_ids, letter_id__in=letter_ids,
-        priority__lte=count)
+        priority__lte=count).order_by(
+            'manuscript_id', 'letter_id', 'priority').values_list(
+                'coordinates_id', 'manuscript_id', 'letter_id', 'binary_url',
+                'height', 'width', 'top', 'left', 'page_number', 'page_url',
+                'page_height', 'page_width')
+
+
+def chart_example(row):
+    (coords_id, _, letter_id, binary_url, height, width, top, left,
+     page_number, page_url, page_height, page_width) = row
+    return {
+        "id": coords_id,
+        "binaryurl": binary_url,
+        "height": height,
+        "width": width,
+        "top": top,
+        "left": left,
+
+        "letter": letter_id,
+
+        "page": page_number,
+        "pageurl": page_url,
+        "pageheight": page_height,
+        "pagewidth": page_width,
+    }
+
+
+def get_chart_examples(ms_ids, letter_ids, count):
+    """ Return the `get_letters` data for the count highest priority
+        examples of letter_ids in ms_ids.
+    """
 
     # the frontend depends on empty lists for missing values, so...
     # examples_dict = defaultdict(lambda: defaultdict(list))
@@ -82,21 +149,156 @@ def get_letters(request):
         for ms_id in ms_ids
     )
 
-    for example in examples:
-        examples_dict[example.manuscript_id][example.letter_id].append({
-            "id": example.id,
-            "binaryurl": example.binary_url,
-            "height": example.height,
-            "width": example.width,
-            "top": example.top,
-            "left": example.left,
+    for row in chart_example_rows(ms_ids, letter_ids, count):
+        examples_dict[row[1]][row[2]].append(chart_example(row))
+
+    return {'mss': examples_dict}
 
-            "letter": example.letter_id,
 
-            "page": example.page.number,
-            "pageurl": example.page.url,
-            "pageheight": example.page.height,
-            "pagewidth": example.page.width,
-        })
+def stream_chart_examples(ms_ids, letter_ids, count):
+    """ Yield the JSON of `get_chart_examples(ms_ids, letter_ids, count)` a
+        manuscript at a time, reading the examples in chunks.
+    """
+    letter_ids = list(dict.fromkeys(letter_ids))
+    groups = groupby(
+        chart_example_rows(ms_ids, letter_ids, count).iterator(
+            chunk_size=STREAMING_CHUNK_SIZE),
+        key=itemgetter(1))
+    group_ms_id, rows = next(groups, (None, ()))
+
+    yield b'{"mss":{'
+    # in the order of the rows
+    for index, ms_id in enumerate(sorted(set(ms_ids))):
+        letters = dict((letter_id, []) for letter_id in letter_ids)
+        if group_ms_id == ms_id:
+            for row in rows:
+                letters[row[2]].append(chart_example(row))
+            group_ms_id, rows = next(groups, (None, ()))
+        yield (b',' if index else b'') + f'"{ms_id}":'.encode('utf-8') + \
+            render_json(letters)
+    yield b'}}'
+
+
+V2_PAGE_COLUMNS = ('number', 'url', 'width', 'height')
+V2_EXAMPLE_COLUMNS = (
+    'id', 'ms', 'letter', 'page', 'top', 'left', 'width', 'height', 'binaryurl')
+V2_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + (
+    [MessagePackRenderer] if MessagePackRenderer else [])
+
+
+@api_view(http_method_names=['GET'])
+@renderer_classes(V2_RENDERERS)
+@cache_response(Coordinates, Page)
+def get_letters_v2(request, format=None):
+    """
+    Query Params:
+        as for `get_letters`
+
+    Returns the same examples as `get_letters`, in a compact, columnar
+    format: manuscript/letter pairs without examples are left out, each page
+    appears once, and each field is an array with an element per example (or
+    page), so that e.g. the nth example is
+    `{"id": examples.id[n], "ms": examples.ms[n], ...}`:
+      {
+        "version": 2,
+        "pages": {
+          "number": [...], "url": [...], "width": [...], "height": [...]
+        },
+        "examples": {
+          "id": [...],
+          "ms": [...],
+          "letter": [...],
+          "page": [...],  (indexes into the pages arrays)
+          "top": [...], "left": [...], "width": [...], "height": [...],
+          "binaryurl": [...]
+        }
+      }
+
+    Examples are ordered by manuscript, letter and priority.  The response
+    is also available as MessagePack (`Accept: application/x-msgpack` or
+    `?format=msgpack`), if the msgpack package is installed.
+    """
+
+    params = parse_chart_params(request)
+    if isinstance(params, Response):
+        return params
+    ms_ids, letter_ids, count = params
+
+    examples = ChartExample.objects.filter(
+        manuscript_id__in=ms_ids, letter_id__in=letter_ids,
+        priority__lte=count).order_by(
+            'manuscript_id', 'letter_id', 'priority').values_list(
+                'coordinates_id', 'manuscript_id', 'letter_id', 'page_number',
+                'page_url', 'page_width', 'page_height', 'top', 'left',
+                'width', 'height', 'binary_url')
+
+    page_indexes = {}
+    pages = dict((column, []) for column in V2_PAGE_COLUMNS)
+    columns = dict((column, []) for column in V2_EXAMPLE_COLUMNS)
+    for (coords_id, ms_id, letter_id, page_number, page_url, page_width,
+         page_height, top, left, width, height, binary_url) in examples:
+        page = (page_number, page_url, page_width, page_height)
+        page_index = page_indexes.get(page)
+        if page_index is None:
+            page_index = page_indexes[page] = len(page_indexes)
+            for column, value in zip(V2_PAGE_COLUMNS, page):
+                pages[column].append(value)
+        for column, value in zip(V2_EXAMPLE_COLUMNS, (
+                coords_id, ms_id, letter_id, page_index, top, left, width,
+                height, binary_url)):
+            columns[column].append(value)
+
+    return Response({'version': 2, 'pages': pages, 'examples': columns})
+
+
+@api_view(http_method_names=['GET'])
+def get_letters_atlas(request):
+    """
+    Query Params:
+        as for `get_letters`
+
+    Returns the offset map of a sprite atlas of all the examples that
+    `get_letters` would return (see `scripts.atlas.get_atlas`), along with the
+    url of the atlas image:
+      {
+        "image": "/api/atlases/<digest>.png",
+        "digest": ...,
+        "width": ...,
+        "height": ...,
+        "mss": {
+          "<ms_id>": {
+            "<letter_id>": [
+              {"id": coords.id, "x": ..., "y": ..., "width": ..., "height": ...},
+              ...
+            ],
+            ...
+          },
+          ...
+        }
+      }
+    """
+
+    params = parse_chart_params(request)
+    if isinstance(params, Response):
+        return params
+
+    atlas = get_atlas(*params)
+    atlas['image'] = (
+        f'/api/atlases/{atlas["digest"]}.png' if atlas['width'] else None)
+    return Response(atlas)
+
+
+def get_atlas_image(request, digest):
+    """ Serve a previously generated atlas image.  Atlas images are named by
+        digest and never change, so they can be cached indefinitely.
+    """
+    path = get_atlas_cache().path(f'{digest}.png')
+    if not path.exists():
+        raise Http404('Atlas not found')
 
-    return Response({'mss': examples_dict})
+    response = FileResponse(open(path, 'rb'), content_type='image/png')
+    response['ETag'] = f'"{digest}"'
+    patch_cache_control(
+        response, public=True, max_age=settings.ATLAS_CACHE_CONTROL_MAX_AGE,
+        immutable=True)
+    return response
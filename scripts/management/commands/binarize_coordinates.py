@@ -0,0 +1,159 @@
+""" Binarize letter examples and fill in their binary_url.
+
+    Examples are binarized page by page (see `scripts.binarization`), each
+    page image being decoded once, across a process pool.  The images are
+    written to settings.BINARIZED_ROOT and their URLs, under
+    settings.BINARIZED_URL (which must be set), stored as the examples'
+    binary_url.
+
+    Only examples with no binary_url are binarized, unless --overwrite is
+    given.
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from scripts.binarization import (
+    BINARIZATION_METHODS, BinarizationOptions, binarize_page,
+    binarized_filename)
+from scripts.files import write_file
+from scripts.management.utils import (
+    filter_letters, filter_manuscripts, run_tasks)
+from scripts.models import ChartExample, Coordinates
+from scripts.response_cache import bump_generation
+from scripts.snapshots import update_chart_snapshots
+
+
+def binarize_page_files(page_url, coordinates, options, output_dir):
+    """ Binarize the examples on a page into output_dir; return a dict of
+        coords id: filename.
+    """
+    filenames = {}
+    os.makedirs(output_dir, exist_ok=True)
+    for coords_id, content in binarize_page(
+            page_url, coordinates, options).items():
+        filename = binarized_filename(coords_id, content)
+        write_file(os.path.join(output_dir, filename), content)
+        filenames[coords_id] = filename
+    return filenames
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--manuscript', action='append', default=[],
+            help='manuscript id or slug (may be repeated)')
+        parser.add_argument(
+            '--letter', action='append', default=[],
+            help='letter id or name (may be repeated)')
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='replace existing binarized images')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument(
+            '--method', choices=BINARIZATION_METHODS, default='sauvola')
+        parser.add_argument('--window', type=int, default=25)
+        parser.add_argument('--k', type=float, default=0.2)
+        parser.add_argument(
+            '--no-despeckle', action='store_false', dest='despeckle')
+        parser.add_argument('--no-trim', action='store_false', dest='trim')
+
+    def get_queryset(self, options):
+        queryset = Coordinates.objects.all()
+        if not options['overwrite']:
+            queryset = queryset.filter(
+                Q(binary_url__isnull=True) | Q(binary_url=''))
+        queryset = filter_manuscripts(
+            queryset, options['manuscript'],
+            slug_field='page__manuscript__slug')
+        queryset = filter_letters(queryset, options['letter'])
+
+        return queryset.values_list(
+            'id', 'left', 'top', 'width', 'height', 'orientation',
+            'binary_url', 'page__url')
+
+    def store(self, filenames, old_urls):
+        """ Point the examples at their binarized images, and remove the
+            images they replace.
+        """
+        for coords_id, filename in filenames.items():
+            url = f'{settings.BINARIZED_URL}{filename}'
+            Coordinates.objects.filter(pk=coords_id).update(
+                binary_url=url, modified_date=timezone.now())
+
+            old_url = old_urls.get(coords_id) or ''
+            if old_url != url and old_url.startswith(settings.BINARIZED_URL):
+                try:
+                    os.remove(os.path.join(
+                        settings.BINARIZED_ROOT,
+                        old_url[len(settings.BINARIZED_URL):]))
+                except OSError:
+                    pass
+
+        # bulk updates don't keep the chart examples in sync, or invalidate
+        #  cached responses
+        ChartExample.sync(Coordinates.objects.filter(pk__in=list(filenames)))
+        bump_generation(Coordinates)
+
+    def handle(self, *args, **options):
+        if not settings.BINARIZED_URL:
+            raise CommandError('settings.BINARIZED_URL is not set')
+
+        try:
+            binarization_options = BinarizationOptions(
+                method=options['method'], window=options['window'],
+                k=options['k'], despeckle=options['despeckle'],
+                trim=options['trim'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        pages, old_urls = {}, {}
+        rotated = Coordinates.ORIENTATION_CHOICES['180DEG'][0]
+        for (coords_id, left, top, width, height, orientation, binary_url,
+             page_url) in self.get_queryset(options).iterator():
+            pages.setdefault(page_url, []).append(
+                (coords_id, left, top, width, height, orientation == rotated))
+            old_urls[coords_id] = binary_url
+        total = len(old_urls)
+
+        self.stdout.write(
+            f'Binarizing {total} examples from {len(pages)} pages...')
+
+        binarized = failed = 0
+        start = time.time()
+
+        def report(page_url, future):
+            nonlocal binarized, failed
+            try:
+                filenames = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failed += len(pages[page_url])
+                self.stderr.write(f'Failed to binarize {page_url}: {e}')
+            else:
+                self.store(filenames, old_urls)
+                binarized += len(filenames)
+            self.stdout.write(f'{binarized + failed}/{total} examples')
+
+        args = (binarization_options, settings.BINARIZED_ROOT)
+        run_tasks(
+            binarize_page_files,
+            ((page_url, (page_url, coordinates) + args)
+             for page_url, coordinates in pages.items()),
+            options['processes'], report)
+
+        if binarized:
+            update_chart_snapshots()
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Binarized {binarized} examples in {elapsed:.1f}s; '
+            f'{failed} failed.'))
@@ -0,0 +1,27 @@
+""" Write the default script chart, and the manuscript and letter lists, as
+    static, precompressed JSON files (see `scripts.snapshots`).
+
+    Once built, the snapshots are regenerated as the data changes; run this
+    again after changes made behind the ORM's back.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scripts.snapshots import build_chart_snapshots
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir', default=settings.CHART_SNAPSHOTS_ROOT,
+            help='defaults to settings.CHART_SNAPSHOTS_ROOT')
+
+    def handle(self, *args, **options):
+        sizes = build_chart_snapshots(options['output_dir'])
+        for name, size in sorted(sizes.items()):
+            self.stdout.write(f'{name}: {size} bytes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(sizes)} files to {options["output_dir"]}.'))
@@ -0,0 +1,90 @@
+""" Build tiled, multi-resolution pyramids of page images.
+
+    Each page image is converted into a Deep Zoom pyramid in
+    settings.PYRAMID_ROOT (see `scripts.pyramid`), from which crops are then
+    read tile by tile.  Pyramids are named by page URL, so the command is
+    incremental: only pages without a pyramid -- new pages and pages whose
+    URL has changed -- are built, unless --force is given.
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scripts.management.utils import filter_manuscripts, run_tasks
+from scripts.models import Page
+from scripts.pyramid import build_page_pyramid, get_pyramid_store, pyramid_name
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--manuscript', action='append', default=[],
+            help='manuscript id or slug (may be repeated)')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='rebuild pyramids that have already been built')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='delete pyramids of images no page refers to any more')
+
+    def get_queryset(self, options):
+        return filter_manuscripts(Page.objects.all(), options['manuscript'])
+
+    def prune(self, pyramid_store):
+        names = set(
+            pyramid_name(url)
+            for url in Page.objects.values_list('url', flat=True).distinct())
+        pruned = 0
+        for name in pyramid_store.names():
+            if name not in names:
+                pyramid_store.delete_name(name)
+                pruned += 1
+        self.stdout.write(f'Pruned {pruned} pyramids.')
+
+    def handle(self, *args, **options):
+        pyramid_store = get_pyramid_store()
+        if pyramid_store is None:
+            raise CommandError('settings.PYRAMID_ROOT is not set')
+
+        if options['prune']:
+            self.prune(pyramid_store)
+
+        urls = sorted(set(
+            self.get_queryset(options).values_list('url', flat=True)))
+        skipped = 0
+        if not options['force']:
+            skipped = len(urls)
+            urls = [url for url in urls if not pyramid_store.exists(url)]
+            skipped -= len(urls)
+
+        self.stdout.write(
+            f'Building {len(urls)} pyramids ({skipped} already built)...')
+
+        built = failed = 0
+        start = time.time()
+
+        def report(url, future):
+            nonlocal built, failed
+            try:
+                future.result()
+                built += 1
+            except Exception as e:  # pylint: disable=broad-except
+                failed += 1
+                self.stderr.write(f'Failed to build {url}: {e}')
+            self.stdout.write(f'{built + failed}/{len(urls)} pyramids')
+
+        run_tasks(
+            build_page_pyramid, ((url, (url,)) for url in urls),
+            options['processes'], report)
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built} pyramids in {elapsed:.1f}s; '
+            f'{failed} failed, {skipped} skipped.'))
@@ -0,0 +1,96 @@
+""" Generate the admin thumbnails of page images and binarized examples.
+
+    Thumbnails are otherwise generated when the admin first shows them (see
+    `scripts.thumbnails`); building them ahead of time keeps the first visit
+    to a large manuscript's pages fast.  Only thumbnails that aren't cached
+    yet are generated, unless --force is given.
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from scripts.management.utils import filter_manuscripts, run_tasks
+from scripts.models import Coordinates, Page
+from scripts.thumbnails import (
+    get_image_thumbnail, get_thumbnail_cache, image_thumbnail_key)
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--manuscript', action='append', default=[],
+            help='manuscript id or slug (may be repeated)')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='regenerate thumbnails that are already cached')
+
+    def get_images(self, options):
+        """ Return a dict of url: (width, height), or None if the size of the
+            image isn't known.
+        """
+        pages = filter_manuscripts(Page.objects.all(), options['manuscript'])
+        coordinates = Coordinates.objects.exclude(
+            Q(binary_url__isnull=True) | Q(binary_url=''))
+        if options['manuscript']:
+            coordinates = coordinates.filter(page__in=pages)
+
+        images = dict(
+            (url, (width, height))
+            for url, width, height in pages.values_list('url', 'width', 'height'))
+        for url in coordinates.values_list('binary_url', flat=True):
+            images.setdefault(url, None)
+        return images
+
+    def handle(self, *args, **options):
+        thumbnail_cache = get_thumbnail_cache()
+        if thumbnail_cache is None:
+            raise CommandError('settings.THUMBNAIL_CACHE_ROOT is not set')
+
+        images = self.get_images(options)
+        skipped = 0
+        if options['force']:
+            for url in images:
+                try:
+                    thumbnail_cache.path(image_thumbnail_key(url)).unlink()
+                except FileNotFoundError:
+                    pass
+        else:
+            skipped = len(images)
+            images = dict(
+                (url, size) for url, size in images.items()
+                if not thumbnail_cache.path(image_thumbnail_key(url)).exists())
+            skipped -= len(images)
+
+        self.stdout.write(
+            f'Generating {len(images)} thumbnails ({skipped} already cached)...')
+
+        generated = failed = 0
+        start = time.time()
+
+        def report(url, future):
+            nonlocal generated, failed
+            try:
+                future.result()
+                generated += 1
+            except Exception as e:  # pylint: disable=broad-except
+                failed += 1
+                self.stderr.write(f'Failed to generate {url}: {e}')
+            self.stdout.write(f'{generated + failed}/{len(images)} thumbnails')
+
+        run_tasks(
+            get_image_thumbnail,
+            ((url, (url, size)) for url, size in images.items()),
+            options['processes'], report)
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {generated} thumbnails in {elapsed:.1f}s; '
+            f'{failed} failed, {skipped} skipped.'))
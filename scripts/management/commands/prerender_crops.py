@@ -0,0 +1,183 @@
+""" Render the crops of prioritized Coordinates into a static directory tree.
+
+    Crops are written to `<output dir>/<variant>/<coords id>.<extension>`
+    (see `scripts.crops.crop_variant_path`), so that they can be served
+    directly by whitenoise or a front proxy.  The work is grouped by page, so
+    that each page image is decoded once, and spread across a process pool.
+
+    The command can be interrupted and re-run: crops that are already
+    rendered (and newer than both their Coordinates and page) are skipped,
+    and the crops of Coordinates that have since been deleted (or lost their
+    priority) are removed, so that they're no longer served.
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from scripts.crops import (
+    CROP_FORMATS, CROP_MODES, CropOptions, crop_variant_path, encode_crop,
+    scale_crop)
+from scripts.decoding import reduction_for_scale
+from scripts.files import write_file
+from scripts.image_cache import open_page_image
+from scripts.management.utils import (
+    filter_letters, filter_manuscripts, run_tasks)
+from scripts.models import Coordinates
+
+
+def render_page_crops(page_url, crops, options):
+    """ Render crops, a list of (output path, x, y, w, h), from the page at
+        page_url; return the number of crops rendered.
+    """
+    reduce = reduction_for_scale(options.scale)
+    image = open_page_image(page_url, reduce)
+    image.load()
+
+    for path, x, y, w, h in crops:
+        content = encode_crop(
+            scale_crop(image, (x, y, x + w, y + h), reduce, options.scale),
+            options)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, content)
+
+    return len(crops)
+
+
+def is_rendered(path, modified_dates):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    return all(mtime >= _.timestamp() for _ in modified_dates)
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--manuscript', action='append', default=[],
+            help='manuscript id or slug (may be repeated)')
+        parser.add_argument(
+            '--letter', action='append', default=[],
+            help='letter id or name (may be repeated)')
+        parser.add_argument(
+            '--max-priority', type=int,
+            help='only render examples with at most this priority')
+        parser.add_argument(
+            '--output-dir', default=settings.PRERENDERED_CROPS_ROOT,
+            help='defaults to settings.PRERENDERED_CROPS_ROOT')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='number of worker processes (defaults to the number of CPUs)')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='re-render crops that have already been rendered')
+        parser.add_argument(
+            '--format', choices=CROP_FORMATS.keys(), default='png')
+        parser.add_argument('--quality', type=int, default=85)
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--mode', choices=CROP_MODES, default='color')
+
+    def get_queryset(self, options):
+        queryset = Coordinates.objects.filter(priority__isnull=False)
+        queryset = filter_manuscripts(
+            queryset, options['manuscript'],
+            slug_field='page__manuscript__slug')
+        queryset = filter_letters(queryset, options['letter'])
+
+        if options['max_priority'] is not None:
+            queryset = queryset.filter(priority__lte=options['max_priority'])
+
+        return queryset.values_list(
+            'id', 'left', 'top', 'width', 'height', 'modified_date',
+            'page__url', 'page__modified_date')
+
+    def plan(self, queryset, output_dir, crop_options, force):
+        """ Return a dict of page url: list of crops still to render, and
+            the number of crops skipped.
+        """
+        pages = {}
+        skipped = 0
+        for (coords_id, x, y, w, h, modified_date,
+             page_url, page_modified_date) in queryset.iterator():
+            path = os.path.join(
+                output_dir, crop_variant_path(coords_id, crop_options))
+            if not force and is_rendered(
+                    path, (modified_date, page_modified_date)):
+                skipped += 1
+                continue
+            pages.setdefault(page_url, []).append((path, x, y, w, h))
+        return pages, skipped
+
+    def prune(self, output_dir, crop_options):
+        """ Remove the crops of this variant whose Coordinates no longer
+            exist or have no priority; return the number removed.
+        """
+        variant_dir = os.path.dirname(
+            os.path.join(output_dir, crop_variant_path(0, crop_options)))
+        try:
+            names = os.listdir(variant_dir)
+        except FileNotFoundError:
+            return 0
+
+        prioritized = set(
+            str(_) for _ in Coordinates.objects.filter(
+                priority__isnull=False).values_list('id', flat=True))
+        pruned = 0
+        for name in names:
+            if os.path.splitext(name)[0] not in prioritized:
+                try:
+                    os.remove(os.path.join(variant_dir, name))
+                    pruned += 1
+                except OSError:
+                    pass
+        return pruned
+
+    def handle(self, *args, **options):
+        try:
+            crop_options = CropOptions(
+                format=options['format'], quality=options['quality'],
+                scale=options['scale'], mode=options['mode'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        pruned = self.prune(options['output_dir'], crop_options)
+        pages, skipped = self.plan(
+            self.get_queryset(options), options['output_dir'], crop_options,
+            options['force'])
+        total = sum(len(crops) for crops in pages.values())
+
+        self.stdout.write(
+            f'Rendering {total} crops from {len(pages)} pages '
+            f'({skipped} already rendered, {pruned} stale removed)...')
+
+        rendered = failed = 0
+        start = time.time()
+
+        def report(page_url, future):
+            nonlocal rendered, failed
+            try:
+                rendered += future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failed += len(pages[page_url])
+                self.stderr.write(f'Failed to render {page_url}: {e}')
+            elapsed = time.time() - start
+            self.stdout.write(
+                f'{rendered + failed}/{total} crops '
+                f'({rendered / elapsed if elapsed else 0:.1f} crops/s)')
+
+        run_tasks(
+            render_page_crops,
+            ((page_url, (page_url, crops, crop_options))
+             for page_url, crops in pages.items()),
+            options['processes'], report)
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} crops in {elapsed:.1f}s '
+            f'({rendered / elapsed if elapsed else 0:.1f} crops/s); '
+            f'{failed} failed, {skipped} skipped.'))
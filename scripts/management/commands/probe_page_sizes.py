@@ -0,0 +1,103 @@
+""" Probe the size, format and dimensions of page images.
+
+    Page images are probed concurrently, reading as little of each image as
+    possible (see `scripts.utils.probe_image`), and the results are stored as
+    `PageImageMetadata`, which `Page.save` looks up before going to the
+    network.  Pages with no recorded width or height are updated.
+
+    Images that have already been probed are skipped, unless --refresh is
+    given, in which case they are re-probed conditionally on their ETag.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from scripts.image_client import ImageFetchError
+from scripts.management.utils import filter_manuscripts
+from scripts.models import (
+    ChartExample, Coordinates, Page, PageImageMetadata)
+from scripts.response_cache import bump_generation
+from scripts.snapshots import update_chart_snapshots
+from scripts.utils import probe_image
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--manuscript', action='append', default=[],
+            help='manuscript id or slug (may be repeated)')
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='re-probe images that have already been probed')
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_FETCH_MAX_PER_HOST,
+            help='number of concurrent probes '
+                 '(defaults to settings.IMAGE_FETCH_MAX_PER_HOST)')
+
+    def get_queryset(self, options):
+        return filter_manuscripts(Page.objects.all(), options['manuscript'])
+
+    def handle(self, *args, **options):
+        urls = set(self.get_queryset(options).values_list('url', flat=True))
+        etags = dict(
+            PageImageMetadata.objects.filter(url__in=urls)
+            .values_list('url', 'etag'))
+        if not options['refresh']:
+            urls -= set(etags)
+
+        self.stdout.write(
+            f'Probing {len(urls)} page images '
+            f'({len(etags) if not options["refresh"] else 0} already probed)...')
+
+        probed = unchanged = failed = 0
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = dict(
+                (executor.submit(probe_image, url, etags.get(url)), url)
+                for url in urls)
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    metadata = future.result()
+                except ImageFetchError as e:
+                    failed += 1
+                    self.stderr.write(f'Failed to probe {url}: {e}')
+                    continue
+                if metadata is None:
+                    unchanged += 1
+                    continue
+                PageImageMetadata.store(url, metadata)
+                probed += 1
+
+        updated, updated_urls = 0, []
+        for metadata in PageImageMetadata.objects.filter(
+                url__in=self.get_queryset(options).filter(
+                    Q(width=0) | Q(height=0)).values('url'),
+                width__isnull=False, height__isnull=False):
+            count = Page.objects.filter(
+                Q(width=0) | Q(height=0), url=metadata.url,
+            ).update(width=metadata.width, height=metadata.height)
+            if count:
+                updated += count
+                updated_urls.append(metadata.url)
+
+        # bulk updates don't keep the chart examples in sync, or invalidate
+        #  cached responses and chart snapshots
+        if updated_urls:
+            ChartExample.sync(
+                Coordinates.objects.filter(page__url__in=updated_urls))
+            bump_generation(Page, Coordinates)
+            update_chart_snapshots()
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Probed {probed} page images in {elapsed:.1f}s; '
+            f'{unchanged} unchanged, {failed} failed; '
+            f'{updated} pages updated.'))
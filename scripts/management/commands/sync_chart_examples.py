@@ -0,0 +1,26 @@
+""" Rebuild the script chart examples table from Coordinates and Pages.
+
+    Chart examples (see `scripts.models.ChartExample`) are kept in sync as
+    examples and pages are saved; this is only necessary after changes
+    made behind the ORM's back, e.g. with SQL or bulk updates.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scripts.models import ChartExample, Coordinates
+from scripts.response_cache import bump_generation
+from scripts.snapshots import update_chart_snapshots
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ChartExample.objects.all().delete()
+            ChartExample.sync(Coordinates.objects.all())
+        bump_generation(Coordinates)
+        update_chart_snapshots()
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced {ChartExample.objects.count()} chart examples.'))
@@ -0,0 +1,60 @@
+""" Helpers shared by the management commands. """
+
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+import django
+from django.db import connections
+from django.db.models import Q
+
+
+def id_or_name_query(values, id_field, name_field):
+    """ A Q matching any of values, each an id (for id_field) or a name (for
+        name_field), as given to the --manuscript and --letter options.
+    """
+    query = Q()
+    for value in values:
+        if value.isdigit():
+            query |= Q(**{id_field: int(value)})
+        else:
+            query |= Q(**{name_field: value})
+    return query
+
+
+def filter_manuscripts(queryset, manuscripts, slug_field='manuscript__slug'):
+    """ Filter queryset to the manuscripts (ids or slugs) given, if any. """
+    if not manuscripts:
+        return queryset
+    return queryset.filter(
+        id_or_name_query(manuscripts, 'manuscript_id', slug_field))
+
+
+def filter_letters(queryset, letters):
+    """ Filter queryset to the letters (ids or names) given, if any. """
+    if not letters:
+        return queryset
+    return queryset.filter(
+        id_or_name_query(letters, 'letter_id', 'letter__letter'))
+
+
+def run_tasks(func, tasks, processes, report):
+    """ Call func(*args) for each (key, args) in tasks, across a pool of
+        processes workers (or in this process if processes is 1), and call
+        report(key, future) as each finishes.
+    """
+    if processes > 1:
+        # the workers don't use the database; don't share connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=django.setup) as executor:
+            futures = dict(
+                (executor.submit(func, *args), key) for key, args in tasks)
+            for future in as_completed(futures):
+                report(futures[future], future)
+    else:
+        for key, args in tasks:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+            report(key, future)
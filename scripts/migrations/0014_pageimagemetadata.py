@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scripts', '0013_coordinates_orientation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageImageMetadata',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(unique=True)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('format', models.CharField(blank=True, max_length=16, null=True)),
+                ('width', models.IntegerField(blank=True, null=True)),
+                ('height', models.IntegerField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('probed_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Page image metadata',
+            },
+        ),
+    ]
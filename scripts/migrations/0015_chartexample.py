@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scripts', '0014_pageimagemetadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartExample',
+            fields=[
+                ('coordinates', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='chart_example', serialize=False, to='scripts.Coordinates')),
+                ('manuscript_id', models.PositiveSmallIntegerField()),
+                ('letter_id', models.IntegerField()),
+                ('priority', models.PositiveSmallIntegerField()),
+                ('top', models.IntegerField()),
+                ('left', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('width', models.IntegerField()),
+                ('binary_url', models.URLField(blank=True, null=True)),
+                ('page_number', models.CharField(max_length=255)),
+                ('page_url', models.URLField()),
+                ('page_height', models.IntegerField()),
+                ('page_width', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chartexample',
+            index=models.Index(fields=['manuscript_id', 'letter_id', 'priority'], name='scripts_cha_manuscr_6ec444_idx'),
+        ),
+    ]
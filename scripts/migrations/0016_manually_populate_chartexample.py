@@ -0,0 +1,45 @@
+# Manual data migration created by hand
+
+from django.db import migrations
+
+
+# chart example field: Coordinates lookup
+SOURCE_FIELDS = {
+    'coordinates_id': 'id',
+    'manuscript_id': 'manuscript_id',
+    'letter_id': 'letter_id',
+    'priority': 'priority',
+    'top': 'top',
+    'left': 'left',
+    'height': 'height',
+    'width': 'width',
+    'binary_url': 'binary_url',
+    'page_number': 'page__number',
+    'page_url': 'page__url',
+    'page_height': 'page__height',
+    'page_width': 'page__width',
+}
+
+
+def populate_chart_examples(apps, schema_editor):
+    # We can't import the models directly as they may be different
+    # versions than this migration expects. We use the historical versions.
+    ChartExample = apps.get_model('scripts', 'ChartExample')
+    Coordinates = apps.get_model('scripts', 'Coordinates')
+
+    ChartExample.objects.bulk_create(
+        (ChartExample(**dict(zip(SOURCE_FIELDS, values)))
+         for values in Coordinates.objects.filter(priority__isnull=False)
+         .values_list(*SOURCE_FIELDS.values())),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scripts', '0015_chartexample'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_chart_examples, migrations.RunPython.noop),
+    ]
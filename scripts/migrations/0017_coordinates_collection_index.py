@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scripts', '0016_manually_populate_chartexample'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coordinates',
+            index=models.Index(fields=['manuscript_id', 'letter', 'priority'], name='scripts_coo_manuscr_8544f1_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='coordinates',
+            name='scripts_coo_letter__c669f3_idx',
+        ),
+    ]
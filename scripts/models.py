@@ -1,9 +1,14 @@
-from django.db import connections, models
+from django.db import connections, models, transaction
+from django.db.models.signals import post_save
 from django.db.models.sql.compiler import SQLCompiler
+from django.db.models.sql.where import AND
+from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 
-from .priority_field import PriorityField
-from .utils import get_sizes
+from .image_client import ImageFetchError
+from .priority_field import PriorityField, priorities_shifted
+from .pyramid import get_pyramid_store
+from .utils import probe_image
 
 
 class Manuscript(models.Model):
@@ -45,12 +50,73 @@ class Page(models.Model):
 
     def save(self, *args, **kwargs):
         if self.url and not (self.height and self.width):
-            _, (width, height) = get_sizes(self.url)
-            self.height |= height
-            self.width |= width
+            metadata = PageImageMetadata.for_url(self.url)
+            if metadata is not None:
+                self.height = self.height or metadata.height
+                self.width = self.width or metadata.width
         # ensure no spaces
         self.number = ''.join(self.number.split())
+        old_url = getattr(self, '_loaded_url', None)
         super().save(*args, **kwargs)
+        self._loaded_url = self.url
+        if old_url and old_url != self.url:
+            self.delete_stale_pyramid(old_url)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the URL as loaded, so that save can tell it's changed
+        url = dict(zip(field_names, values)).get('url')
+        instance._loaded_url = None if url is models.DEFERRED else url
+        return instance
+
+    def delete_stale_pyramid(self, old_url):
+        """ Delete the pyramid (if any) of a page whose URL has changed from
+            old_url, unless another page still refers to it.  The pyramid of
+            the new URL is left to `manage.py build_pyramids`.
+        """
+        pyramid_store = get_pyramid_store()
+        if (pyramid_store and pyramid_store.exists(old_url) and
+                not Page.objects.filter(url=old_url).exists()):
+            pyramid_store.delete(old_url)
+
+
+class PageImageMetadata(models.Model):
+    """ The size, format, dimensions and ETag of a page image, as probed by
+        `scripts.utils.probe_image` (see also the `probe_page_sizes`
+        command), so that an image is only probed once.
+    """
+    url = models.URLField(unique=True)
+    size = models.BigIntegerField(blank=True, null=True)
+    format = models.CharField(blank=True, null=True, max_length=16)
+    width = models.IntegerField(blank=True, null=True)
+    height = models.IntegerField(blank=True, null=True)
+    etag = models.CharField(blank=True, null=True, max_length=255)
+    probed_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Page image metadata'
+
+    def __str__(self):
+        return f'{self.url} ({self.width}x{self.height})'
+
+    @classmethod
+    def store(cls, url, metadata):
+        return cls.objects.update_or_create(url=url, defaults=metadata)[0]
+
+    @classmethod
+    def for_url(cls, url):
+        """ Return the metadata for url, probing the image if it hasn't been
+            probed already; return None if the image can't be fetched.
+        """
+        try:
+            return cls.objects.get(url=url)
+        except cls.DoesNotExist:
+            pass
+        try:
+            return cls.store(url, probe_image(url))
+        except ImageFetchError:
+            return None
 
 
 class Letter(models.Model):
@@ -65,12 +131,29 @@ class Letter(models.Model):
 
 class PriorityNullsLastSQLCompiler(SQLCompiler):
     """ Custom SQL compiler that prepends `priority IS NULL, ` to all
-        `ORDER BY` clauses that reference the `priority` field.
+        `ORDER BY` clauses that reference the `priority` field, unless the
+        query only selects non-null priorities (when it's redundant, and
+        would stop the ordering being read from an index).
     """
 
+    NON_NULL_LOOKUPS = ('exact', 'gt', 'gte', 'lt', 'lte', 'in', 'range')
+
+    def excludes_null_priorities(self):
+        where = self.query.where
+        if where.connector != AND or where.negated:
+            return False
+        priority = self.query.model._meta.get_field('priority')
+        for lookup in where.children:
+            if getattr(getattr(lookup, 'lhs', None), 'target', None) != priority:
+                continue
+            if (lookup.lookup_name in self.NON_NULL_LOOKUPS or
+                    (lookup.lookup_name == 'isnull' and not lookup.rhs)):
+                return True
+        return False
+
     def get_order_by(self):
         result = super().get_order_by()
-        if result:
+        if result and not self.excludes_null_priorities():
             new_result = []
             for (expr, (sql, params, is_ref)) in result:
                 if expr.field == self.query.model._meta.get_field('priority'):
@@ -137,7 +220,9 @@ class Coordinates(models.Model):
         verbose_name_plural = 'Coordinates'
         indexes = [
             models.Index(fields=('priority',)),
-            models.Index(fields=('letter', 'manuscript_id'))
+            # priority collections, in priority order: the script chart
+            #  (atlas) query and PriorityField's counts and shifts
+            models.Index(fields=('manuscript_id', 'letter', 'priority')),
         ]
 
     def __str__(self):
@@ -149,3 +234,108 @@ class Coordinates(models.Model):
         self.manuscript_id = self.page.manuscript_id
 
         super().save(*args, **kwargs)
+
+
+class ChartExample(models.Model):
+    """ A denormalized copy of the script chart fields of a prioritized
+        example (i.e. one with a priority), so that the script chart is read
+        from a single table with an index on exactly the fields it's queried
+        by.  Chart examples are kept in sync with their Coordinates and Page
+        by the signal receivers below; code that bulk updates either should
+        call `sync` itself.
+    """
+    coordinates = models.OneToOneField(
+        to='Coordinates', related_name='chart_example', primary_key=True,
+        on_delete=models.CASCADE)
+    manuscript_id = models.PositiveSmallIntegerField()
+    letter_id = models.IntegerField()
+    priority = models.PositiveSmallIntegerField()
+    top = models.IntegerField()
+    left = models.IntegerField()
+    height = models.IntegerField()
+    width = models.IntegerField()
+    binary_url = models.URLField(blank=True, null=True)
+    page_number = models.CharField(max_length=255)
+    page_url = models.URLField()
+    page_height = models.IntegerField()
+    page_width = models.IntegerField()
+
+    # chart example field: Coordinates lookup
+    SOURCE_FIELDS = {
+        'coordinates_id': 'id',
+        'manuscript_id': 'manuscript_id',
+        'letter_id': 'letter_id',
+        'priority': 'priority',
+        'top': 'top',
+        'left': 'left',
+        'height': 'height',
+        'width': 'width',
+        'binary_url': 'binary_url',
+        'page_number': 'page__number',
+        'page_url': 'page__url',
+        'page_height': 'page__height',
+        'page_width': 'page__width',
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('manuscript_id', 'letter_id', 'priority')),
+        ]
+
+    def __str__(self):
+        return f'{self.coordinates_id} [{self.priority}]'
+
+    @classmethod
+    def sync(cls, coordinates):
+        """ Bring the chart examples of a queryset of Coordinates up to date.
+        """
+        coordinates_ids = coordinates.values('id')
+        with transaction.atomic():
+            cls.objects.filter(coordinates_id__in=coordinates_ids).delete()
+            cls.objects.bulk_create(
+                cls(**dict(zip(cls.SOURCE_FIELDS, values)))
+                for values in Coordinates.objects.filter(
+                    id__in=coordinates_ids, priority__isnull=False
+                ).values_list(*cls.SOURCE_FIELDS.values()))
+
+    @classmethod
+    def sync_raw(cls, coordinates):
+        """ Bring the chart example of Coordinates saved raw (i.e. loaded
+            as is, by loaddata) up to date from the instance itself, which
+            is much quicker for whole database dumps.
+        """
+        if coordinates.priority is None:
+            cls.objects.filter(pk=coordinates.pk).delete()
+            return
+        page = Page.objects.filter(pk=coordinates.page_id).values_list(
+            'number', 'url', 'height', 'width').first()
+        if page is None:
+            # not loaded yet; synced when it is
+            return
+        page_number, page_url, page_height, page_width = page
+        cls(coordinates_id=coordinates.pk,
+            manuscript_id=coordinates.manuscript_id,
+            letter_id=coordinates.letter_id, priority=coordinates.priority,
+            top=coordinates.top, left=coordinates.left,
+            height=coordinates.height, width=coordinates.width,
+            binary_url=coordinates.binary_url, page_number=page_number,
+            page_url=page_url, page_height=page_height,
+            page_width=page_width).save()
+
+
+@receiver(post_save, sender=Coordinates)
+def sync_coordinates_chart_example(sender, instance, raw=False, **kwargs):
+    if raw:
+        ChartExample.sync_raw(instance)
+    else:
+        ChartExample.sync(Coordinates.objects.filter(pk=instance.pk))
+
+
+@receiver(priorities_shifted, sender=Coordinates)
+def sync_shifted_chart_examples(sender, queryset, **kwargs):
+    ChartExample.sync(queryset)
+
+
+@receiver(post_save, sender=Page)
+def sync_page_chart_examples(sender, instance, **kwargs):
+    ChartExample.sync(instance.coordinates.all())
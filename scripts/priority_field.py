@@ -12,11 +12,19 @@ This custom field exists to manage the priority value of individual
 * non-null values are kept consecutive (continuous, no holes, no duplicates)
   within a collection, beginning always with 1
 
+The priorities of the other objects in a collection are shifted with bulk
+updates, which send no `post_save` signals; `priorities_shifted` is sent
+instead, with the (whole) collection as `queryset`.
+
 """
 
 
 from django.db import models
 from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+
+
+priorities_shifted = Signal(providing_args=['queryset'])
 
 
 class PriorityField(models.PositiveSmallIntegerField):
@@ -178,6 +186,8 @@ class PriorityField(models.PositiveSmallIntegerField):
                     })\
                     .update(**{self.name: models.F(self.name) + 1})
 
+        self.send_shifted(instance)
+
         # update cached values
         setattr(instance, self._cache_name, (new_priority, new_priority))
 
@@ -224,3 +234,8 @@ class PriorityField(models.PositiveSmallIntegerField):
             queryset = self.get_collection(instance)
             queryset.filter(**{f'{self.name}__gt': saved_priority})\
                     .update(**{self.name: models.F(self.name) - 1})
+            self.send_shifted(instance)
+
+    def send_shifted(self, instance):
+        priorities_shifted.send(
+            sender=type(instance), queryset=self.get_collection(instance))
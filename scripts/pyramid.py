@@ -0,0 +1,249 @@
+"""
+Tiled, multi-resolution (Deep Zoom) pyramids of page images.
+
+A page image is converted once (see `manage.py build_pyramids`) into a Deep
+Zoom Image: a `.dzi` descriptor and, for every level from 1x1 pixel up to
+full resolution, a grid of `PYRAMID_TILE_SIZE` tiles.  A crop then needs only
+the tiles of the coarsest level that still has enough resolution and that
+intersect its box, rather than a decode of the whole scan.
+
+Pyramids are stored in `settings.PYRAMID_ROOT`, named by a digest of the
+page URL:
+
+    <root>/<name[:2]>/<name>.dzi
+    <root>/<name[:2]>/<name>_files/<level>/<column>_<row>.<format>
+
+so a page whose URL changes simply has no pyramid until it's rebuilt.  The
+`.dzi` descriptor is written last and removed first, so its presence marks a
+complete pyramid.  The same files are served under `/api/pyramids/`, where
+any Deep Zoom viewer can read them.
+
+"""
+
+
+import hashlib
+import math
+import os
+import pathlib
+import shutil
+import tempfile
+from io import BytesIO
+from xml.etree import ElementTree
+
+from django.conf import settings
+
+from PIL import Image
+
+from scripts.files import DIRECTORY_MODE, write_file
+from scripts.image_cache import open_page_image
+
+
+DZI_NAMESPACE = 'http://schemas.microsoft.com/deepzoom/2008'
+
+# tile formats: (PIL format, content type)
+PYRAMID_TILE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+
+def pyramid_name(page_url):
+    return hashlib.sha256(page_url.encode('utf-8')).hexdigest()
+
+
+def max_level(size):
+    """ Return the index of the full resolution level of a pyramid of an
+        image of size.
+    """
+    return int(math.ceil(math.log2(max(max(size), 1))))
+
+
+def level_size(size, level, top_level):
+    factor = 2 ** (top_level - level)
+    return tuple(int(math.ceil(dimension / factor)) for dimension in size)
+
+
+class PyramidStore:
+
+    def __init__(self, root, tile_size=256, tile_format='png'):
+        if tile_format not in PYRAMID_TILE_FORMATS:
+            raise ValueError(f'Unsupported tile format: {tile_format}')
+        self.root = pathlib.Path(root)
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+
+    def dzi_path(self, name):
+        return self.root / name[:2] / f'{name}.dzi'
+
+    def files_path(self, name):
+        return self.root / name[:2] / f'{name}_files'
+
+    def tile_path(self, name, level, column, row, tile_format):
+        return (self.files_path(name) / str(level) /
+                f'{column}_{row}.{tile_format}')
+
+    def exists(self, page_url):
+        return self.dzi_path(pyramid_name(page_url)).exists()
+
+    def info(self, page_url):
+        """ Return a dict of the width, height, tile size and tile format of
+            the pyramid of page_url, or None if there isn't one.
+        """
+        try:
+            root = ElementTree.parse(
+                str(self.dzi_path(pyramid_name(page_url)))).getroot()
+        except (OSError, ElementTree.ParseError):
+            return None
+        size = root.find(f'{{{DZI_NAMESPACE}}}Size')
+        return {
+            'width': int(size.get('Width')),
+            'height': int(size.get('Height')),
+            'tile_size': int(root.get('TileSize')),
+            'format': root.get('Format'),
+        }
+
+    def build(self, page_url, image):
+        """ Build (or rebuild) the pyramid of page_url from its full
+            resolution image.
+        """
+        name = pyramid_name(page_url)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        size = image.size
+        top_level = max_level(size)
+        pil_format = PYRAMID_TILE_FORMATS[self.tile_format][0]
+
+        shard = self.dzi_path(name).parent
+        shard.mkdir(parents=True, exist_ok=True)
+        tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=shard, suffix='.tmp'))
+        os.chmod(tmp_dir, DIRECTORY_MODE)
+        try:
+            for level in range(top_level, -1, -1):
+                width, height = level_size(size, level, top_level)
+                if image.size != (width, height):
+                    image = image.resize((width, height), Image.BOX)
+                level_dir = tmp_dir / str(level)
+                level_dir.mkdir()
+                for row in range(int(math.ceil(height / self.tile_size))):
+                    for column in range(int(math.ceil(width / self.tile_size))):
+                        x, y = column * self.tile_size, row * self.tile_size
+                        tile = image.crop((
+                            x, y, min(x + self.tile_size, width),
+                            min(y + self.tile_size, height)))
+                        tile.save(
+                            level_dir / f'{column}_{row}.{self.tile_format}',
+                            pil_format)
+
+            self.delete(page_url)
+            os.replace(tmp_dir, self.files_path(name))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        dzi = ElementTree.Element('Image', {
+            'xmlns': DZI_NAMESPACE,
+            'TileSize': str(self.tile_size),
+            'Overlap': '0',
+            'Format': self.tile_format,
+        })
+        ElementTree.SubElement(dzi, 'Size', {
+            'Width': str(size[0]), 'Height': str(size[1])})
+        output = BytesIO()
+        ElementTree.ElementTree(dzi).write(
+            output, encoding='UTF-8', xml_declaration=True)
+        write_file(self.dzi_path(name), output.getvalue())
+
+    def delete(self, page_url):
+        self.delete_name(pyramid_name(page_url))
+
+    def names(self):
+        """ Return the names of all the pyramids in the store. """
+        return [path.stem for path in self.root.glob('*/*.dzi')]
+
+    def delete_name(self, name):
+        try:
+            self.dzi_path(name).unlink()
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self.files_path(name), ignore_errors=True)
+
+    def read_tiles(self, page_url, box, scale=1.0):
+        """ Read the tiles that intersect box (in full resolution
+            coordinates) from the coarsest level of the pyramid of page_url
+            with enough resolution for scale.  Return the image of the tiles,
+            box relative to that image (still in full resolution coordinates)
+            and the factor by which the level is reduced -- i.e. the arguments
+            to `scripts.crops.scale_crop` -- or None if there's no pyramid for
+            the page or box isn't entirely within it.
+        """
+        info = self.info(page_url)
+        if info is None:
+            return None
+        left, upper, right, lower = box
+        if not (0 <= left < right <= info['width'] and
+                0 <= upper < lower <= info['height']):
+            return None
+
+        size = (info['width'], info['height'])
+        top_level = max_level(size)
+        reduce = 1
+        while reduce * 2 * scale <= 1 and reduce * 2 <= 2 ** top_level:
+            reduce *= 2
+        level = top_level - int(math.log2(reduce))
+        width, height = level_size(size, level, top_level)
+
+        tile_size = info['tile_size']
+        x0, y0 = left // reduce, upper // reduce
+        x1 = min(int(math.ceil(right / reduce)), width)
+        y1 = min(int(math.ceil(lower / reduce)), height)
+        columns = range(x0 // tile_size, (x1 - 1) // tile_size + 1)
+        rows = range(y0 // tile_size, (y1 - 1) // tile_size + 1)
+
+        origin = (columns[0] * tile_size, rows[0] * tile_size)
+        canvas = None
+        for row in rows:
+            for column in columns:
+                tile = Image.open(self.tile_path(
+                    pyramid_name(page_url), level, column, row,
+                    info['format']))
+                if canvas is None:
+                    canvas = Image.new(tile.mode, (
+                        min(columns[-1] * tile_size + tile_size, width) -
+                        origin[0],
+                        min(rows[-1] * tile_size + tile_size, height) -
+                        origin[1]))
+                canvas.paste(tile, (column * tile_size - origin[0],
+                                    row * tile_size - origin[1]))
+
+        shifted_box = (left - origin[0] * reduce, upper - origin[1] * reduce,
+                       right - origin[0] * reduce, lower - origin[1] * reduce)
+        return canvas, shifted_box, reduce
+
+
+_pyramid_store = None
+
+
+def get_pyramid_store():
+    """ Return the pyramid store, or None if `settings.PYRAMID_ROOT` isn't
+        set.
+    """
+    global _pyramid_store
+
+    if not settings.PYRAMID_ROOT:
+        return None
+    if (_pyramid_store is None or
+            str(_pyramid_store.root) != str(settings.PYRAMID_ROOT) or
+            _pyramid_store.tile_size != settings.PYRAMID_TILE_SIZE or
+            _pyramid_store.tile_format != settings.PYRAMID_TILE_FORMAT):
+        _pyramid_store = PyramidStore(
+            settings.PYRAMID_ROOT, settings.PYRAMID_TILE_SIZE,
+            settings.PYRAMID_TILE_FORMAT)
+    return _pyramid_store
+
+
+def build_page_pyramid(page_url, pyramid_store=None):
+    """ Build the pyramid of the page at page_url from its image. """
+    pyramid_store = pyramid_store or get_pyramid_store()
+    image = open_page_image(page_url)
+    image.load()
+    pyramid_store.build(page_url, image)
@@ -0,0 +1,27 @@
+""" Optional DRF renderers.
+
+    `MessagePackRenderer` is only available (i.e. not None) if the msgpack
+    package is installed.
+"""
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is optional
+    msgpack = None
+
+
+class _MessagePackRenderer(BaseRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+MessagePackRenderer = _MessagePackRenderer if msgpack is not None else None
@@ -0,0 +1,195 @@
+"""
+Generation-based caching of read API responses.
+
+Each model has a generation token in the cache, replaced whenever any of its
+objects is saved or deleted, or `PriorityField` shifts priorities with a bulk
+update (see the receivers connected in `scripts.apps`).  The data of DRF
+responses is cached under a key made of the request (path and normalized
+query params) and the generations of the models it's built from, so it's
+served from the cache until -- and only until -- one of those models
+changes; there's no timeout.  Code that changes objects behind the ORM's
+back (e.g. with `QuerySet.update`) should call `bump_generation` itself.
+Responses are still rendered per request, so content negotiation (and the
+browsable API) work as usual.
+
+The same key makes a cheap validator: responses (other than the browsable
+API's, which differ per user) carry an ETag derived from it and the
+negotiated media type, so requests that send back a matching ETag are
+answered with a 304 before any query or serialization -- at the cost of
+reading the generations.  As only a successful response could have issued
+it, a matching ETag also vouches for the request.  Other conditional
+requests (e.g. If-Modified-Since) are only answered once the response is
+known to be successful.  Last-Modified, the time of the latest generation,
+has whole-second precision, so it's only sent (and If-Modified-Since only
+honoured) once that generation is at least a second old: otherwise a change
+within the same second would pass for unchanged.
+
+Generations are random tokens rather than counters, so they never repeat,
+even if the cache or a test database is reset.  The cache is
+`settings.CACHES['default']`, which needs to be shared by all the server
+processes (and management commands) for their changes to invalidate each
+other's responses; so it defaults to the dummy cache, with which nothing is
+cached, rather than a per-process one.  As the dummy cache keeps no
+generations, its responses carry no validators (and no Cache-Control) either.
+
+"""
+
+
+import hashlib
+import json
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, parse_etags
+
+from rest_framework.response import Response
+
+
+def generation_key(model):
+    return f'generation:{model._meta.label}'
+
+
+def new_generation():
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def generation_time(generation):
+    """ Return the time (a timestamp) generation began. """
+    return float(generation.partition(':')[0])
+
+
+def bump_generation(*models):
+    """ Invalidate the cached responses that depend on models. """
+    cache.set_many(
+        dict((generation_key(model), new_generation()) for model in models),
+        None)
+
+
+def get_generations(models):
+    """ Return the generations of models, or None if the cache doesn't keep
+        them (as the dummy cache doesn't).
+    """
+    keys = [generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, new_generation(), None)
+            generation = cache.get(key)
+            if generation is None:
+                return None
+            generations[key] = generation
+    return [generations[key] for key in keys]
+
+
+def response_digest(request, generations):
+    spec = {
+        'path': request.path,
+        'params': sorted(
+            (param, sorted(values))
+            for param, values in request.query_params.lists()),
+        'generations': generations,
+    }
+    serialized = json.dumps(spec, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def response_validators(request, digest, generations):
+    """ Return the ETag and Last-Modified timestamp of a response, or
+        (None, None) for the browsable API.  There's no Last-Modified until
+        the latest generation is a second old.
+    """
+    if request.accepted_renderer.format == 'api':
+        return None, None
+    etag = f'"{digest}.{request.accepted_renderer.format}"'
+    last_modified = max(generation_time(_) for _ in generations)
+    if time.time() - last_modified < 1:
+        last_modified = None
+    return etag, last_modified
+
+
+def etag_matches(request, etag):
+    """ Return whether the request's If-None-Match lists etag (weakly
+        compared).
+    """
+    return any(
+        (_[2:] if _.startswith('W/') else _) == etag
+        for _ in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')))
+
+
+def patch_validators(response, etag, last_modified):
+    """ Add the validators to a response, and make clients revalidate it
+        before reusing it.
+    """
+    if etag is None:
+        return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept',))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cached_response(request, models, view, *args, **kwargs):
+    """ Return the response of view(request, *args, **kwargs) -- a DRF view
+        handler -- with its data from the cache if possible, or a 304 if the
+        request's validators match.  Only successful, unstreamed responses
+        are cached (and only successful ones validated); they're rendered (as
+        negotiated) as usual.
+    """
+    generations = get_generations(models)
+    if generations is None:
+        # without generations nothing can be cached or validated
+        return view(request, *args, **kwargs)
+    digest = response_digest(request, generations)
+    etag, last_modified = response_validators(request, digest, generations)
+
+    if etag is not None and etag_matches(request, etag):
+        return patch_validators(HttpResponseNotModified(), etag, last_modified)
+
+    key = f'response:{digest}'
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+    else:
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        # streamed responses (see `scripts.streaming`) are too large to cache
+        if not response.streaming:
+            cache.set(key, response.data, None)
+
+    if etag is not None:
+        response = get_conditional_response(
+            request, etag=etag, response=response,
+            last_modified=(None if last_modified is None
+                           else int(last_modified)))
+    return patch_validators(response, etag, last_modified)
+
+
+def cache_response(*models):
+    """ Decorate a DRF function view (under `api_view`) to cache its
+        responses, invalidated when any of models changes.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return cached_response(request, models, view, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """ Cache the GET responses of a DRF class-based view, invalidated when
+        any of `cache_models` changes.
+    """
+    cache_models = ()
+
+    def get(self, request, *args, **kwargs):
+        return cached_response(
+            request, self.cache_models, super().get, *args, **kwargs)
@@ -0,0 +1,189 @@
+"""
+Coalescing of concurrent upstream page image fetches.
+
+When a script chart loads, many crop requests for the same page arrive at
+once.  Rather than each of them downloading (and decoding) the same scan:
+
+* within a process, `SingleFlight` lets the first caller for a key do the
+  work while later, concurrent callers wait for and share its result (or
+  exception)
+* across processes, `fetch_page_content` takes an exclusive lock file per
+  page URL in `settings.PAGE_FETCH_SPOOL_ROOT`; the process that gets it
+  first downloads the image into the spool directory, and the others, once
+  they get the lock, read it from there
+
+Spooled images are only reused for `settings.PAGE_FETCH_SPOOL_TTL` seconds,
+so the spool never serves a stale scan for long; set
+`PAGE_FETCH_SPOOL_ROOT` to an empty value to coalesce within processes only.
+
+"""
+
+
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from scripts.image_client import get_image_client
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: coalesce within processes only
+    fcntl = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """ Return func(*args), unless a call for key is already in flight,
+            in which case wait for it and return its result (or raise its
+            exception) instead.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._in_flight[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class PageFetchSpool:
+
+    def __init__(self, root, ttl):
+        self.root = pathlib.Path(root)
+        self.ttl = ttl
+
+    def path(self, key):
+        return self.root / key
+
+    def get(self, key):
+        """ Return the spooled content for key, if it's fresh. """
+        path = self.path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, content):
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, self.path(key))
+        self.expire()
+
+    def expire(self):
+        """ Remove spooled content (and leftover temporary files) older than
+            the TTL.
+        """
+        now = time.time()
+        for path in self.root.iterdir():
+            try:
+                if (path.suffix != '.lock' and
+                        now - path.stat().st_mtime > self.ttl):
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def lock(self, key):
+        """ Hold an exclusive, inter-process lock for key.  The lock file is
+            removed on release, so the spool isn't left with one per page.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(f'{key}.lock')
+        while True:
+            lock_file = open(path, 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.samestat(
+                        os.fstat(lock_file.fileno()), os.stat(path)):
+                    break
+            except FileNotFoundError:
+                pass
+            # removed by its last holder while we waited: lock the new one
+            lock_file.close()
+        try:
+            yield
+        finally:
+            # removed while still locked, so waiters on it know to retry
+            path.unlink()
+            lock_file.close()
+
+
+page_fetches = SingleFlight()
+
+
+_spool = None
+
+
+def get_page_fetch_spool():
+    """ Return the page fetch spool, or None if cross-process coalescing is
+        disabled.
+    """
+    global _spool
+
+    if not settings.PAGE_FETCH_SPOOL_ROOT or fcntl is None:
+        return None
+    if (_spool is None or
+            str(_spool.root) != str(settings.PAGE_FETCH_SPOOL_ROOT) or
+            _spool.ttl != settings.PAGE_FETCH_SPOOL_TTL):
+        _spool = PageFetchSpool(
+            settings.PAGE_FETCH_SPOOL_ROOT, settings.PAGE_FETCH_SPOOL_TTL)
+    return _spool
+
+
+def _fetch_page_content(page_url):
+    spool = get_page_fetch_spool()
+    if spool is None:
+        return get_image_client().get(page_url)
+
+    key = hashlib.sha256(page_url.encode('utf-8')).hexdigest()
+    content = spool.get(key)
+    if content is None:
+        with spool.lock(key):
+            # another process may have fetched it while we waited
+            content = spool.get(key)
+            if content is None:
+                content = get_image_client().get(page_url)
+                spool.put(key, content)
+    return content
+
+
+def fetch_page_content(page_url):
+    """ Return the content of the page image at page_url, sharing the fetch
+        with any concurrent fetches of it in this or other processes.
+    """
+    return page_fetches.do(page_url, _fetch_page_content, page_url)
@@ -0,0 +1,171 @@
+"""
+Static, precompressed snapshots of the default script chart.
+
+Most visitors ask for the same chart: every displayed manuscript, every
+script letter and the default number of examples.  `manage.py
+build_chart_snapshots` writes it into `settings.CHART_SNAPSHOTS_ROOT`,
+along with the lists it's drawn from:
+
+* manuscripts.json: the displayed manuscripts, as `/api/manuscripts?display`
+* letters.json: the script letters, as a list of {"id", "letter"}
+* chart.json: the examples of those letters in those manuscripts, as
+  `/api/letters`
+
+Each file has gzip (and, if the brotli package is installed, brotli)
+compressed variants beside it, which whitenoise serves to clients that
+accept them, at `settings.CHART_SNAPSHOTS_URL` (see `scriptchart.wsgi`).
+
+Once the snapshots exist, saving or deleting manuscripts, pages, letters or
+examples (or shifting priorities) schedules their regeneration in a
+background thread, debounced: it runs `settings.CHART_SNAPSHOTS_DELAY`
+seconds after the last of a burst of changes.  Management commands, which
+may exit before then, call `update_chart_snapshots` instead; changes made
+behind the ORM's back should be followed by `manage.py
+build_chart_snapshots`.
+
+"""
+
+
+import gzip
+import logging
+import os
+import pathlib
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from rest_framework.renderers import JSONRenderer
+
+from scripts.files import write_file
+from scripts.letter_endpoint import DEFAULT_EXAMPLE_COUNT, get_chart_examples
+from scripts.models import Letter, Manuscript
+from scripts.serializers import ManuscriptSerializer
+
+try:
+    import brotli
+except ImportError:  # only gzip variants
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_snapshot_contents():
+    """ Return a dict of snapshot filename: JSON content. """
+    manuscripts = Manuscript.objects.filter(display=True).order_by('id')
+    letters = list(
+        Letter.objects.filter(is_script=True).order_by('id').values(
+            'id', 'letter'))
+    chart = get_chart_examples(
+        [manuscript.id for manuscript in manuscripts],
+        [letter['id'] for letter in letters], DEFAULT_EXAMPLE_COUNT)
+
+    renderer = JSONRenderer()
+    return {
+        'manuscripts.json': renderer.render(
+            ManuscriptSerializer(manuscripts, many=True).data),
+        'letters.json': renderer.render(letters),
+        'chart.json': renderer.render(chart),
+    }
+
+
+def compressed_variants(content):
+    """ Return a dict of filename suffix: compressed content. """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return variants
+
+
+def build_chart_snapshots(root=None):
+    """ Write the snapshots, and their compressed variants, into root
+        (defaults to `settings.CHART_SNAPSHOTS_ROOT`); return a dict of
+        filename: size.
+    """
+    root = pathlib.Path(root or settings.CHART_SNAPSHOTS_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+
+    sizes = {}
+    for name, content in get_snapshot_contents().items():
+        # the variants first, so they're never older than the snapshot
+        for suffix, compressed in compressed_variants(content).items():
+            write_file(root / f'{name}{suffix}', compressed)
+            sizes[f'{name}{suffix}'] = len(compressed)
+        write_file(root / name, content)
+        sizes[name] = len(content)
+    return sizes
+
+
+class Debouncer:
+
+    def __init__(self, func):
+        self.func = func
+        self._timer = None
+        self._token = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._timer is not None
+
+    def trigger(self, delay):
+        """ Call func in delay seconds, unless triggered again before then
+            (in which case, delay seconds after that).
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._token += 1
+            self._timer = threading.Timer(delay, self._run, [self._token])
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """ Cancel the pending call, if any. """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._token += 1
+
+    def _run(self, token):
+        with self._lock:
+            if token != self._token:  # superseded
+                return
+            self._timer = None
+        self.func()
+
+
+def rebuild_chart_snapshots():
+    try:
+        build_chart_snapshots()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to rebuild the chart snapshots')
+    finally:
+        # don't leave the timer thread's connection open
+        connection.close()
+
+
+snapshot_rebuilds = Debouncer(rebuild_chart_snapshots)
+
+
+def snapshots_built():
+    return bool(settings.CHART_SNAPSHOTS_ROOT and
+                os.path.isdir(settings.CHART_SNAPSHOTS_ROOT))
+
+
+def schedule_chart_snapshots():
+    """ Schedule the regeneration of the snapshots, if they've been built.
+    """
+    if snapshots_built():
+        snapshot_rebuilds.trigger(settings.CHART_SNAPSHOTS_DELAY)
+
+
+def update_chart_snapshots():
+    """ Regenerate the snapshots now, if they've been built (for management
+        commands, which may exit before a scheduled regeneration).
+    """
+    snapshot_rebuilds.cancel()
+    if snapshots_built():
+        build_chart_snapshots()
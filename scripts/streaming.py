@@ -0,0 +1,81 @@
+"""
+Streaming JSON responses for large lists.
+
+Rather than serializing every object of a queryset, and then rendering the
+whole structure, at once, large JSON responses are written incrementally
+through a `StreamingHttpResponse`: objects are read from the database in
+chunks (with `QuerySet.iterator`) and each chunk is serialized and rendered
+as it's sent, so the first bytes go out straight away, however long the
+list, and no more than a chunk of model instances and their JSON are held
+at once.
+
+How flat memory use stays depends on the database driver.  With SQLite and
+PostgreSQL, `iterator` fetches rows from the database as it goes; but the
+MySQL drivers (PyMySQL included) use buffered cursors, so the database's
+whole result is still read into memory (as rows, though not as model
+instances or JSON) before the first chunk goes out.
+
+Responses of up to `settings.STREAMING_THRESHOLD` objects are built as
+usual, so they can still be cached (see `scripts.response_cache`); larger
+ones aren't, but are still validated.  Only JSON is streamed; the
+browsable API renders as usual.  The streamed JSON is rendered by DRF's
+`JSONRenderer`, so it's identical to what would have been rendered.
+
+"""
+
+
+from itertools import chain, islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+STREAMING_CHUNK_SIZE = 500
+
+
+def render_json(data):
+    return JSONRenderer().render(data)
+
+
+def accepts_streaming(request):
+    """ Return whether the response to a DRF request can be streamed. """
+    return request.accepted_renderer.format == 'json'
+
+
+def stream_json_array(items, chunk_size=STREAMING_CHUNK_SIZE):
+    """ Yield the JSON array of items, chunk_size items at a time. """
+    items = iter(items)
+    yield b'['
+    for index, chunk in enumerate(
+            iter(lambda: list(islice(items, chunk_size)), [])):
+        yield (b',' if index else b'') + render_json(chunk)[1:-1]
+    yield b']'
+
+
+def streaming_json_response(chunks):
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+class StreamingListMixin:
+    """ Stream the JSON responses of a DRF list view with more than
+        `settings.STREAMING_THRESHOLD` objects.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not accepts_streaming(request):
+            return super().list(request, *args, **kwargs)
+
+        objects = self.filter_queryset(self.get_queryset()).iterator(
+            chunk_size=STREAMING_CHUNK_SIZE)
+        # decide from the first rows, so small lists cost no extra query
+        head = list(islice(objects, settings.STREAMING_THRESHOLD + 1))
+        if len(head) <= settings.STREAMING_THRESHOLD:
+            return Response(self.get_serializer(head, many=True).data)
+
+        serializer = self.get_serializer()
+        return streaming_json_response(stream_json_array(
+            serializer.to_representation(obj)
+            for obj in chain(head, objects)))
@@ -0,0 +1,118 @@
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import override_settings
+
+from PIL import Image
+
+from scripts.image_cache import IMAGES_HOST, page_image_cache
+
+
+class LocalImagesMixin:
+    """ Serve page images from a temporary `IMAGES_ROOT` so that tests never
+        go over the network, and cache crops, atlases, pyramids and
+        thumbnails in temporary directories.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.images_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.images_root)
+        self.crop_cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.crop_cache_root)
+        self.atlas_cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.atlas_cache_root)
+        self.pyramid_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pyramid_root)
+        self.thumbnail_cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.thumbnail_cache_root)
+        settings_override = override_settings(
+            IMAGES_ROOT=self.images_root,
+            CROP_CACHE_ROOT=self.crop_cache_root,
+            ATLAS_CACHE_ROOT=self.atlas_cache_root,
+            PYRAMID_ROOT=self.pyramid_root,
+            THUMBNAIL_CACHE_ROOT=self.thumbnail_cache_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        page_image_cache.clear()
+        self.addCleanup(page_image_cache.clear)
+
+    def make_page_image(self, name='page.jpg', size=(400, 300), format=None):
+        """ Write a test image into IMAGES_ROOT and return its page URL. """
+        path = pathlib.Path(self.images_root) / 'manuscripts' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        image = Image.new('RGB', size, 'white')
+        for x in range(0, size[0], 10):
+            for y in range(0, size[1], 10):
+                image.putpixel((x, y), (x % 256, y % 256, 0))
+        image.save(path, format=format)
+        return f'{IMAGES_HOST}manuscripts/{name}'
+
+
+class ImageServerMixin:
+    """ Serve responses from a local HTTP server: `self.responses` maps
+        paths to (status, body), and `self.requests` records the path and
+        headers of every request made.  Range requests are honoured if
+        `self.accept_ranges` is set, a path's ETag (if any) is taken from
+        `self.etags`, and responses are delayed by `self.delay` seconds.
+        Fetched page images are spooled in a temporary directory.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.responses = {}
+        self.etags = {}
+        self.accept_ranges = False
+        self.delay = 0
+        self.requests = []
+        test = self
+
+        self.spool_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_root)
+        settings_override = override_settings(
+            PAGE_FETCH_SPOOL_ROOT=self.spool_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                test.requests.append((self.path, dict(self.headers)))
+                time.sleep(test.delay)
+                status, body = test.responses.get(self.path, (404, b''))
+                etag = test.etags.get(self.path)
+                headers = {'ETag': etag} if etag else {}
+
+                if etag and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                elif (status == 200 and test.accept_ranges and
+                        self.headers.get('Range')):
+                    first, last = self.headers['Range'][6:].split('-')
+                    first, last = int(first), min(int(last), len(body) - 1)
+                    headers['Content-Range'] = \
+                        f'bytes {first}-{last}/{len(body)}'
+                    status, body = 206, body[first:last + 1]
+
+                self.send_response(status)
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
@@ -0,0 +1,111 @@
+import asyncio
+import json
+from io import BytesIO
+
+from django.test import TestCase
+
+from PIL import Image
+
+from scriptchart.asgi import application
+from scripts.pyramid import get_pyramid_store
+from scripts.tests.helpers import ImageServerMixin, LocalImagesMixin
+
+
+def call_asgi(path, query_string='', method='GET', headers=()):
+    """ Make a request of the ASGI application; return the status, headers
+        and body of the response.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query_string.encode('latin-1'),
+        'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    start = messages[0]
+    headers = dict((name.decode('latin-1').lower(), value.decode('latin-1'))
+                   for name, value in start['headers'])
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], headers, body
+
+
+class AsyncCropTests(ImageServerMixin, LocalImagesMixin, TestCase):
+
+    def test_local_crop(self):
+        page_url = self.make_page_image()
+        status, headers, body = call_asgi(
+            '/api/crop', f'page_url={page_url}&x=10&y=20&w=30&h=40')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'image/png')
+        self.assertEqual(Image.open(BytesIO(body)).size, (30, 40))
+
+        status, _, body = call_asgi(
+            '/api/crop', f'page_url={page_url}&x=10&y=20&w=30&h=40',
+            headers=[('If-None-Match', headers['etag'])])
+        self.assertEqual((status, body), (304, b''))
+
+    def test_fetched_crop(self):
+        output = BytesIO()
+        Image.new('RGB', (200, 100), 'red').save(output, 'JPEG')
+        self.responses['/page.jpg'] = (200, output.getvalue())
+
+        query = (f'page_url={self.url("/page.jpg")}&x=0&y=0&w=100&h=50'
+                 '&format=jpeg&scale=0.5')
+        for _ in range(2):
+            status, headers, body = call_asgi('/api/crop', query)
+            self.assertEqual(status, 200)
+            self.assertEqual(Image.open(BytesIO(body)).size, (50, 25))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_pyramid_crop(self):
+        page_url = self.url('/page.jpg')
+        get_pyramid_store().build(page_url, Image.new('RGB', (200, 100)))
+        status, _, body = call_asgi(
+            '/api/crop', f'page_url={page_url}&x=10&y=20&w=30&h=40')
+        self.assertEqual(status, 200)
+        self.assertEqual(Image.open(BytesIO(body)).size, (30, 40))
+        # read from the pyramid's tiles, not fetched
+        self.assertEqual(self.requests, [])
+
+    def test_errors(self):
+        status, _, body = call_asgi(
+            '/api/crop', f'page_url={self.url("/missing.jpg")}&w=10&h=10')
+        self.assertEqual(status, 502)
+        self.assertIn('error', json.loads(body))
+
+        status, _, _ = call_asgi('/api/crop', 'x=a')
+        self.assertEqual(status, 400)
+
+        status, headers, _ = call_asgi('/api/crop', method='POST')
+        self.assertEqual((status, headers['allow']), (405, 'GET, HEAD'))
+
+    def test_cors(self):
+        page_url = self.make_page_image()
+        query = f'page_url={page_url}&x=10&y=20&w=30&h=40'
+        status, headers, _ = call_asgi(
+            '/api/crop', query, headers=[('Origin', 'http://example.com')])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['access-control-allow-origin'], '*')
+        self.assertIn('Origin', headers['vary'])
+
+        status, headers, body = call_asgi(
+            '/api/crop', query, method='OPTIONS',
+            headers=[('Origin', 'http://example.com'),
+                     ('Access-Control-Request-Method', 'GET')])
+        self.assertEqual((status, body), (200, b''))
+        self.assertEqual(headers['access-control-allow-origin'], '*')
+        self.assertIn('GET', headers['access-control-allow-methods'])
+
+    def test_other_paths_served_by_wsgi_application(self):
+        status, _, _ = call_asgi('/no/such/path')
+        self.assertEqual(status, 404)
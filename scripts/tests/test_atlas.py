@@ -0,0 +1,66 @@
+from io import BytesIO
+
+from django.test import TestCase
+
+from PIL import Image
+
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+
+
+class AtlasTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.letters = [Letter.objects.create(letter=_) for _ in 'ab']
+        self.page = Page.objects.create(
+            manuscript=self.manuscript, number='1',
+            url=self.make_page_image(), height=300, width=400)
+        for i, letter in enumerate(self.letters):
+            for priority in (1, 2):
+                Coordinates.objects.create(
+                    page=self.page, letter=letter, priority=priority,
+                    top=10 * i, left=20 * priority, height=40, width=30)
+
+        letter_ids = '|'.join(str(letter.id) for letter in self.letters)
+        self.url = (f'/api/letters/atlas?ms_ids={self.manuscript.id}'
+                    f'&letter_ids={letter_ids}&count=2')
+
+    def test_atlas(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        atlas = response.json()
+
+        cells = atlas['mss'][str(self.manuscript.id)]
+        self.assertEqual(len(cells), 2)
+        self.assertTrue(all(len(examples) == 2 for examples in cells.values()))
+
+        image_response = self.client.get(atlas['image'])
+        self.assertEqual(image_response.status_code, 200)
+        image = Image.open(BytesIO(b''.join(image_response.streaming_content)))
+        self.assertEqual(image.size, (atlas['width'], atlas['height']))
+        self.assertEqual(image.size, (4 * 30, 40))
+
+    def test_atlas_is_cached(self):
+        first = self.client.get(self.url).json()
+        second = self.client.get(self.url).json()
+        self.assertEqual(first, second)
+
+    def test_atlas_invalidated_by_changes(self):
+        digest = self.client.get(self.url).json()['digest']
+
+        coords = Coordinates.objects.filter(priority=1).first()
+        coords.width = 10
+        coords.save()
+        new_digest = self.client.get(self.url).json()['digest']
+        self.assertNotEqual(digest, new_digest)
+
+        self.page.url = self.make_page_image('other.jpg')
+        self.page.save()
+        self.assertNotEqual(
+            new_digest, self.client.get(self.url).json()['digest'])
+
+    def test_missing_atlas_image(self):
+        response = self.client.get(f'/api/atlases/{"0" * 64}.png')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from PIL import Image, ImageDraw
+
+from scripts.binarization import (
+    BinarizationOptions, binarize, despeckle, ink_bounds, otsu_threshold,
+    window_sums)
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+
+
+def ink_image(size=(60, 40), background=200):
+    """ A gray image with a dark stroke in its left half. """
+    image = Image.new('L', size, background)
+    ImageDraw.Draw(image).rectangle((10, 10, 19, 29), fill=40)
+    return image
+
+
+class BinarizationTests(TestCase):
+
+    def test_window_sums(self):
+        values = np.arange(30, dtype=np.float64).reshape(5, 6)
+        sums = window_sums(values, 3)
+        padded = np.pad(values, 1, mode='symmetric')
+        self.assertEqual(sums[2, 3], padded[2:5, 3:6].sum())
+        self.assertEqual(sums[0, 0], padded[0:3, 0:3].sum())
+
+    def test_otsu_threshold(self):
+        gray = np.asarray(ink_image())
+        self.assertTrue(40 <= otsu_threshold(gray) < 200)
+
+    def test_binarize(self):
+        for method in ('otsu', 'sauvola'):
+            binarized = binarize(ink_image(), BinarizationOptions(
+                method=method, trim=False))
+            self.assertEqual(binarized.mode, '1')
+            self.assertEqual(binarized.size, (60, 40))
+            self.assertEqual(binarized.getpixel((15, 20)), 0)
+            self.assertEqual(binarized.getpixel((40, 20)), 255)
+
+    def test_trim(self):
+        binarized = binarize(ink_image(), BinarizationOptions(method='otsu'))
+        self.assertEqual(binarized.size, (10, 20))
+
+    def test_despeckle(self):
+        ink = np.zeros((10, 10), dtype=bool)
+        ink[1, 1] = True
+        ink[5:7, 5:7] = True
+        cleaned = despeckle(ink)
+        self.assertFalse(cleaned[1, 1])
+        self.assertEqual(ink_bounds(cleaned), (5, 5, 7, 7))
+        self.assertIsNone(ink_bounds(np.zeros((3, 3), dtype=bool)))
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            BinarizationOptions(method='niblack')
+        with self.assertRaises(ValueError):
+            BinarizationOptions(window=24)
+
+
+class BinarizeCoordinatesTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.binarized_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.binarized_root)
+        settings_override = override_settings(
+            BINARIZED_ROOT=self.binarized_root,
+            BINARIZED_URL='http://testserver/binarized/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        page = Page.objects.create(
+            manuscript=manuscript, number='1', url=self.make_page_image(),
+            height=300, width=400)
+        letter = Letter.objects.create(letter='a')
+        self.coordinates = [
+            Coordinates.objects.create(
+                page=page, letter=letter, top=20, left=left, height=40,
+                width=30)
+            for left in (10, 100)]
+        Coordinates.objects.filter(pk=self.coordinates[1].pk).update(
+            binary_url='http://example.com/existing.png')
+
+    def binarize(self, *args):
+        stdout = StringIO()
+        call_command(
+            'binarize_coordinates', *args, processes=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_binarized_url_required(self):
+        with override_settings(BINARIZED_URL=None):
+            with self.assertRaises(CommandError):
+                self.binarize()
+
+    def test_binarize_coordinates(self):
+        self.assertIn('Binarized 1 examples', self.binarize('--no-trim'))
+        coordinates = Coordinates.objects.get(pk=self.coordinates[0].pk)
+        self.assertTrue(coordinates.binary_url.startswith(
+            'http://testserver/binarized/'))
+        filename = coordinates.binary_url.rsplit('/', 1)[1]
+        path = os.path.join(self.binarized_root, filename)
+        with Image.open(path) as image:
+            self.assertEqual(image.mode, '1')
+            self.assertEqual(image.size, (30, 40))
+
+        self.assertEqual(
+            Coordinates.objects.get(pk=self.coordinates[1].pk).binary_url,
+            'http://example.com/existing.png')
+        self.assertIn('Binarized 0 examples', self.binarize())
+
+    def test_overwrite(self):
+        self.binarize('--no-trim')
+        old_url = Coordinates.objects.get(pk=self.coordinates[0].pk).binary_url
+        self.assertIn(
+            'Binarized 2 examples',
+            self.binarize('--overwrite', '--no-despeckle'))
+        self.assertEqual(len(os.listdir(self.binarized_root)), 2)
+        self.assertNotEqual(
+            Coordinates.objects.get(pk=self.coordinates[0].pk).binary_url,
+            old_url)
+
+    def test_rotated(self):
+        Coordinates.objects.filter(pk=self.coordinates[0].pk).update(
+            orientation=Coordinates.ORIENTATION_CHOICES['180DEG'][0])
+        self.binarize('--no-trim', '--method', 'otsu', '--no-despeckle')
+        url = Coordinates.objects.get(pk=self.coordinates[0].pk).binary_url
+        with open(os.path.join(
+                self.binarized_root, url.rsplit('/', 1)[1]), 'rb') as f:
+            rotated = Image.open(BytesIO(f.read()))
+        # the page has a dot at (10, 20), the top left of the example
+        self.assertEqual(rotated.getpixel((29, 39)), 0)
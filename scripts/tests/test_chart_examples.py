@@ -0,0 +1,94 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from scripts.models import ChartExample, Coordinates, Letter, Manuscript, Page
+
+
+class ChartExampleTests(TestCase):
+
+    def setUp(self):
+        self.manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.letters = [Letter.objects.create(letter=_) for _ in 'ab']
+        self.page = Page.objects.create(
+            manuscript=self.manuscript, number='1',
+            url='http://example.com/1.jpg', height=300, width=400)
+        self.coordinates = [
+            Coordinates.objects.create(
+                page=self.page, letter=self.letters[0], priority=priority,
+                top=10, left=10 * i, height=20, width=10)
+            for i, priority in enumerate((1, 2, 3, None))]
+
+    def assertInSync(self):
+        expected = set(
+            Coordinates.objects.filter(priority__isnull=False)
+            .values_list(*ChartExample.SOURCE_FIELDS.values()))
+        self.assertEqual(
+            set(ChartExample.objects.values_list(
+                *ChartExample.SOURCE_FIELDS)),
+            expected)
+        return expected
+
+    def test_create(self):
+        self.assertEqual(len(self.assertInSync()), 3)
+
+    def test_priority_shifts(self):
+        self.coordinates[2].priority = 1
+        self.coordinates[2].save()
+        self.assertInSync()
+        self.assertEqual(
+            ChartExample.objects.get(coordinates=self.coordinates[0]).priority,
+            2)
+
+        self.coordinates[3].priority = 1
+        self.coordinates[3].save()
+        self.assertEqual(len(self.assertInSync()), 4)
+
+        self.coordinates[1].priority = None
+        self.coordinates[1].save()
+        self.assertEqual(len(self.assertInSync()), 3)
+
+    def test_delete(self):
+        self.coordinates[0].delete()
+        self.assertEqual(len(self.assertInSync()), 2)
+        self.assertEqual(
+            ChartExample.objects.get(coordinates=self.coordinates[1]).priority,
+            1)
+
+    def test_collection_change(self):
+        self.coordinates[0].letter = self.letters[1]
+        self.coordinates[0].save()
+        self.assertInSync()
+        self.assertEqual(
+            sorted(ChartExample.objects.filter(letter_id=self.letters[0].id)
+                   .values_list('priority', flat=True)),
+            [1, 2])
+
+    def test_page_change(self):
+        self.page.url = 'http://example.com/2.jpg'
+        self.page.save()
+        self.assertEqual(
+            set(ChartExample.objects.values_list('page_url', flat=True)),
+            {'http://example.com/2.jpg'})
+
+    def test_sync_command(self):
+        Coordinates.objects.filter(pk=self.coordinates[0].pk).update(
+            binary_url='http://example.com/binarized.png')
+        stdout = StringIO()
+        call_command('sync_chart_examples', stdout=stdout)
+        self.assertIn('Synced 3 chart examples', stdout.getvalue())
+        self.assertInSync()
+
+    def test_get_letters(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f'/api/letters?ms_ids={self.manuscript.id}'
+                f'&letter_ids={self.letters[0].id}&count=2')
+        examples = response.json()['mss'][str(self.manuscript.id)][
+            str(self.letters[0].id)]
+        self.assertEqual(
+            sorted(example['id'] for example in examples),
+            [self.coordinates[0].id, self.coordinates[1].id])
+        self.assertEqual(examples[0]['pageurl'], 'http://example.com/1.jpg')
+        self.assertEqual(examples[0]['page'], '1')
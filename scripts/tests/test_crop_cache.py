@@ -0,0 +1,79 @@
+import os
+import tempfile
+import shutil
+
+from django.test import TestCase
+
+from scripts.crop_cache import DiskCropCache, crop_cache_key, get_crop_cache
+from scripts.image_cache import page_image_cache
+from scripts.tests.helpers import LocalImagesMixin
+
+
+class DiskCropCacheTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_key_depends_on_all_inputs(self):
+        key = crop_cache_key('http://a/b.jpg', 1, 2, 3, 4, format='png')
+        self.assertEqual(
+            key, crop_cache_key('http://a/b.jpg', 1, 2, 3, 4, format='png'))
+        self.assertNotEqual(
+            key, crop_cache_key('http://a/b.jpg', 1, 2, 3, 5, format='png'))
+        self.assertNotEqual(
+            key, crop_cache_key('http://a/b.jpg', 1, 2, 3, 4, format='webp'))
+
+    def test_get_and_put(self):
+        cache = DiskCropCache(self.root, max_bytes=1024)
+        self.assertIsNone(cache.get('abcd'))
+        cache.put('abcd', b'content')
+        self.assertEqual(cache.get('abcd'), b'content')
+
+    def test_lru_eviction(self):
+        cache = DiskCropCache(self.root, max_bytes=25)
+        cache.put('aaaa', b'x' * 10)
+        cache.put('bbbb', b'x' * 10)
+        # make 'aaaa' the most recently used entry
+        os.utime(cache.path('bbbb'), (0, 0))
+        cache.get('aaaa')
+        cache.put('cccc', b'x' * 10)
+
+        self.assertIsNotNone(cache.get('aaaa'))
+        self.assertIsNone(cache.get('bbbb'))
+        self.assertIsNotNone(cache.get('cccc'))
+        self.assertLessEqual(cache.size(), 25)
+
+
+class CropEndpointCachingTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        page_url = self.make_page_image()
+        self.url = f'/api/crop?page_url={page_url}&x=10&y=20&w=30&h=40'
+
+    def test_etag_and_cache_control(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_if_none_match_returns_304_without_rendering(self):
+        etag = self.client.get(self.url)['ETag']
+        page_image_cache.clear()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(page_image_cache.misses, 0)
+
+    def test_rendered_crop_is_served_from_disk(self):
+        first = self.client.get(self.url)
+        self.assertEqual(page_image_cache.misses, 1)
+        page_image_cache.clear()
+
+        second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(page_image_cache.misses, 0)
+        self.assertEqual(get_crop_cache().size(), len(first.content))
@@ -0,0 +1,176 @@
+import json
+import struct
+from io import BytesIO
+
+from django.test import TestCase
+
+from PIL import Image
+
+from scripts.crops import CROP_BATCH_CONTENT_TYPE
+from scripts.image_cache import page_image_cache
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+
+
+def unpack_crops(content):
+    """ Return the index and a list of crops (or None for errors) from a
+        packed crops container.
+    """
+    (index_length,) = struct.unpack('>I', content[:4])
+    index = json.loads(content[4:4 + index_length])['crops']
+    data = content[4 + index_length:]
+    crops = [
+        data[entry['offset']:entry['offset'] + entry['length']]
+        if 'offset' in entry else None
+        for entry in index
+    ]
+    return index, crops
+
+
+class LetterImageBatchTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.page_urls = [
+            self.make_page_image('a.jpg'), self.make_page_image('b.jpg')]
+
+        manuscript = Manuscript.objects.create(shelfmark='test manuscript')
+        letter = Letter.objects.create(letter='test letter')
+        self.coordinates = []
+        for page_url in self.page_urls:
+            page = Page.objects.create(
+                manuscript=manuscript, number='1', url=page_url,
+                height=300, width=400)
+            for left in (10, 50, 90):
+                self.coordinates.append(Coordinates.objects.create(
+                    page=page, letter=letter,
+                    top=20, left=left, height=40, width=30))
+
+    def test_batch_by_ids(self):
+        ids = [coords.id for coords in self.coordinates]
+        response = self.client.get(
+            f'/api/crops?ids={"|".join(str(_) for _ in ids)}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CROP_BATCH_CONTENT_TYPE)
+
+        index, crops = unpack_crops(response.content)
+        self.assertEqual([entry['id'] for entry in index], ids)
+        for crop in crops:
+            self.assertEqual(Image.open(BytesIO(crop)).size, (30, 40))
+
+        # each page is decoded just once
+        self.assertEqual(page_image_cache.misses, len(self.page_urls))
+
+    def test_batch_by_specs(self):
+        crops = [
+            {'page_url': self.page_urls[0], 'x': 0, 'y': 0, 'w': 5, 'h': 6},
+            {'page_url': self.page_urls[1], 'x': 1, 'y': 1, 'w': 7, 'h': 8},
+        ]
+        response = self.client.post(
+            '/api/crops', {'crops': crops, 'ids': [self.coordinates[0].id]},
+            content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        index, images = unpack_crops(response.content)
+        self.assertEqual(
+            [entry.get('id', entry.get('crop')) for entry in index],
+            [self.coordinates[0].id, 0, 1])
+        self.assertEqual(
+            [Image.open(BytesIO(image)).size for image in images],
+            [(30, 40), (5, 6), (7, 8)])
+
+    def test_missing_coordinates(self):
+        response = self.client.get(
+            f'/api/crops?ids=0|{self.coordinates[0].id}')
+        index, crops = unpack_crops(response.content)
+        self.assertIn('error', index[0])
+        self.assertIsNone(crops[0])
+        self.assertIsNotNone(crops[1])
+
+    def test_invalid_requests(self):
+        response = self.client.get('/api/crops')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            '/api/crops', json.dumps({'crops': [{'page_url': 'x'}]}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CropOptionsTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        page_url = self.make_page_image()
+        self.url = f'/api/crop?page_url={page_url}&x=10&y=20&w=80&h=40'
+
+    def get_image(self, query='', **headers):
+        response = self.client.get(self.url + query, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, Image.open(BytesIO(response.content))
+
+    def test_defaults_to_png(self):
+        response, image = self.get_image()
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual((image.format, image.mode), ('PNG', 'RGB'))
+
+    def test_explicit_formats(self):
+        for crop_format, pil_format in (('webp', 'WEBP'), ('jpg', 'JPEG'),
+                                        ('jpeg', 'JPEG'), ('png', 'PNG')):
+            _, image = self.get_image(f'&format={crop_format}')
+            self.assertEqual(image.format, pil_format)
+
+    def test_accept_negotiation(self):
+        response, image = self.get_image(
+            HTTP_ACCEPT='image/avif,image/webp,image/*,*/*;q=0.8')
+        self.assertEqual(image.format, 'WEBP')
+        self.assertIn('Accept', response['Vary'].split(', '))
+
+        _, image = self.get_image(HTTP_ACCEPT='image/*')
+        self.assertEqual(image.format, 'PNG')
+
+        _, image = self.get_image(HTTP_ACCEPT='image/jpeg')
+        self.assertEqual(image.format, 'JPEG')
+
+        _, image = self.get_image('&format=png', HTTP_ACCEPT='image/webp')
+        self.assertEqual(image.format, 'PNG')
+
+    def test_etag_varies_with_options(self):
+        etags = set(
+            self.client.get(self.url + query)['ETag']
+            for query in ('', '&format=webp', '&format=webp&quality=50',
+                          '&mode=gray', '&scale=0.5'))
+        self.assertEqual(len(etags), 5)
+
+    def test_scale_and_max_size(self):
+        _, image = self.get_image('&scale=0.5')
+        self.assertEqual(image.size, (40, 20))
+        _, image = self.get_image('&max_size=20')
+        self.assertEqual(image.size, (20, 10))
+        _, image = self.get_image('&max_size=200')
+        self.assertEqual(image.size, (80, 40))
+
+    def test_modes(self):
+        _, image = self.get_image('&mode=gray')
+        self.assertEqual(image.mode, 'L')
+        _, image = self.get_image('&mode=bitonal')
+        self.assertEqual(image.mode, '1')
+        _, image = self.get_image('&mode=bitonal&format=jpeg')
+        self.assertEqual(image.mode, 'L')
+
+    def test_invalid_options(self):
+        for query in ('&format=gif', '&format=jpeg&quality=0', '&scale=0',
+                      '&mode=x'):
+            response = self.client.get(self.url + query)
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_options(self):
+        response = self.client.post(
+            '/api/crops?format=webp&scale=0.5',
+            {'crops': [{'page_url': self.make_page_image(),
+                        'x': 0, 'y': 0, 'w': 10, 'h': 10}]},
+            content_type='application/json', HTTP_ACCEPT='image/jpeg')
+        index, crops = unpack_crops(response.content)
+        self.assertEqual(index[0]['content_type'], 'image/webp')
+        self.assertEqual(Image.open(BytesIO(crops[0])).size, (5, 5))
@@ -0,0 +1,93 @@
+import shutil
+import tempfile
+from io import BytesIO
+from zipfile import ZipFile
+
+from django.test import SimpleTestCase, TestCase
+
+from PIL import Image
+
+from scripts.decoding import (
+    decode_region, open_reduced, reduced_size, reduction_for_scale)
+from scripts.image_cache import page_image_cache, page_image_key
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+from scripts.utils import create_letter_zip
+
+
+class DecodeStrategyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.image = Image.new('RGB', (300, 200))
+        for x in range(0, 300, 3):
+            for y in range(0, 200, 7):
+                self.image.putpixel((x, y), (x % 256, y, 100))
+
+    def save(self, extension):
+        path = f'{self.tmp_dir}/page.{extension}'
+        self.image.save(path)
+        return path
+
+    def test_reduction_for_scale(self):
+        self.assertEqual(reduction_for_scale(1), 1)
+        self.assertEqual(reduction_for_scale(0.6), 1)
+        self.assertEqual(reduction_for_scale(0.5), 2)
+        self.assertEqual(reduction_for_scale(0.3), 2)
+        self.assertEqual(reduction_for_scale(0.25), 4)
+        self.assertEqual(reduction_for_scale(0.01), 8)
+
+    def test_open_reduced(self):
+        for extension in ('jpg', 'png'):
+            for reduce in (1, 2, 4, 8):
+                image = open_reduced(self.save(extension), reduce)
+                self.assertEqual(
+                    image.size, reduced_size(self.image.size, reduce))
+
+    def test_raw_region_decode(self):
+        box = (20, 30, 70, 90)
+        for extension in ('tif', 'ppm'):
+            region = decode_region(self.save(extension), box)
+            self.assertEqual(region.tobytes(), self.image.crop(box).tobytes())
+
+    def test_unsupported_region_decode(self):
+        self.assertIsNone(decode_region(self.save('jpg'), (0, 0, 10, 10)))
+        self.assertIsNone(decode_region(self.save('tif'), (0, 0, 1000, 10)))
+
+
+class ScaledCropTests(LocalImagesMixin, TestCase):
+
+    def test_scaled_crop(self):
+        page_url = self.make_page_image()
+        response = self.client.get(
+            f'/api/crop?page_url={page_url}&x=10&y=20&w=80&h=40&scale=0.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (40, 20))
+        self.assertIn(page_image_key(page_url, 2), page_image_cache)
+
+    def test_invalid_scale(self):
+        page_url = self.make_page_image()
+        response = self.client.get(
+            f'/api/crop?page_url={page_url}&x=10&y=20&w=80&h=40&scale=2')
+        self.assertEqual(response.status_code, 400)
+
+    def test_local_region_crop_skips_page_cache(self):
+        page_url = self.make_page_image('page.tif')
+        response = self.client.get(
+            f'/api/crop?page_url={page_url}&x=10&y=20&w=80&h=40')
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (80, 40))
+        self.assertEqual(len(page_image_cache), 0)
+
+    def test_letter_zip(self):
+        page = Page.objects.create(
+            manuscript=Manuscript.objects.create(shelfmark='test ms'),
+            number='1', url=self.make_page_image(), height=300, width=400)
+        for left in (10, 20, 30):
+            Coordinates.objects.create(
+                page=page, letter=Letter.objects.create(letter=f'l{left}'),
+                top=5, left=left, height=10, width=10)
+
+        zip_file = ZipFile(create_letter_zip(page.coordinates.all()))
+        self.assertEqual(len(zip_file.namelist()), 3)
+        self.assertEqual(page_image_cache.misses, 1)
@@ -0,0 +1,154 @@
+import json
+from io import BytesIO
+
+from django.test import SimpleTestCase, TestCase
+
+from PIL import Image
+
+from scripts.iiif import IIIFError, parse_region, parse_rotation, parse_size
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+
+
+class ParseTests(SimpleTestCase):
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region('full', 400, 300), (0, 0, 400, 300))
+        self.assertEqual(parse_region('square', 400, 300), (50, 0, 300, 300))
+        self.assertEqual(
+            parse_region('10,20,30,40', 400, 300), (10, 20, 30, 40))
+        self.assertEqual(
+            parse_region('pct:10,10,50,50', 400, 300), (40, 30, 200, 150))
+        # clipped to the image
+        self.assertEqual(
+            parse_region('390,290,30,40', 400, 300), (390, 290, 10, 10))
+        for region in ('400,0,10,10', '0,0,0,10', '1,2,3', 'pct:a,b,c,d'):
+            with self.assertRaises(IIIFError):
+                parse_region(region, 400, 300)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('full', 400, 300), (400, 300))
+        self.assertEqual(parse_size('max', 400, 300), (400, 300))
+        self.assertEqual(parse_size('200,', 400, 300), (200, 150))
+        self.assertEqual(parse_size(',150', 400, 300), (200, 150))
+        self.assertEqual(parse_size('pct:25', 400, 300), (100, 75))
+        self.assertEqual(parse_size('100,100', 400, 300), (100, 100))
+        self.assertEqual(parse_size('!100,100', 400, 300), (100, 75))
+        for size in ('800,', ',', '!100,', 'a,b', 'pct:x'):
+            with self.assertRaises(IIIFError):
+                parse_size(size, 400, 300)
+
+    def test_parse_rotation(self):
+        self.assertEqual(parse_rotation('90'), (90, False))
+        self.assertEqual(parse_rotation('!180'), (180, True))
+        with self.assertRaises(IIIFError) as cm:
+            parse_rotation('45')
+        self.assertEqual(cm.exception.status, 501)
+        with self.assertRaises(IIIFError):
+            parse_rotation('left')
+
+
+class IIIFEndpointTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        letter = Letter.objects.create(letter='a')
+        page_url = self.make_page_image('page.png')
+        image = Image.open(self.images_root + '/manuscripts/page.png')
+        # mark the top left corner of the letter's box
+        image.putpixel((20, 10), (255, 0, 0))
+        image.save(self.images_root + '/manuscripts/page.png')
+        self.page = Page.objects.create(
+            manuscript=manuscript, number='1', url=page_url,
+            width=400, height=300)
+        self.upright, self.upside_down = (
+            Coordinates.objects.create(
+                page=self.page, letter=letter, top=10, left=20, height=40,
+                width=30, orientation=orientation)
+            for orientation in (1, 2))
+
+    def get_image(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, Image.open(BytesIO(response.content))
+
+    def test_info(self):
+        self.assertRedirects(
+            self.client.get(f'/iiif/pages/{self.page.id}'),
+            f'http://testserver/iiif/pages/{self.page.id}/info.json',
+            status_code=303, fetch_redirect_response=False)
+
+        response = self.client.get(f'/iiif/pages/{self.page.id}/info.json')
+        info = json.loads(response.content)
+        self.assertEqual(
+            info['@id'], f'http://testserver/iiif/pages/{self.page.id}')
+        self.assertEqual((info['width'], info['height']), (400, 300))
+        self.assertNotIn('tiles', info)
+
+        response = self.client.get(
+            f'/iiif/coordinates/{self.upright.id}/info.json')
+        info = json.loads(response.content)
+        self.assertEqual((info['width'], info['height']), (30, 40))
+
+        self.assertEqual(
+            self.client.get('/iiif/pages/999/info.json').status_code, 404)
+
+    def test_page_image(self):
+        response, image = self.get_image(
+            f'/iiif/pages/{self.page.id}/20,10,30,40/pct:50/!0/gray.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual((image.size, image.mode), ((15, 20), 'L'))
+        self.assertIn(
+            f'/iiif/pages/{self.page.id}/20,10,30,40/15,/!0/gray.jpg>;'
+            f'rel="canonical"', response['Link'])
+
+        _, image = self.get_image(
+            f'/iiif/pages/{self.page.id}/full/full/90/default.png')
+        self.assertEqual(image.size, (300, 400))
+
+    def test_coordinates_orientation(self):
+        _, image = self.get_image(
+            f'/iiif/coordinates/{self.upright.id}/full/full/0/default.png')
+        self.assertEqual(image.size, (30, 40))
+        self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+
+        # the letter's top left corner is at the bottom right once turned
+        _, image = self.get_image(
+            f'/iiif/coordinates/{self.upside_down.id}/full/full/0/default.png')
+        self.assertEqual(image.getpixel((29, 39)), (255, 0, 0))
+
+        _, image = self.get_image(
+            f'/iiif/coordinates/{self.upside_down.id}/15,20,15,20/full/0/'
+            'default.png')
+        self.assertEqual(image.getpixel((14, 19)), (255, 0, 0))
+
+    def test_conditional_request(self):
+        url = f'/iiif/coordinates/{self.upright.id}/full/full/0/default.webp'
+        response, _ = self.get_image(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.upright.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors(self):
+        base = f'/iiif/pages/{self.page.id}'
+        for url, status in (
+                (f'{base}/full/full/45/default.png', 501),
+                (f'{base}/full/full/0/default.gif', 501),
+                (f'{base}/full/full/0/sepia.png', 400),
+                (f'{base}/500,0,10,10/full/0/default.png', 400),
+                (f'{base}/full/800,/0/default.png', 400)):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status, url)
+            self.assertIn('error', json.loads(response.content))
+
+    def test_unknown_size(self):
+        Page.objects.filter(pk=self.page.pk).update(width=0)
+        base = f'/iiif/pages/{self.page.id}'
+        for url in (f'{base}/info.json', f'{base}/full/full/0/default.png',
+                    f'{base}/full/10,/0/default.png'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
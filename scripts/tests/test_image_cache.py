@@ -0,0 +1,66 @@
+from django.test import TestCase
+
+from PIL import Image
+
+from scripts.image_cache import (
+    PageImageCache, image_nbytes, load_page_image, page_image_cache)
+from scripts.tests.helpers import LocalImagesMixin
+
+
+class PageImageCacheTests(TestCase):
+
+    def test_hit_and_miss(self):
+        cache = PageImageCache(max_bytes=10 * 10 * 3)
+        image = Image.new('RGB', (10, 10))
+
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', image)
+        self.assertIs(cache.get('a'), image)
+
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        image = Image.new('RGB', (10, 10))
+        cache = PageImageCache(max_bytes=2 * image_nbytes(image))
+
+        cache.put('a', image)
+        cache.put('b', image.copy())
+        cache.get('a')
+        cache.put('c', image.copy())
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.current_bytes, 2 * image_nbytes(image))
+
+    def test_oversized_image_not_cached(self):
+        cache = PageImageCache(max_bytes=10)
+        self.assertFalse(cache.put('a', Image.new('RGB', (10, 10))))
+        self.assertEqual(len(cache), 0)
+
+
+class LoadPageImageTests(LocalImagesMixin, TestCase):
+
+    def test_repeated_loads_hit_cache(self):
+        page_url = self.make_page_image()
+
+        first = load_page_image(page_url)
+        second = load_page_image(page_url)
+
+        self.assertIs(first, second)
+        self.assertEqual(page_image_cache.misses, 1)
+        self.assertEqual(page_image_cache.hits, 1)
+
+    def test_crop_endpoint_uses_cache(self):
+        page_url = self.make_page_image()
+
+        for x in (10, 20, 30):
+            url = f'/api/crop?page_url={page_url}&x={x}&y=20&w=30&h=40'
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+
+        self.assertEqual(page_image_cache.misses, 1)
+        self.assertEqual(page_image_cache.hits, 2)
@@ -0,0 +1,128 @@
+from io import BytesIO
+
+from django.test import SimpleTestCase, TestCase
+
+from PIL import Image
+
+from scripts.image_client import (
+    CircuitBreaker, CircuitOpenError, ImageClient, ImageFetchError)
+from scripts.tests.helpers import ImageServerMixin
+from scripts.utils import get_sizes
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.before_request('host')
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.breaker.before_request('host')
+        self.assertEqual(cm.exception.retry_after, 10)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.before_request('host')
+
+    def test_half_open_allows_single_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+
+        self.breaker.before_request('host')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request('host')
+
+        self.breaker.record_success()
+        self.breaker.before_request('host')
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.breaker.before_request('host')
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request('host')
+
+
+class ImageClientTests(ImageServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = ImageClient(
+            connect_timeout=1, read_timeout=1, retries=1, backoff_factor=0,
+            pool_size=2, max_per_host=2, failure_threshold=2,
+            reset_timeout=60)
+
+    def test_get(self):
+        self.responses['/page.jpg'] = (200, b'image')
+        self.assertEqual(self.client.get(self.url('/page.jpg')), b'image')
+
+    def test_not_found(self):
+        with self.assertRaises(ImageFetchError):
+            self.client.get(self.url('/missing.jpg'))
+        # client errors don't count against the host
+        self.assertEqual(
+            self.client.circuit_breaker(self.url('/')).failures, 0)
+
+    def test_server_errors_are_retried_then_open_circuit(self):
+        self.responses['/page.jpg'] = (503, b'')
+
+        for _ in range(2):
+            with self.assertRaises(ImageFetchError):
+                self.client.get(self.url('/page.jpg'))
+        self.assertEqual(len(self.requests), 4)
+
+        with self.assertRaises(CircuitOpenError):
+            self.client.get(self.url('/page.jpg'))
+        self.assertEqual(len(self.requests), 4)
+
+    def test_connection_errors(self):
+        url = self.url('/page.jpg')
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(ImageFetchError):
+            self.client.get(url)
+        self.assertEqual(self.client.circuit_breaker(url).failures, 1)
+
+
+class GetSizesTests(ImageServerMixin, TestCase):
+
+    def test_get_sizes(self):
+        output = BytesIO()
+        Image.new('RGB', (120, 80)).save(output, 'JPEG')
+        self.responses['/page.jpg'] = (200, output.getvalue())
+
+        self.assertEqual(
+            get_sizes(self.url('/page.jpg')),
+            (len(output.getvalue()), (120, 80)))
+
+    def test_get_sizes_unavailable(self):
+        self.assertEqual(
+            get_sizes(self.url('/missing.jpg')), (None, (None, None)))
+
+
+class LetterImageFetchErrorTests(ImageServerMixin, TestCase):
+
+    def test_upstream_error(self):
+        response = self.client.get('/api/crop', {
+            'page_url': self.url('/missing.jpg'),
+            'x': 0, 'y': 0, 'w': 10, 'h': 10})
+        self.assertEqual(response.status_code, 502)
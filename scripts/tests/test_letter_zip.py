@@ -0,0 +1,118 @@
+from io import BytesIO
+from unittest import mock
+from zipfile import ZipFile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from PIL import Image
+
+from scripts.image_cache import (
+    load_page_image, local_image_path, page_image_cache)
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+from scripts.utils import create_letter_zip, stream_letter_zip
+
+
+class LetterZipTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.page = Page.objects.create(
+            manuscript=Manuscript.objects.create(shelfmark='test ms'),
+            number='1', url=self.make_page_image(), height=300, width=400)
+        for i, letter in enumerate('abcde'):
+            Coordinates.objects.create(
+                page=self.page, letter=Letter.objects.create(letter=letter),
+                top=5, left=10 * i, height=10, width=8)
+
+    def test_stream_yields_entry_by_entry(self):
+        chunks = list(stream_letter_zip(self.page.coordinates.all()))
+        # one chunk per entry, plus the central directory
+        self.assertEqual(len(chunks), 6)
+
+        zip_file = ZipFile(BytesIO(b''.join(chunks)))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual(
+            sorted(name.split('_')[2] for name in zip_file.namelist()),
+            list('abcde'))
+        image = Image.open(BytesIO(zip_file.read(zip_file.namelist()[0])))
+        self.assertEqual(image.size, (8, 10))
+
+    # the admin's date range filters need static files, which aren't
+    #  collected for tests
+    @override_settings(STATICFILES_STORAGE=(
+        'django.contrib.staticfiles.storage.StaticFilesStorage'))
+    def test_admin_downloads_stream(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+
+        response = self.client.get(
+            f'/admin/scripts/page/{self.page.id}/coordinates/download/')
+        self.assertTrue(response.streaming)
+        zip_file = ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(zip_file.namelist()), 5)
+
+        response = self.client.post('/admin/scripts/coordinates/', {
+            'action': 'download_as_zip', 'index': 0,
+            '_selected_action': self.page.coordinates.values_list(
+                'id', flat=True)[:2],
+        })
+        self.assertTrue(response.streaming)
+        zip_file = ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(zip_file.namelist()), 2)
+
+    def test_pages_fetched_once(self):
+        other_page = Page.objects.create(
+            manuscript=self.page.manuscript, number='2',
+            url=self.make_page_image('other.jpg'), height=300, width=400)
+        for letter in Letter.objects.all():
+            Coordinates.objects.create(
+                page=other_page, letter=letter,
+                top=5, left=5, height=10, width=8)
+
+        # alternate between the two pages
+        coordinates = Coordinates.objects.order_by('letter__letter')
+        with self.assertLogs('scripts.utils', 'INFO') as logs:
+            zip_file = ZipFile(create_letter_zip(coordinates))
+
+        self.assertEqual(len(zip_file.namelist()), 10)
+        self.assertEqual(page_image_cache.misses, 2)
+        self.assertIn('8 page fetches saved', logs.output[0])
+
+    def test_failed_page(self):
+        missing_page = Page.objects.create(
+            manuscript=self.page.manuscript, number='2',
+            url='http://127.0.0.1:1/missing.jpg', height=300, width=400)
+        Coordinates.objects.create(
+            page=missing_page, letter=Letter.objects.first(),
+            top=5, left=5, height=10, width=8)
+
+        zip_file = ZipFile(create_letter_zip(Coordinates.objects.all()))
+        self.assertEqual(len(zip_file.namelist()), 6)
+        self.assertIn(
+            'http://127.0.0.1:1/missing.jpg',
+            zip_file.read('MISSING_1.txt').decode('utf-8'))
+
+    def test_page_decoded_once_without_cache(self):
+        with mock.patch.object(page_image_cache, 'max_bytes', 0), \
+                mock.patch('scripts.crops.load_page_image',
+                           wraps=load_page_image) as load:
+            zip_file = ZipFile(create_letter_zip(Coordinates.objects.all()))
+        self.assertEqual(len(zip_file.namelist()), 5)
+        self.assertEqual(load.call_count, 1)
+
+    def test_undecodable_page(self):
+        bad_page = Page.objects.create(
+            manuscript=self.page.manuscript, number='2',
+            url=self.make_page_image('bad.jpg'), height=300, width=400)
+        with open(local_image_path(bad_page.url), 'wb') as image_file:
+            image_file.write(b'not an image')
+        Coordinates.objects.create(
+            page=bad_page, letter=Letter.objects.first(),
+            top=5, left=5, height=10, width=8)
+
+        zip_file = ZipFile(create_letter_zip(Coordinates.objects.all()))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual(len(zip_file.namelist()), 6)
+        self.assertIn(bad_page.url, zip_file.read('MISSING_1.txt').decode())
@@ -0,0 +1,76 @@
+from unittest import skipIf
+
+from django.test import TestCase
+
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.renderers import msgpack
+
+
+class LettersV2Tests(TestCase):
+
+    def setUp(self):
+        self.manuscripts = [
+            Manuscript.objects.create(shelfmark=f'ms {_}') for _ in 'ab']
+        self.letters = [Letter.objects.create(letter=_) for _ in 'abc']
+        self.pages = [
+            Page.objects.create(
+                manuscript=self.manuscripts[0], number=str(number),
+                url=f'http://example.com/{number}.jpg', height=300, width=400)
+            for number in (1, 2)]
+        self.coordinates = [
+            Coordinates.objects.create(
+                page=page, letter=letter, priority=priority, top=10,
+                left=left, height=20, width=10)
+            for page, letter, priority, left in (
+                (self.pages[0], self.letters[0], 2, 20),
+                (self.pages[1], self.letters[0], 1, 10),
+                (self.pages[0], self.letters[1], 1, 10),
+                (self.pages[0], self.letters[1], None, 30))]
+        self.url = (
+            f'/api/v2/letters?ms_ids='
+            f'{"|".join(str(ms.id) for ms in self.manuscripts)}'
+            f'&letter_ids={"|".join(str(letter.id) for letter in self.letters)}')
+
+    def test_columns(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['version'], 2)
+
+        examples = data['examples']
+        # ordered by manuscript, letter and priority; nothing for the
+        #  second manuscript or third letter
+        self.assertEqual(examples['id'], [
+            self.coordinates[1].id, self.coordinates[0].id,
+            self.coordinates[2].id])
+        self.assertEqual(
+            set(examples['ms']), {self.manuscripts[0].id})
+        self.assertEqual(examples['letter'], [
+            self.letters[0].id, self.letters[0].id, self.letters[1].id])
+        self.assertEqual(examples['left'], [10, 20, 10])
+
+        # each page once
+        pages = data['pages']
+        self.assertEqual(pages['number'], ['2', '1'])
+        self.assertEqual(
+            [pages['url'][_] for _ in examples['page']],
+            [self.pages[1].url, self.pages[0].url, self.pages[0].url])
+
+    def test_count(self):
+        data = self.client.get(f'{self.url}&count=1').json()
+        self.assertEqual(
+            data['examples']['id'],
+            [self.coordinates[1].id, self.coordinates[2].id])
+
+    def test_no_params(self):
+        response = self.client.get('/api/v2/letters')
+        self.assertEqual(response.status_code, 400)
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        json_data = self.client.get(self.url).json()
+        response = self.client.get(
+            self.url, HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json_data)
+        self.assertEqual(
+            msgpack.unpackb(self.client.get(f'{self.url}&format=msgpack').content),
+            json_data)
@@ -0,0 +1,88 @@
+import os
+import shutil
+import stat
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from PIL import Image
+
+from scripts.crops import CropOptions, crop_variant_path
+from scripts.files import FILE_MODE
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+
+
+class PrerenderCropsTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        letter = Letter.objects.create(letter='a')
+        self.coordinates = []
+        for name in ('a.jpg', 'b.jpg'):
+            page = Page.objects.create(
+                manuscript=manuscript, number=name,
+                url=self.make_page_image(name), height=300, width=400)
+            for priority in (1, None):
+                self.coordinates.append(Coordinates.objects.create(
+                    page=page, letter=letter, priority=priority,
+                    top=10, left=20, height=40, width=30))
+
+    def prerender(self, *args):
+        stdout = StringIO()
+        call_command(
+            'prerender_crops', *args, output_dir=self.output_dir,
+            processes=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def path(self, coords, options=CropOptions()):
+        return os.path.join(self.output_dir, crop_variant_path(coords.id, options))
+
+    def test_prerender(self):
+        output = self.prerender()
+        self.assertIn('Rendered 2 crops', output)
+
+        for coords in self.coordinates:
+            self.assertEqual(
+                os.path.exists(self.path(coords)), coords.priority is not None)
+        with open(self.path(self.coordinates[0]), 'rb') as crop:
+            self.assertEqual(Image.open(BytesIO(crop.read())).size, (30, 40))
+        # readable by a front-end server running as another user
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.path(self.coordinates[0])).st_mode),
+            FILE_MODE)
+
+    def test_resume(self):
+        self.prerender()
+        self.assertIn('Rendered 0 crops', self.prerender())
+        self.assertIn('2 skipped', self.prerender())
+        self.assertIn('Rendered 2 crops', self.prerender('--force'))
+
+    def test_variants_and_filters(self):
+        self.prerender('--format', 'webp', '--scale', '0.5',
+                       '--max-priority', '0')
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+        self.prerender('--format', 'webp', '--scale', '0.5',
+                       '--manuscript', 'test-ms', '--letter', 'a')
+        options = CropOptions(format='webp', scale=0.5)
+        self.assertTrue(os.path.exists(self.path(self.coordinates[0], options)))
+
+    def test_prune(self):
+        self.prerender()
+        deleted, deprioritized = self.coordinates[0], self.coordinates[2]
+        deleted_path = self.path(deleted)
+        deleted.delete()
+        deprioritized.refresh_from_db()
+        deprioritized.priority = None
+        deprioritized.save()
+
+        self.assertIn('2 stale removed', self.prerender())
+        self.assertFalse(os.path.exists(deleted_path))
+        self.assertFalse(os.path.exists(self.path(deprioritized)))
@@ -407,3 +407,34 @@ class PriorityFieldTests(TestCase):
             self.get_result(self.manuscript, self.alt_letter),
             expected_alt_result
         )
+
+
+class PriorityNullsLastTests(TestCase):
+
+    def setUp(self):
+        letter = Letter.objects.create(letter='test letter')
+        manuscript = Manuscript.objects.create(shelfmark='test manuscript')
+        page = Page.objects.create(
+            manuscript=manuscript, number='1', height=1, width=1)
+        for priority in (2, None, 1):
+            Coordinates.objects.create(
+                page=page, top=1, left=1, height=1, width=1, letter=letter,
+                priority=priority)
+
+    def test_nulls_last(self):
+        self.assertEqual(
+            list(Coordinates.objects.order_by('priority').values_list(
+                'priority', flat=True)),
+            [1, 2, None])
+
+    def test_non_null_priorities(self):
+        for queryset in (Coordinates.objects.filter(priority__lte=2),
+                         Coordinates.objects.filter(priority__isnull=False)):
+            queryset = queryset.order_by('priority')
+            self.assertNotIn('IS NULL', str(queryset.query))
+            self.assertEqual(
+                list(queryset.values_list('priority', flat=True)), [1, 2])
+
+        queryset = Coordinates.objects.exclude(
+            priority__gt=1).order_by('priority')
+        self.assertIn('IS NULL', str(queryset.query))
@@ -0,0 +1,167 @@
+import os
+import shutil
+import struct
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from PIL import Image
+
+from scripts.models import (
+    ChartExample, Coordinates, Letter, Manuscript, Page, PageImageMetadata)
+from scripts.snapshots import build_chart_snapshots
+from scripts.tests.helpers import ImageServerMixin, LocalImagesMixin
+from scripts.utils import probe_image
+
+
+def exif_description(length):
+    """ Return an Exif block with an ImageDescription of length bytes (built
+        by hand, as Pillow < 6 has no Image.Exif).
+    """
+    # a big-endian TIFF header, then an IFD of one ASCII entry, whose value
+    # follows it
+    ifd = struct.pack('>HHHIII', 1, 0x010e, 2, length + 1, 26, 0)
+    return b'Exif\0\0MM\0*' + struct.pack('>I', 8) + ifd + b'x' * length + b'\0'
+
+
+def jpeg(size, exif_bytes=0):
+    output = BytesIO()
+    Image.new('RGB', size).save(
+        output, 'JPEG', exif=exif_description(exif_bytes))
+    return output.getvalue()
+
+
+class ProbeImageTests(ImageServerMixin, TestCase):
+
+    def test_probe_with_ranges(self):
+        self.accept_ranges = True
+        self.etags['/page.jpg'] = '"v1"'
+        self.responses['/page.jpg'] = (200, jpeg((120, 80), exif_bytes=3000))
+
+        with mock.patch('scripts.utils.PROBE_RANGE_SIZE', 1024):
+            metadata = probe_image(self.url('/page.jpg'))
+
+        self.assertEqual(metadata, {
+            'size': len(self.responses['/page.jpg'][1]), 'format': 'JPEG',
+            'width': 120, 'height': 80, 'etag': '"v1"'})
+        self.assertEqual(
+            [headers['Range'] for _, headers in self.requests],
+            ['bytes=0-1023', 'bytes=1024-2047', 'bytes=2048-3071',
+             'bytes=3072-4095'])
+
+    def test_probe_without_ranges(self):
+        self.responses['/page.jpg'] = (200, jpeg((120, 80)))
+        metadata = probe_image(self.url('/page.jpg'))
+        self.assertEqual((metadata['width'], metadata['height']), (120, 80))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_probe_unchanged(self):
+        self.etags['/page.jpg'] = '"v1"'
+        self.responses['/page.jpg'] = (200, jpeg((120, 80)))
+        self.assertIsNone(probe_image(self.url('/page.jpg'), etag='"v1"'))
+
+
+class PageImageMetadataTests(ImageServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.responses['/page.jpg'] = (200, jpeg((120, 80)))
+
+    def test_page_save_probes_once(self):
+        for number in ('1', '2'):
+            page = Page.objects.create(
+                manuscript=self.manuscript, number=number,
+                url=self.url('/page.jpg'), width=0, height=0)
+            self.assertEqual((page.width, page.height), (120, 80))
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(
+            PageImageMetadata.objects.filter(url=self.url('/page.jpg')).exists())
+
+    def test_page_save_unavailable_image(self):
+        self.assertIsNone(PageImageMetadata.for_url(self.url('/missing.jpg')))
+        self.assertFalse(PageImageMetadata.objects.exists())
+
+
+class ProbePageSizesCommandTests(ImageServerMixin, LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.pages = []
+        for number, url in (
+                ('1', self.url('/1.jpg')),
+                ('2', self.url('/missing.jpg')),
+                ('3', self.make_page_image('3.png', size=(60, 50)))):
+            self.pages.append(Page.objects.create(
+                manuscript=manuscript, number=number, url=url,
+                width=10, height=10))
+        Page.objects.update(width=0, height=0)
+        self.responses['/1.jpg'] = (200, jpeg((120, 80)))
+        self.etags['/1.jpg'] = '"v1"'
+
+    def probe(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'probe_page_sizes', *args, workers=2, stdout=stdout, stderr=stderr)
+        return stdout.getvalue()
+
+    def test_probe_page_sizes(self):
+        output = self.probe()
+        self.assertIn('Probed 2 page images', output)
+        self.assertIn('1 failed; 2 pages updated', output)
+        self.assertEqual(
+            list(Page.objects.order_by('number').values_list('width', 'height')),
+            [(120, 80), (0, 0), (60, 50)])
+
+        metadata = PageImageMetadata.objects.get(url=self.url('/1.jpg'))
+        self.assertEqual(
+            (metadata.format, metadata.etag, metadata.size),
+            ('JPEG', '"v1"', len(self.responses['/1.jpg'][1])))
+
+        self.requests.clear()
+        self.assertIn('Probing 1 page images (2 already probed)', self.probe())
+        self.assertEqual(len(self.requests), 1)
+
+    def test_chart_examples_updated(self):
+        Coordinates.objects.create(
+            page=self.pages[0], letter=Letter.objects.create(letter='a'),
+            priority=1, top=10, left=10, height=20, width=10)
+        self.probe()
+        self.assertEqual(
+            ChartExample.objects.values_list('page_width', 'page_height').get(),
+            (120, 80))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_responses_invalidated(self):
+        url = f'/api/pages/{self.pages[0].id}'
+        self.assertEqual(self.client.get(url).json()['width'], 0)
+        self.probe()
+        self.assertEqual(self.client.get(url).json()['width'], 120)
+
+    def test_chart_snapshots_updated(self):
+        Manuscript.objects.update(display=True)
+        Coordinates.objects.create(
+            page=self.pages[0],
+            letter=Letter.objects.create(letter='a', is_script=True),
+            priority=1, top=10, left=10, height=20, width=10)
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(CHART_SNAPSHOTS_ROOT=root):
+            build_chart_snapshots()
+            self.probe()
+        with open(os.path.join(root, 'chart.json')) as chart_file:
+            self.assertIn('"pagewidth":120', chart_file.read())
+
+    def test_refresh(self):
+        self.probe()
+        self.requests.clear()
+        self.assertIn('1 unchanged', self.probe('--refresh'))
+        self.assertEqual(
+            [headers.get('If-None-Match') for _, headers in self.requests
+             if _ == '/1.jpg'],
+            ['"v1"'])
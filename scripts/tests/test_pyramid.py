@@ -0,0 +1,159 @@
+import os
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from PIL import Image, ImageChops
+
+from scripts.crops import crop_page, get_crops
+from scripts.image_cache import (
+    local_image_path, open_page_image, page_image_cache)
+from scripts.models import Manuscript, Page
+from scripts.pyramid import PyramidStore, get_pyramid_store, pyramid_name
+from scripts.tests.helpers import LocalImagesMixin
+
+
+@override_settings(PYRAMID_TILE_SIZE=64)
+class PyramidStoreTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.page_url = self.make_page_image('page.png', size=(300, 200))
+        self.image = open_page_image(self.page_url).convert('RGB')
+        self.store = get_pyramid_store()
+        self.store.build(self.page_url, self.image)
+
+    def test_build(self):
+        self.assertEqual(self.store.info(self.page_url), {
+            'width': 300, 'height': 200, 'tile_size': 64, 'format': 'png'})
+        files = self.store.files_path(pyramid_name(self.page_url))
+        # levels 0 (1x1) to 9 (300x200)
+        self.assertEqual(
+            sorted(int(level) for level in os.listdir(files)), list(range(10)))
+        self.assertEqual(len(os.listdir(files / '9')), 5 * 4)
+        self.assertEqual(os.listdir(files / '0'), ['0_0.png'])
+        self.assertEqual(Image.open(files / '8' / '2_1.png').size, (22, 36))
+
+    def test_read_tiles_full_resolution(self):
+        box = (50, 60, 140, 170)
+        image, tiles_box, reduce = self.store.read_tiles(self.page_url, box)
+        self.assertEqual(reduce, 1)
+        self.assertIsNone(ImageChops.difference(
+            image.crop(tiles_box), self.image.crop(box)).getbbox())
+
+    def test_read_tiles_reduced(self):
+        _, _, reduce = self.store.read_tiles(
+            self.page_url, (50, 60, 140, 170), 0.25)
+        self.assertEqual(reduce, 4)
+        self.assertIsNone(self.store.read_tiles(self.page_url, (0, 0, 301, 10)))
+        self.assertIsNone(
+            self.store.read_tiles('http://other/page.png', (0, 0, 1, 1)))
+
+    def test_crop_page_reads_tiles(self):
+        os.remove(local_image_path(self.page_url))
+        self.assertEqual(crop_page(self.page_url, 10, 20, 100, 80).size, (100, 80))
+        self.assertEqual(
+            crop_page(self.page_url, 10, 20, 100, 80, 0.5).size, (50, 40))
+
+    def test_get_crops_reads_tiles(self):
+        os.remove(local_image_path(self.page_url))
+        page_image_cache.clear()
+        crops = get_crops(
+            [(self.page_url, 10, 20, 100, 80), (self.page_url, 0, 0, 30, 40)])
+        self.assertEqual(
+            [Image.open(BytesIO(crop)).size for crop in crops],
+            [(100, 80), (30, 40)])
+        self.assertEqual(len(page_image_cache), 0)
+
+    def test_delete(self):
+        self.store.delete(self.page_url)
+        self.assertFalse(self.store.exists(self.page_url))
+        self.assertEqual(self.store.names(), [])
+
+    def test_serve(self):
+        name = pyramid_name(self.page_url)
+        response = self.client.get(f'/api/pyramids/{name}.dzi')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'TileSize="64"', b''.join(response.streaming_content))
+
+        response = self.client.get(f'/api/pyramids/{name}_files/9/1_2.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        tile = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tile.size, (64, 64))
+
+        for url in (f'/api/pyramids/{name}_files/9/9_9.png',
+                    f'/api/pyramids/{name[::-1]}.dzi'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_unsupported_tile_format(self):
+        with self.assertRaises(ValueError):
+            PyramidStore(self.pyramid_root, tile_format='gif')
+
+
+@override_settings(PYRAMID_TILE_SIZE=64)
+class BuildPyramidsTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.pages = [
+            Page.objects.create(
+                manuscript=manuscript, number=name,
+                url=self.make_page_image(name), height=300, width=400)
+            for name in ('a.jpg', 'b.jpg')]
+
+    def build(self, *args):
+        stdout = StringIO()
+        call_command('build_pyramids', *args, processes=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_build_pyramids(self):
+        self.assertIn('Built 2 pyramids', self.build())
+        self.assertIn('Built 0 pyramids', self.build())
+        self.assertIn('2 skipped', self.build())
+        self.assertIn('Built 2 pyramids', self.build('--force'))
+
+    def test_url_change(self):
+        self.build()
+        store = get_pyramid_store()
+        old_url = self.pages[0].url
+
+        page = Page.objects.get(pk=self.pages[0].pk)
+        page.url = self.make_page_image('c.jpg')
+        page.save()
+        self.assertFalse(store.exists(old_url))
+        # rebuilt by the command, not on save
+        self.assertFalse(store.exists(page.url))
+        self.assertIn('Built 1 pyramids', self.build())
+
+    def test_shared_url_change(self):
+        self.build()
+        store = get_pyramid_store()
+        shared_url = self.pages[0].url
+        Page.objects.filter(pk=self.pages[1].pk).update(url=shared_url)
+
+        page = Page.objects.get(pk=self.pages[0].pk)
+        page.url = self.make_page_image('c.jpg')
+        page.save()
+        self.assertTrue(store.exists(shared_url))
+
+    def test_save_without_url_change(self):
+        page = Page.objects.get(pk=self.pages[0].pk)
+        page.number = '2'
+        with CaptureQueriesContext(connection) as queries:
+            page.save()
+        # the old URL isn't queried
+        table = connection.ops.quote_name(Page._meta.db_table)
+        self.assertFalse(any(
+            f'FROM {table}' in query['sql'] for query in queries))
+
+    def test_prune(self):
+        self.build()
+        store = get_pyramid_store()
+        store.build('http://example.com/gone.jpg', Image.new('RGB', (10, 10)))
+        self.assertIn('Pruned 1 pyramids', self.build('--prune'))
+        self.assertEqual(len(store.names()), 2)
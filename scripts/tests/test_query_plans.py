@@ -0,0 +1,101 @@
+import re
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from scripts.atlas import get_examples
+from scripts.letter_endpoint import get_chart_examples
+from scripts.models import Coordinates, Letter, Manuscript, Page
+
+
+# statements worth explaining (not savepoints, inserts...)
+EXPLAINED_STATEMENTS = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.I)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryPlanTests(TestCase):
+    """ EXPLAIN the hot queries, and fail if any of them reads a whole table
+        (or index) or sorts its results rather than reading them in order
+        from an index.  Runs on SQLite and MySQL.
+    """
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest(f'No query plan checks for {connection.vendor}')
+
+        self.manuscripts = [
+            Manuscript.objects.create(shelfmark=f'test ms {_}') for _ in 'ab']
+        self.letters = [Letter.objects.create(letter=_) for _ in 'abc']
+        self.pages = [
+            Page.objects.create(
+                manuscript=manuscript, number='1',
+                url=f'http://example.com/{manuscript.id}.jpg', height=300,
+                width=400)
+            for manuscript in self.manuscripts]
+        self.coordinates = [
+            Coordinates.objects.create(
+                page=page, letter=letter, priority=priority,
+                top=10, left=10 * i, height=20, width=10)
+            for page in self.pages for letter in self.letters
+            for i, priority in enumerate((1, 2, 3, None))]
+        self.ms_ids = [manuscript.id for manuscript in self.manuscripts]
+        self.letter_ids = [letter.id for letter in self.letters]
+
+    def plan_problems(self, sql):
+        """ Return the steps of the plan of sql that scan or sort. """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [
+                    row[-1] for row in cursor.fetchall()
+                    if row[-1].startswith('SCAN') or 'TEMP B-TREE' in row[-1]]
+
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0].lower() for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [
+                row for row in rows
+                if row['type'] == 'ALL' or 'filesort' in (row['extra'] or '')]
+
+    def assertIndexed(self, func, *args):
+        """ Check the plans of the queries func(*args) makes. """
+        with CaptureQueriesContext(connection) as context:
+            func(*args)
+        queries = [
+            query['sql'] for query in context.captured_queries
+            if EXPLAINED_STATEMENTS.match(query['sql'])]
+        self.assertTrue(queries)
+        for sql in queries:
+            problems = self.plan_problems(sql)
+            self.assertFalse(problems, f'{sql}\n{problems}')
+
+    def test_chart(self):
+        self.assertIndexed(
+            get_chart_examples, self.ms_ids, self.letter_ids, 3)
+
+    def test_atlas_examples(self):
+        self.assertIndexed(get_examples, self.ms_ids, self.letter_ids, 3)
+
+    def test_coordinates_list(self):
+        page_id, letter_id = self.pages[0].id, self.letters[0].id
+        for params in (f'page_id={page_id}', f'letter_id={letter_id}',
+                       f'page_id={page_id}&letter_id={letter_id}'):
+            self.assertIndexed(
+                self.client.get, f'/api/coordinates?{params}&format=json')
+
+    def test_page_list(self):
+        self.assertIndexed(
+            self.client.get,
+            f'/api/pages?manuscript_id={self.manuscripts[0].id}&format=json')
+
+    def test_priority_shifts(self):
+        def shift(coordinates, priority):
+            coordinates.priority = priority
+            coordinates.save()
+
+        self.assertIndexed(shift, self.coordinates[2], 1)
+        self.assertIndexed(shift, self.coordinates[2], None)
+        self.assertIndexed(shift, self.coordinates[3], 1)
+        self.assertIndexed(self.coordinates[0].delete)
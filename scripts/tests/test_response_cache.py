@@ -0,0 +1,248 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.response_cache import (
+    bump_generation, generation_key, new_generation)
+
+
+LOCMEM_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        self.manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.letter = Letter.objects.create(letter='a')
+        self.page = Page.objects.create(
+            manuscript=self.manuscript, number='1',
+            url='http://example.com/1.jpg', height=300, width=400)
+        self.coordinates = [
+            Coordinates.objects.create(
+                page=self.page, letter=self.letter, priority=priority,
+                top=10, left=10 * priority, height=20, width=10)
+            for priority in (1, 2)]
+
+    def assertCached(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, **kwargs)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        return response
+
+    def test_cached(self):
+        for url in ('/api/manuscripts', f'/api/manuscripts/{self.manuscript.id}',
+                    '/api/pages', f'/api/pages?manuscript_id={self.manuscript.id}',
+                    f'/api/pages/{self.page.id}', '/api/coordinates',
+                    f'/api/coordinates/{self.coordinates[0].id}',
+                    f'/api/letters?ms_ids={self.manuscript.id}'
+                    f'&letter_ids={self.letter.id}'):
+            self.assertCached(url)
+
+    def test_normalized_params(self):
+        self.client.get(
+            f'/api/coordinates?page_id={self.page.id}&letter_id={self.letter.id}')
+        with self.assertNumQueries(0):
+            self.client.get(
+                f'/api/coordinates?letter_id={self.letter.id}'
+                f'&page_id={self.page.id}')
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                            'StaticFilesStorage')
+    def test_negotiation(self):
+        self.assertCached('/api/manuscripts')
+        response = self.client.get('/api/manuscripts', HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertContains(response, 'test ms')
+
+    def test_invalidated_by_save(self):
+        self.assertCached('/api/manuscripts')
+        self.manuscript.shelfmark = 'renamed ms'
+        self.manuscript.save()
+        self.assertContains(self.client.get('/api/manuscripts'), 'renamed ms')
+
+    def test_invalidated_by_delete(self):
+        url = f'/api/coordinates?page_id={self.page.id}'
+        self.assertEqual(len(self.assertCached(url).json()), 2)
+        self.coordinates[1].delete()
+        self.assertEqual(len(self.client.get(url).json()), 1)
+
+    def test_invalidated_by_priority_shift(self):
+        url = (f'/api/letters?ms_ids={self.manuscript.id}'
+               f'&letter_ids={self.letter.id}&count=1')
+
+        def example_ids():
+            examples = self.client.get(url).json()['mss']
+            return [example['id'] for example in
+                    examples[str(self.manuscript.id)][str(self.letter.id)]]
+
+        self.assertEqual(example_ids(), [self.coordinates[0].id])
+        self.coordinates[1].priority = 1
+        self.coordinates[1].save()
+        self.assertEqual(example_ids(), [self.coordinates[1].id])
+
+    def test_bump_generation(self):
+        url = f'/api/pages/{self.page.id}'
+        self.assertCached(url)
+        Page.objects.filter(pk=self.page.pk).update(number='2')
+        self.assertEqual(self.client.get(url).json()['id'], self.page.id)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        bump_generation(Page)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_errors_not_cached(self):
+        self.client.get('/api/pages/0')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/pages/0').status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.letter = Letter.objects.create(letter='a')
+        self.page = Page.objects.create(
+            manuscript=self.manuscript, number='1',
+            url='http://example.com/1.jpg', height=300, width=400)
+        self.letters_url = (f'/api/letters?ms_ids={self.manuscript.id}'
+                            f'&letter_ids={self.letter.id}')
+
+    def test_not_modified(self):
+        for url in ('/api/manuscripts', f'/api/pages/{self.page.id}',
+                    '/api/coordinates', self.letters_url):
+            response = self.client.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b'')
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def at(self, timestamp):
+        """ Patch the time seen by the response cache. """
+        patcher = mock.patch('scripts.response_cache.time')
+        patcher.start().time.return_value = timestamp
+        self.addCleanup(patcher.stop)
+
+    def test_if_modified_since(self):
+        cache.set(generation_key(Page), '1000.2:a', None)
+        self.at(1001.5)
+        response = self.client.get('/api/pages')
+        self.assertEqual(response['Last-Modified'], http_date(1000))
+        not_modified = self.client.get(
+            '/api/pages', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_if_modified_since_same_second(self):
+        """ Last-Modified is in whole seconds, so it's neither sent nor
+            honoured while a change in the same second could go unnoticed.
+        """
+        cache.set(generation_key(Page), '1000.7:b', None)
+        self.at(1000.9)
+        response = self.client.get('/api/pages')
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(
+            '/api/pages', HTTP_IF_MODIFIED_SINCE=http_date(1000))
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_invalid_request(self):
+        cache.set(generation_key(Page), '1000.2:a', None)
+        self.at(1001.5)
+        response = self.client.get(
+            '/api/pages/0', HTTP_IF_MODIFIED_SINCE=http_date(2000))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            '/api/pages/0', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+    def test_modified(self):
+        etag = self.client.get(self.letters_url)['ETag']
+        Coordinates.objects.create(
+            page=self.page, letter=self.letter, priority=1,
+            top=10, left=10, height=20, width=10)
+        response = self.client.get(self.letters_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_models_unaffected(self):
+        etag = self.client.get('/api/manuscripts')['ETag']
+        Letter.objects.create(letter='b')
+        response = self.client.get('/api/manuscripts', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_negotiated(self):
+        etag = self.client.get('/api/manuscripts')['ETag']
+        response = self.client.get(
+            '/api/manuscripts?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        url = self.letters_url.replace('/api/', '/api/v2/')
+        response = self.client.get(url, HTTP_ACCEPT='application/x-msgpack')
+        self.assertNotEqual(response['ETag'], self.client.get(url)['ETag'])
+        self.assertIn('Accept', response['Vary'])
+
+    def test_errors_not_validated(self):
+        self.assertFalse(self.client.get('/api/pages/0').has_header('ETag'))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class DummyCacheTests(TestCase):
+
+    def test_not_cached_or_validated(self):
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        url = f'/api/manuscripts/{manuscript.id}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertFalse(response.has_header('Cache-Control'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shelfmark'], 'test ms')
+
+
+class SharedCacheTests(TestCase):
+    """ Generations bumped through another instance of a shared cache (as by
+        another process) invalidate responses.
+    """
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.other_cache = FileBasedCache(location, {})
+
+    def test_bumped_elsewhere(self):
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        url = f'/api/manuscripts/{manuscript.id}'
+        etag = self.client.get(url)['ETag']
+        Manuscript.objects.filter(pk=manuscript.pk).update(shelfmark='new')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get(url).json()['shelfmark'], 'test ms')
+
+        self.other_cache.set(
+            generation_key(Manuscript), new_generation(), None)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shelfmark'], 'new')
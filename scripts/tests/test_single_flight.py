@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.test import SimpleTestCase
+
+from PIL import Image
+
+from scripts.image_cache import load_page_image, page_image_cache
+from scripts.single_flight import (
+    SingleFlight, _fetch_page_content, fetch_page_content,
+    get_page_fetch_spool)
+from scripts.tests.helpers import ImageServerMixin
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def run_concurrently(self, single_flight, func, callers=5):
+        started = threading.Barrier(callers)
+
+        def call():
+            started.wait()
+            return single_flight.do('key', func)
+
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            return [executor.submit(call) for _ in range(callers)]
+
+    def test_concurrent_calls_share_a_result(self):
+        single_flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait(5)
+            return object()
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        futures = self.run_concurrently(single_flight, func)
+        results = [future.result() for future in futures]
+        timer.cancel()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertEqual((single_flight.calls, single_flight.coalesced), (5, 4))
+
+        # later calls aren't coalesced with finished ones
+        self.assertIsNot(single_flight.do('key', func), results[0])
+
+    def test_exceptions_are_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait(5)
+            raise ValueError('failed')
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        futures = self.run_concurrently(single_flight, func, callers=3)
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result()
+        timer.cancel()
+
+
+class PageFetchCoalescingTests(ImageServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        page_image_cache.clear()
+        self.addCleanup(page_image_cache.clear)
+        output = BytesIO()
+        Image.new('RGB', (40, 30), 'blue').save(output, 'PNG')
+        self.content = output.getvalue()
+        self.responses['/page.png'] = (200, self.content)
+
+    def test_concurrent_loads_fetch_once(self):
+        self.delay = 0.2
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            images = list(executor.map(
+                load_page_image, [self.url('/page.png')] * 5))
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(len(set(map(id, images))), 1)
+
+    def test_spooled_content_is_reused(self):
+        self.assertEqual(fetch_page_content(self.url('/page.png')), self.content)
+        self.assertEqual(fetch_page_content(self.url('/page.png')), self.content)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_waits_on_other_process(self):
+        """ A fetch waits on the lock file of a fetch in progress elsewhere,
+            then reads what that fetch spooled.
+        """
+        spool = get_page_fetch_spool()
+        url = self.url('/page.png')
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        results = []
+
+        with spool.lock(key):
+            thread = threading.Thread(
+                target=lambda: results.append(_fetch_page_content(url)))
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            spool.put(key, b'spooled')
+        thread.join(5)
+
+        self.assertEqual(results, [b'spooled'])
+        self.assertEqual(self.requests, [])
+
+    def test_lock_files_are_removed(self):
+        fetch_page_content(self.url('/page.png'))
+        self.assertEqual(
+            list(get_page_fetch_spool().root.glob('*.lock')), [])
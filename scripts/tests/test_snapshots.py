@@ -0,0 +1,134 @@
+import gzip
+import json
+import pathlib
+import shutil
+import tempfile
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from scripts import snapshots
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.snapshots import Debouncer, build_chart_snapshots
+
+
+class ChartSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(
+            CHART_SNAPSHOTS_ROOT=str(self.root / 'snapshots'),
+            CHART_SNAPSHOTS_DELAY=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(snapshots.snapshot_rebuilds.cancel)
+
+        self.manuscripts = [
+            Manuscript.objects.create(shelfmark=shelfmark, display=display)
+            for shelfmark, display in (('ms 1', True), ('ms 2', False))]
+        self.letters = [
+            Letter.objects.create(letter=letter, is_script=is_script)
+            for letter, is_script in (('a', True), ('b', True), ('x', False))]
+        for manuscript in self.manuscripts:
+            page = Page.objects.create(
+                manuscript=manuscript, number='1',
+                url=f'http://example.com/{manuscript.id}.jpg', height=300,
+                width=400)
+            for letter in self.letters:
+                for priority in (1, 2, 3, 4):
+                    Coordinates.objects.create(
+                        page=page, letter=letter, priority=priority,
+                        top=10, left=10 * priority, height=20, width=10)
+
+    def read(self, name):
+        return json.loads((self.root / 'snapshots' / name).read_bytes())
+
+    def test_build(self):
+        sizes = build_chart_snapshots()
+        directory = self.root / 'snapshots'
+        for name in ('manuscripts.json', 'letters.json', 'chart.json'):
+            content = (directory / name).read_bytes()
+            self.assertEqual(sizes[name], len(content))
+            self.assertEqual(
+                gzip.decompress((directory / f'{name}.gz').read_bytes()),
+                content)
+            if snapshots.brotli:
+                self.assertEqual(
+                    snapshots.brotli.decompress(
+                        (directory / f'{name}.br').read_bytes()),
+                    content)
+
+        self.assertEqual(
+            [manuscript['id'] for manuscript in self.read('manuscripts.json')],
+            [self.manuscripts[0].id])
+        self.assertEqual(
+            self.read('letters.json'),
+            [{'id': letter.id, 'letter': letter.letter}
+             for letter in self.letters[:2]])
+
+    def test_chart_matches_api(self):
+        build_chart_snapshots()
+        response = self.client.get(
+            f'/api/letters?ms_ids={self.manuscripts[0].id}'
+            f'&letter_ids={self.letters[0].id}|{self.letters[1].id}')
+        self.assertEqual(self.read('chart.json'), response.json())
+
+    def test_schedule(self):
+        self.manuscripts[0].save()
+        self.assertFalse(snapshots.snapshot_rebuilds.pending)
+
+        build_chart_snapshots()
+        self.manuscripts[1].display = True
+        self.manuscripts[1].save()
+        self.assertTrue(snapshots.snapshot_rebuilds.pending)
+
+    def test_update(self):
+        snapshots.update_chart_snapshots()
+        self.assertFalse((self.root / 'snapshots').exists())
+
+        build_chart_snapshots()
+        self.letters[1].is_script = False
+        self.letters[1].save()
+        snapshots.update_chart_snapshots()
+        self.assertFalse(snapshots.snapshot_rebuilds.pending)
+        self.assertEqual(len(self.read('letters.json')), 1)
+
+    def test_command(self):
+        output_dir = self.root / 'output'
+        stdout = StringIO()
+        call_command(
+            'build_chart_snapshots', output_dir=str(output_dir), stdout=stdout)
+        self.assertTrue((output_dir / 'chart.json.gz').exists())
+        self.assertIn('chart.json', stdout.getvalue())
+
+
+class DebouncerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.called = threading.Event()
+
+        def func():
+            self.calls.append(True)
+            self.called.set()
+
+        self.debouncer = Debouncer(func)
+        self.addCleanup(self.debouncer.cancel)
+
+    def test_debounced(self):
+        for _ in range(5):
+            self.debouncer.trigger(0.05)
+        self.assertTrue(self.debouncer.pending)
+        self.assertTrue(self.called.wait(5))
+        self.debouncer.trigger(60)
+        self.debouncer.cancel()
+        self.assertEqual(len(self.calls), 1)
+        self.assertFalse(self.debouncer.pending)
+
+    def test_cancel(self):
+        self.debouncer.trigger(0.01)
+        self.debouncer.cancel()
+        self.assertFalse(self.called.wait(0.1))
@@ -0,0 +1,97 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.streaming import stream_json_array
+
+
+class StreamJSONArrayTests(TestCase):
+
+    def test_chunks(self):
+        items = [{'id': i, 'name': f'܇{i}'} for i in range(7)]
+        chunks = list(stream_json_array(iter(items), chunk_size=3))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks)), items)
+
+    def test_empty(self):
+        self.assertEqual(b''.join(stream_json_array([])), b'[]')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StreamingResponseTests(TestCase):
+
+    def setUp(self):
+        self.manuscripts = [
+            Manuscript.objects.create(shelfmark=f'test ms {i}')
+            for i in range(3)]
+        self.letters = [Letter.objects.create(letter=_) for _ in 'abc']
+        for manuscript in self.manuscripts[:2]:
+            page = Page.objects.create(
+                manuscript=manuscript, number='1',
+                url=f'http://example.com/{manuscript.id}.jpg', height=300,
+                width=400)
+            for letter in self.letters[:2]:
+                for priority in (1, 2, 3):
+                    Coordinates.objects.create(
+                        page=page, letter=letter, priority=priority,
+                        top=10, left=10 * priority, height=20, width=10)
+
+    def get(self, url, **kwargs):
+        """ Return the content of the streamed and unstreamed responses. """
+        with override_settings(STREAMING_THRESHOLD=1):
+            streamed = self.client.get(url, **kwargs)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        with override_settings(STREAMING_THRESHOLD=1000):
+            # a different query string, so it's not served from the cache
+            response = self.client.get(f'{url}&unstreamed', **kwargs)
+        self.assertFalse(response.streaming)
+        return json.loads(b''.join(streamed.streaming_content)), response.json()
+
+    def test_lists(self):
+        for url in ('/api/pages?format=json', '/api/coordinates?format=json',
+                    f'/api/coordinates?letter_id={self.letters[0].id}'
+                    f'&format=json'):
+            streamed, response = self.get(url)
+            self.assertEqual(streamed, response)
+
+    def test_coordinates_queries(self):
+        with override_settings(STREAMING_THRESHOLD=1), \
+                self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/coordinates', HTTP_ACCEPT='application/json')
+            self.assertEqual(
+                len(json.loads(b''.join(response.streaming_content))), 12)
+
+    def test_letters(self):
+        ms_ids = '|'.join(str(_.id) for _ in reversed(self.manuscripts))
+        letter_ids = '|'.join(str(_.id) for _ in self.letters)
+        streamed, response = self.get(
+            f'/api/letters?ms_ids={ms_ids}&letter_ids={letter_ids}&count=2')
+        self.assertEqual(streamed, response)
+        self.assertEqual(
+            streamed['mss'][str(self.manuscripts[2].id)],
+            dict((str(letter.id), []) for letter in self.letters))
+        self.assertEqual(
+            len(streamed['mss'][str(self.manuscripts[0].id)]
+                [str(self.letters[0].id)]), 2)
+
+    def test_validated(self):
+        with override_settings(STREAMING_THRESHOLD=1):
+            response = self.client.get('/api/pages?format=json')
+            self.assertTrue(response.streaming)
+            b''.join(response.streaming_content)
+            response = self.client.get(
+                '/api/pages?format=json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(
+        STREAMING_THRESHOLD=1,
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                            'StaticFilesStorage')
+    def test_browsable_api(self):
+        response = self.client.get('/api/pages', HTTP_ACCEPT='text/html')
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'example.com')
@@ -0,0 +1,167 @@
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from PIL import Image
+
+from scripts.models import Coordinates, Letter, Manuscript, Page
+from scripts.tests.helpers import LocalImagesMixin
+from scripts.thumbnails import (
+    context_box, coordinates_thumbnail_url, get_thumbnail_cache,
+    image_thumbnail_key, image_thumbnail_url)
+
+
+class ContextBoxTests(SimpleTestCase):
+
+    def test_context_box(self):
+        self.assertEqual(
+            context_box(20, 10, 30, 40, 5, 400, 300), (15, 5, 40, 50))
+        # clipped to the page
+        self.assertEqual(
+            context_box(20, 10, 30, 40, 25, 400, 300), (0, 0, 75, 75))
+        self.assertEqual(
+            context_box(380, 280, 30, 40, 25, 400, 300), (355, 255, 45, 45))
+        # unknown page size
+        self.assertEqual(
+            context_box(380, 280, 30, 40, 25, 0, 0), (355, 255, 80, 90))
+
+
+class CoordinatesThumbnailTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        letter = Letter.objects.create(letter='a')
+        page_url = self.make_page_image('page.png')
+        image = Image.open(self.images_root + '/manuscripts/page.png')
+        # mark the top left corner of the letter's box
+        for x in range(100, 110):
+            for y in range(100, 110):
+                image.putpixel((x, y), (255, 0, 0))
+        image.save(self.images_root + '/manuscripts/page.png')
+        self.page = Page.objects.create(
+            manuscript=manuscript, number='1', url=page_url,
+            width=400, height=300)
+        self.upright, self.upside_down = (
+            Coordinates.objects.create(
+                page=self.page, letter=letter, top=100, left=100,
+                height=160, width=80, orientation=orientation)
+            for orientation in (1, 2))
+
+    def get_thumbnail(self, coordinates, context=0, **kwargs):
+        response = self.client.get(
+            coordinates_thumbnail_url(coordinates, context), **kwargs)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        return response, Image.open(BytesIO(response.content))
+
+    def assertRed(self, pixel):
+        r, g, b = pixel
+        self.assertTrue(r > 200 and g < 60 and b < 60, pixel)
+
+    def test_thumbnail(self):
+        response, image = self.get_thumbnail(self.upright)
+        # scaled down to fit in THUMBNAIL_SIZE
+        self.assertEqual(image.size, (50, 100))
+        self.assertRed(image.getpixel((1, 1)))
+
+        response = self.client.get(
+            coordinates_thumbnail_url(self.upright),
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_context(self):
+        _, image = self.get_thumbnail(self.upright, context=20)
+        # scaled down to fit in THUMBNAIL_SIZE plus the context
+        self.assertEqual(image.size, (84, 140))
+        # the context is shaded, the example itself isn't
+        self.assertLess(sum(image.getpixel((4, 40))), 400)
+        self.assertRed(image.getpixel((16, 16)))
+
+    def test_orientation(self):
+        _, image = self.get_thumbnail(self.upside_down)
+        self.assertRed(image.getpixel((48, 98)))
+
+    def test_versioned_url(self):
+        url = coordinates_thumbnail_url(self.upright)
+        self.upright.top = 120
+        self.upright.save()
+        self.assertNotEqual(url, coordinates_thumbnail_url(self.upright))
+
+    def test_errors(self):
+        url = f'/api/thumbnails/coordinates/{self.upright.id}'
+        self.assertEqual(self.client.get(url + '?context=x').status_code, 400)
+        self.assertEqual(
+            self.client.get(url + '?context=1000').status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/thumbnails/coordinates/0').status_code, 404)
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                            'StaticFilesStorage')
+    def test_admin_changelist(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get('/admin/scripts/coordinates/')
+        self.assertContains(
+            response, coordinates_thumbnail_url(self.upright))
+        self.assertNotContains(response, f'src="{self.page.url}"')
+
+
+class ImageThumbnailTests(LocalImagesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        manuscript = Manuscript.objects.create(shelfmark='test ms')
+        self.page = Page.objects.create(
+            manuscript=manuscript, number='1',
+            url=self.make_page_image('page.jpg', size=(400, 600)),
+            width=400, height=600)
+        self.binary_url = self.make_page_image('binarized.png', size=(50, 80))
+        Coordinates.objects.create(
+            page=self.page, letter=Letter.objects.create(letter='a'),
+            top=10, left=10, height=80, width=50, binary_url=self.binary_url)
+
+    def get_thumbnail(self, url):
+        response = self.client.get(image_thumbnail_url(url))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        return Image.open(BytesIO(response.content))
+
+    def test_page_thumbnail(self):
+        self.assertEqual(self.get_thumbnail(self.page.url).size, (100, 150))
+        self.assertIsNotNone(
+            get_thumbnail_cache().get(image_thumbnail_key(self.page.url)))
+
+    def test_binarized_thumbnail(self):
+        # never scaled up
+        self.assertEqual(self.get_thumbnail(self.binary_url).size, (50, 80))
+
+    def test_unknown_image(self):
+        response = self.client.get(
+            image_thumbnail_url('http://example.com/unknown.jpg'))
+        self.assertEqual(response.status_code, 404)
+
+    def build(self, *args):
+        stdout = StringIO()
+        call_command('build_thumbnails', *args, processes=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_build_thumbnails(self):
+        self.assertIn('Generated 2 thumbnails', self.build())
+        self.assertIn('2 skipped', self.build())
+        self.assertIn('Generated 2 thumbnails', self.build('--force'))
+        self.assertIn(
+            'Generated 0 thumbnails', self.build('--manuscript', 'other'))
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                            'StaticFilesStorage')
+    def test_admin_changelist(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get('/admin/scripts/page/')
+        self.assertContains(response, image_thumbnail_url(self.page.url))
+        self.assertNotContains(response, f'src="{self.page.url}"')
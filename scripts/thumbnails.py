@@ -0,0 +1,218 @@
+""" Small, server-rendered thumbnails for the admin.
+
+    * /api/thumbnails/coordinates/<coords id>?context=<pixels> returns the
+      part of its page image a Coordinates object outlines, surrounded by up
+      to `context` pixels of the page (shaded, as the admin used to do with
+      CSS), turned the right way up if its orientation requires it and scaled
+      down to fit in `settings.THUMBNAIL_SIZE` (plus the context on either
+      side)
+    * /api/thumbnails/images?url=<url> returns a page image, or an example's
+      binarized image, scaled down to `settings.THUMBNAIL_SIZE` wide
+
+    Thumbnails are read through `scripts.crops.crop_page` where possible, so
+    only as much of the page image as necessary is decoded, and are cached on
+    disk in `settings.THUMBNAIL_CACHE_ROOT`, lazily or ahead of time by
+    `manage.py build_thumbnails`.  The URLs of example thumbnails carry the
+    modification dates of the example and its page, so browsers can keep
+    them for as long as crops.
+"""
+
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+
+from PIL import Image, ImageDraw
+
+from scripts.crop_cache import DiskCropCache, crop_cache_key
+from scripts.crops import CropOptions, crop_page, encode_crop
+from scripts.image_cache import open_page_image
+from scripts.image_client import ImageFetchError
+from scripts.models import Coordinates, Page
+from scripts.views import error_response, fetch_error_response, is_not_modified
+
+
+THUMBNAIL_OPTIONS = CropOptions(format='jpeg', quality=80)
+THUMBNAIL_MAX_CONTEXT = 100
+# opacity of the shading over the context around an example
+THUMBNAIL_CONTEXT_SHADE = 128
+
+
+_thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    """ Return the thumbnail cache, or None if it's disabled. """
+    global _thumbnail_cache
+
+    if not settings.THUMBNAIL_CACHE_ROOT:
+        return None
+    if (_thumbnail_cache is None or
+            str(_thumbnail_cache.root) != str(settings.THUMBNAIL_CACHE_ROOT) or
+            _thumbnail_cache.max_bytes != settings.THUMBNAIL_CACHE_MAX_BYTES):
+        _thumbnail_cache = DiskCropCache(
+            settings.THUMBNAIL_CACHE_ROOT, settings.THUMBNAIL_CACHE_MAX_BYTES)
+    return _thumbnail_cache
+
+
+def thumbnail_version(*objects):
+    return '-'.join(
+        str(int(obj.modified_date.timestamp() * 1000000)) for obj in objects)
+
+
+def coordinates_thumbnail_url(coordinates, context=0):
+    """ Return the (versioned) URL of the thumbnail of coordinates. """
+    url = reverse('coordinates-thumbnail', args=[coordinates.id])
+    version = thumbnail_version(coordinates, coordinates.page)
+    return f'{url}?context={context}&v={version}'
+
+
+def context_box(left, top, width, height, context, page_width, page_height):
+    """ Return the box (x, y, w, h) of coordinates with context pixels on
+        every side, within the page if its size is known.
+    """
+    x0, y0 = max(left - context, 0), max(top - context, 0)
+    x1, y1 = left + width + context, top + height + context
+    if page_width and page_height:
+        x1, y1 = min(x1, page_width), min(y1, page_height)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def shade_context(image, box):
+    """ Darken image outside of box (left, upper, right, lower). """
+    mask = Image.new('L', image.size, THUMBNAIL_CONTEXT_SHADE)
+    ImageDraw.Draw(mask).rectangle(
+        (box[0], box[1], box[2] - 1, box[3] - 1), fill=0)
+    return Image.composite(Image.new('RGB', image.size), image, mask)
+
+
+def render_coordinates_thumbnail(page_url, box, coordinates_box, rotated,
+                                 max_size):
+    """ Return the encoded thumbnail of the box (x, y, w, h) of the page at
+        page_url, with the area outside of coordinates_box (also x, y, w, h)
+        shaded.
+    """
+    x, y, w, h = box
+    scale = min(1, max_size / max(w, h))
+    image = crop_page(page_url, x, y, w, h, scale).convert('RGB')
+
+    left, top, width, height = coordinates_box
+    if (left, top, width, height) != box:
+        image = shade_context(image, (
+            round((left - x) * scale), round((top - y) * scale),
+            round((left - x + width) * scale), round((top - y + height) * scale)))
+    if rotated:
+        image = image.transpose(Image.ROTATE_180)
+    return encode_crop(image, THUMBNAIL_OPTIONS)
+
+
+def thumbnail_response(request, key, render, *args):
+    """ Return the thumbnail identified by key, from the thumbnail cache or
+        rendered by render(*args).
+    """
+    etag = f'"{key}"'
+
+    if is_not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        thumbnail_cache = get_thumbnail_cache()
+        content = thumbnail_cache.get(key) if thumbnail_cache else None
+        if content is None:
+            try:
+                content = render(*args)
+            except ImageFetchError as e:
+                return fetch_error_response(e)
+            if thumbnail_cache:
+                thumbnail_cache.put(key, content)
+        response = HttpResponse(
+            content, content_type=THUMBNAIL_OPTIONS.content_type)
+        response['Content-Length'] = len(content)
+
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+    return response
+
+
+def coordinates_thumbnail(request, pk):
+    """ Return the thumbnail of a letter example. """
+    try:
+        coordinates = Coordinates.objects.select_related('page').get(pk=pk)
+    except Coordinates.DoesNotExist:
+        raise Http404('Coordinates not found')
+    try:
+        context = int(request.GET.get('context', 0))
+    except ValueError:
+        return error_response('Invalid context', 400)
+    if not 0 <= context <= THUMBNAIL_MAX_CONTEXT:
+        return error_response(
+            f'Context must be between 0 and {THUMBNAIL_MAX_CONTEXT}', 400)
+
+    page = coordinates.page
+    coordinates_box = (coordinates.left, coordinates.top, coordinates.width,
+                       coordinates.height)
+    box = context_box(*coordinates_box, context, page.width, page.height)
+    rotated = (
+        coordinates.orientation == Coordinates.ORIENTATION_CHOICES['180DEG'][0])
+    max_size = settings.THUMBNAIL_SIZE + 2 * context
+    key = crop_cache_key(
+        page.url, *box, thumbnail=max_size, coordinates=coordinates_box,
+        rotated=rotated, version=thumbnail_version(coordinates, page),
+        **THUMBNAIL_OPTIONS._asdict())
+    return thumbnail_response(
+        request, key, render_coordinates_thumbnail,
+        page.url, box, coordinates_box, rotated, max_size)
+
+
+def image_thumbnail_key(url):
+    return crop_cache_key(
+        url, 0, 0, 0, 0, thumbnail=settings.THUMBNAIL_SIZE,
+        **THUMBNAIL_OPTIONS._asdict())
+
+
+def image_thumbnail_url(url):
+    """ Return the URL of the thumbnail of the image at url. """
+    return f'{reverse("image-thumbnail")}?{urlencode({"url": url})}'
+
+
+def render_image_thumbnail(url, size=None):
+    """ Return the encoded thumbnail of the image at url.  If the size of
+        the image is known, it's read through `crop_page` (and so from its
+        pyramid, if it has one).
+    """
+    if size and all(size):
+        width, height = size
+        image = crop_page(
+            url, 0, 0, width, height, min(1, settings.THUMBNAIL_SIZE / width))
+    else:
+        image = open_page_image(url)
+        # decodes JPEGs at a reduced size
+        image.thumbnail((settings.THUMBNAIL_SIZE, image.height))
+    return encode_crop(image, THUMBNAIL_OPTIONS)
+
+
+def get_image_thumbnail(url, size=None):
+    """ Return the encoded thumbnail of the image at url, from the thumbnail
+        cache if possible.
+    """
+    thumbnail_cache = get_thumbnail_cache()
+    key = image_thumbnail_key(url)
+    content = thumbnail_cache.get(key) if thumbnail_cache else None
+    if content is None:
+        content = render_image_thumbnail(url, size)
+        if thumbnail_cache:
+            thumbnail_cache.put(key, content)
+    return content
+
+
+def image_thumbnail(request):
+    """ Return the thumbnail of a page image or binarized letter example. """
+    url = request.GET.get('url', '')
+    size = Page.objects.filter(url=url).values_list('width', 'height').first()
+    if size is None and not Coordinates.objects.filter(binary_url=url).exists():
+        # only thumbnail images the database knows about
+        raise Http404('Image not found')
+    return thumbnail_response(
+        request, image_thumbnail_key(url), render_image_thumbnail, url, size)
@@ -1,56 +1,220 @@
-import urllib
+import io
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from zipfile import ZipFile
 
-import requests
+from django.conf import settings
 from PIL import Image, ImageFile
 
+from .crops import crop_page_boxes
+from .image_cache import local_image_path
+from .image_client import ImageFetchError, get_image_client
+
+
+logger = logging.getLogger(__name__)
+
+PROBE_RANGE_SIZE = 64 * 1024
+
+
+def content_range_total(content_range):
+    """ Return the complete length from a Content-Range header (e.g.
+        "bytes 0-1023/146515"), or None if it's not known.
+    """
+    try:
+        return int(content_range.rsplit('/', 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def probe_image(image_uri, etag=None):
+    """ Return a dict of the size in bytes, format, width, height and ETag of
+        the image at image_uri (any of which may be None if not known), having
+        read only as much of the image as is needed to identify it.
+
+        Images are read from IMAGES_ROOT if they're available there.  Remote
+        images are read in ranges of `PROBE_RANGE_SIZE` bytes if the server
+        supports range requests and in 1KB chunks of a single response
+        otherwise.  If etag is given and the image hasn't changed, return None.
+
+        Raise `ImageFetchError` if the image can't be fetched.
+    """
+    img_path = local_image_path(image_uri)
+    if img_path and img_path.exists():
+        with Image.open(img_path) as image:
+            return {'size': img_path.stat().st_size, 'format': image.format,
+                    'width': image.width, 'height': image.height,
+                    'etag': None}
+
+    metadata = {'size': None, 'format': None, 'width': None, 'height': None,
+                'etag': None}
+    image_parser = ImageFile.Parser()
+    start = 0
+    while True:
+        headers = {'Range': f'bytes={start}-{start + PROBE_RANGE_SIZE - 1}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        with get_image_client().stream(image_uri, headers) as response:
+            if response.status_code == 304:
+                return None
+            partial = response.status_code == 206
+            metadata['etag'] = response.headers.get('ETag')
+            if partial:
+                metadata['size'] = content_range_total(
+                    response.headers.get('Content-Range'))
+            elif response.headers.get('Content-Length'):
+                metadata['size'] = int(response.headers['Content-Length'])
+
+            for data in response.iter_content(1024):
+                image_parser.feed(data)
+                if image_parser.image:
+                    metadata['format'] = image_parser.image.format
+                    metadata['width'], metadata['height'] = \
+                        image_parser.image.size
+                    return metadata
+
+        # the header didn't fit in the range (e.g. a large EXIF block)
+        start += PROBE_RANGE_SIZE
+        if not partial or metadata['size'] is None or start >= metadata['size']:
+            return metadata
+        etag = None
+
 
 def get_sizes(image_uri):
     """Return a tuple of size in bytes and image dimensions
     (width and height, or None if not known) of image_uri by downloading chunks
     of image_uri until it can be recognized as a PIL image"""
     try:
-        file = urllib.request.urlopen(image_uri)
-        size = file.headers.get("content-length")
-        if size:
-            size = int(size)
-        image_parser = ImageFile.Parser()
-        while True:
-            data = file.read(1024)
-            if not data:
-                break
-            image_parser.feed(data)
-            if image_parser.image:
-                return size, image_parser.image.size
-                break
-        file.close()
-        return size, (None, None)
-    except (urllib.request.HTTPError, urllib.error.URLError):
+        metadata = probe_image(image_uri)
+    except ImageFetchError:
         return None, (None, None)
+    return metadata['size'], (metadata['width'], metadata['height'])
 
 
-def create_letter_zip(coordinates):
-    """Return an in memory zip file that contains the letter bounding boxes
-    images expressed in coordinates"""
-    in_memory = BytesIO()
-    zip_file = ZipFile(in_memory, 'w')
-    last_url = ""
+class ZipStream(io.RawIOBase):
+    """An unseekable, write-only file object that buffers whatever is written
+    to it until it's popped; `ZipFile` writes to such files sequentially."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def plan_letter_crops(coordinates):
+    """Return an ordered dict of page url: list of (file name, bounding box)
+    for the letter bounding boxes in coordinates, and the number of page
+    fetches that cropping them in the given order would have needed"""
+    if hasattr(coordinates, 'select_related'):
+        coordinates = coordinates.select_related(
+            'page__manuscript', 'letter').iterator()
+    plan = OrderedDict()
+    sequential_fetches = 0
+    last_url = None
     for coordinate in coordinates:
-        if last_url != coordinate.page.url:
-            url = requests.get(coordinate.page.url, verify=True)
-            image = Image.open(BytesIO(url.content))
-            last_url = coordinate.page.url
         x, w = coordinate.left, coordinate.width
         y, h = coordinate.top, coordinate.height
         letter = coordinate.letter
         page_name = (f"{coordinate.page.manuscript.slug}_"
                      f"{coordinate.page.number}")
         image_name = f"{page_name}_{letter}_{x}_{y}_{w}_{h}.png"
+        plan.setdefault(coordinate.page.url, []).append(
+            (image_name, (x, y, x + w, y + h)))
+        if coordinate.page.url != last_url:
+            sequential_fetches += 1
+            last_url = coordinate.page.url
+    return plan, sequential_fetches
+
+
+def crop_page_letters(url, boxes):
+    """Return (file name, PNG image) for each of boxes, a list of (file name,
+    bounding box), on the page at url; the page image is decoded at most
+    once, and only if the crops can't be read from its pyramid or decoded
+    region by region (see `crop_page_boxes`)"""
+    crops = crop_page_boxes(url, [
+        (left, upper, right - left, lower - upper)
+        for _, (left, upper, right, lower) in boxes])
+    letters = []
+    for (image_name, _), image_crop in zip(boxes, crops):
         image_patch = BytesIO()
-        image_crop = image.crop([x, y, x + w, y + h])
         image_crop.save(image_patch, format='PNG')
-        zip_file.writestr(image_name, image_patch.getvalue())
+        letters.append((image_name, image_patch.getvalue()))
+    return letters
+
+
+def letter_crops(coordinates):
+    """Yield (file name, PNG image) for each of the letter bounding boxes in
+    coordinates, page by page; pages are fetched (and cropped) concurrently,
+    at most `settings.LETTER_ZIP_FETCH_WORKERS` at a time, and only once.
+    The response is already under way when a page fails, so its letters are
+    replaced by a MISSING_<n>.txt file that explains why"""
+    plan, sequential_fetches = plan_letter_crops(coordinates)
+    workers = settings.LETTER_ZIP_FETCH_WORKERS
+    pages = iter(plan.items())
+    pending = deque()
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def fetch_next_page():
+            for url, boxes in pages:
+                pending.append(
+                    (url, boxes, executor.submit(crop_page_letters, url, boxes)))
+                break
+
+        for _ in range(workers):
+            fetch_next_page()
+
+        while pending:
+            url, boxes, future = pending.popleft()
+            try:
+                crops = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failed += 1
+                logger.warning(f'Failed to crop {url} for a letter zip: {e}')
+                missing = '\n'.join(image_name for image_name, _ in boxes)
+                crops = [(f'MISSING_{failed}.txt', (
+                    f'The page image {url} could not be cropped ({e}), so '
+                    f'these letters are missing:\n{missing}\n'
+                ).encode('utf-8'))]
+            fetch_next_page()
+            yield from crops
+
+    logger.info(
+        f'Cropped {sum(len(boxes) for boxes in plan.values())} letters from '
+        f'{len(plan)} pages ({sequential_fetches - len(plan)} page fetches '
+        f'saved by grouping by page)')
+
+
+def stream_letter_zip(coordinates):
+    """Yield, chunk by chunk, a zip file that contains the letter bounding
+    boxes images expressed in coordinates; each image is added (and sent) as
+    soon as it's been cropped, so memory use doesn't grow with the number of
+    coordinates"""
+    stream = ZipStream()
+    with ZipFile(stream, 'w') as zip_file:
+        for image_name, image in letter_crops(coordinates):
+            zip_file.writestr(image_name, image)
+            yield stream.pop()
+    yield stream.pop()
+
+
+def create_letter_zip(coordinates):
+    """Return an in memory zip file that contains the letter bounding boxes
+    images expressed in coordinates"""
+    in_memory = BytesIO()
+    for chunk in stream_letter_zip(coordinates):
+        in_memory.write(chunk)
     in_memory.seek(0)
-    zip_file.close()
     return in_memory
@@ -1,20 +1,131 @@
-import pathlib
-import requests
-from io import BytesIO
-
 from django.conf import settings
-from django.http import HttpResponse
-
-from rest_framework import generics
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    JsonResponse)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 
-from PIL import Image
+from rest_framework import generics, status, views
+from rest_framework.response import Response
 
+from scripts.crops import (
+    CROP_BATCH_CONTENT_TYPE, CROP_FORMATS, CropOptions, crop_options_key,
+    get_crop, get_crops, pack_crops)
+from scripts.image_client import CircuitOpenError, ImageFetchError
 from scripts.models import Manuscript, Page, Coordinates
+from scripts.pyramid import PYRAMID_TILE_FORMATS, get_pyramid_store
+from scripts.response_cache import CachedResponseMixin
 from scripts.serializers import (
     ManuscriptSerializer, PageSerializer, CoordinatesSerializer)
+from scripts.streaming import StreamingListMixin
+
+
+def negotiate_crop_format(accept):
+    """ Return the crop format that best matches an HTTP Accept header.
+        WebP is only chosen if it's explicitly accepted, and PNG is the
+        default.
+    """
+    qualities = {}
+    for media_range in accept.split(','):
+        media_type, *params = [_.strip() for _ in media_range.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        qualities[media_type.lower()] = quality
+
+    def format_quality(crop_format):
+        content_type = CROP_FORMATS[crop_format][1]
+        if crop_format == 'webp':
+            return qualities.get(content_type, 0)
+        return qualities.get(
+            content_type, qualities.get('image/*', qualities.get('*/*', 0)))
+
+    best_format = max(CROP_FORMATS, key=format_quality)
+    return best_format if format_quality(best_format) > 0 else 'png'
+
+
+def get_crop_options(request, w=None, h=None, negotiate=True):
+    """ Return the CropOptions requested by query params (and, if negotiate
+        is set, the Accept header), and whether the format was negotiated
+        from the latter.  Raises ValueError for invalid options.
+
+    Query Params:
+        format (optional):   webp, jpeg (or jpg) or png; if not given, this
+                             is chosen from the Accept header (or is png)
+        quality (optional):  1-100, for webp and jpeg (defaults to 85)
+        scale (optional):    0 < scale <= 1 (defaults to 1)
+        max_size (optional): maximum width and height of the crop, in pixels
+                             (needs the crop's w and h)
+        mode (optional):     color (default), gray or bitonal
+    """
+    params = request.GET
+    crop_format = params.get('format', '').lower().replace('jpg', 'jpeg')
+    if not (crop_format or negotiate):
+        crop_format = 'png'
+    negotiated = negotiate and not crop_format
+    if negotiated:
+        crop_format = negotiate_crop_format(request.META.get('HTTP_ACCEPT', ''))
+
+    scale = float(params.get('scale', 1))
+    if 'max_size' in params and w and h:
+        scale = min(scale, int(params['max_size']) / max(w, h))
+
+    options = CropOptions(
+        format=crop_format,
+        quality=int(params.get('quality', 85)),
+        scale=scale,
+        mode=params.get('mode', 'color'))
+    return options, negotiated
+
+
+def error_response(message, status_code):
+    return JsonResponse({'error': message}, status=status_code)
+
+
+def fetch_error_response(error):
+    """ Return the response to an `ImageFetchError`: a 503, with a
+        Retry-After, while the image server's circuit is open, or else a 502.
+    """
+    if isinstance(error, CircuitOpenError):
+        response = error_response(f'Page image unavailable: {error}', 503)
+        response['Retry-After'] = int(error.retry_after) + 1
+        return response
+    return error_response(f'Page image unavailable: {error}', 502)
+
+
+def is_not_modified(request, etag):
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag in if_none_match or '*' in if_none_match
+
+
+def patch_crop_response(response, etag, negotiated):
+    """ Add the validator and caching headers of a crop response. """
+    response['ETag'] = etag
+    if negotiated:
+        patch_vary_headers(response, ('Accept',))
+    patch_cache_control(
+        response, public=True, max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+    return response
 
 
 class LetterImage(generics.ListAPIView):
+    """
+    Return the crop of a page image.
+
+    Query Params:
+        page_url (required): the page image url
+        x, y, w, h:          the crop's bounding box
+        ...and the output options described in `get_crop_options`
+    """
+
+    def perform_content_negotiation(self, request, force=False):
+        # the image format is negotiated by `get_crop_options`
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request, format=None):
         page_url = self.request.GET.get('page_url')
         x = int(self.request.GET.get('x', 0))
@@ -22,27 +133,157 @@ class LetterImage(generics.ListAPIView):
         w = int(self.request.GET.get('w', 0))
         h = int(self.request.GET.get('h', 0))
 
-        img_path = None
-        if settings.IMAGES_ROOT is not None:
-            img_base = pathlib.Path(settings.IMAGES_ROOT)
-            path = page_url.replace(
-                'https://images.syriac.reclaim.hosting/', '')
-            img_path = img_base / path
+        try:
+            options, negotiated = get_crop_options(self.request, w, h)
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid crop options: {e}'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        key = crop_options_key(page_url, x, y, w, h, options)
+        etag = f'"{key}"'
 
-        if img_path and img_path.exists():
-            image = Image.open(img_path)
+        if is_not_modified(self.request, etag):
+            response = HttpResponseNotModified()
         else:
-            image_response = requests.get(page_url, verify=True)
-            image = Image.open(BytesIO(image_response.content))
+            try:
+                content = get_crop(page_url, x, y, w, h, options, key=key)
+            except ImageFetchError as e:
+                return fetch_error_response(e)
+            response = HttpResponse(
+                content, content_type=options.content_type)
+            response['Content-Length'] = len(response.content)
+
+        return patch_crop_response(response, etag, negotiated)
 
-        image_crop = image.crop([x, y, x + w, y + h])
-        response = HttpResponse(content_type="image/png")
-        image_crop.save(response, "PNG")
-        response['Content-Length'] = len(response.content)
+
+class LetterImageBatch(views.APIView):
+    """
+    Return many letter crops in a single response.
+
+    GET query params:
+        ids: pipe ("|") delimited list of Coordinates IDs
+
+    POST body (JSON):
+        ids (optional):   list of Coordinates IDs
+        crops (optional): list of {"page_url", "x", "y", "w", "h"} objects
+
+    Output options (except max_size) may be given as query params (see
+    `get_crop_options`); they apply to all the crops.
+
+    The crops are returned packed in a single binary container (see
+    `scripts.crops.pack_crops`); index entries carry the requested `id` or
+    the position (`crop`) of the requested crop spec.
+    """
+
+    def perform_content_negotiation(self, request, force=False):
+        # the image format is negotiated by `get_crop_options`
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, format=None):
+        ids = [_ for _ in request.query_params.get('ids', '').split('|') if _]
+        return self.batch_response(ids, [])
+
+    def post(self, request, format=None):
+        return self.batch_response(
+            request.data.get('ids', []), request.data.get('crops', []))
+
+    def batch_response(self, ids, crops):
+        if not (ids or crops):
+            return Response(
+                {'error': 'No Crops Specified!'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        if len(ids) + len(crops) > settings.CROP_BATCH_MAX_SIZE:
+            return Response(
+                {'error': f'Too many crops requested (the maximum is '
+                          f'{settings.CROP_BATCH_MAX_SIZE})!'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            options, _ = get_crop_options(self.request, negotiate=False)
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid crop options: {e}'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ids = [int(_) for _ in ids]
+            crops = [
+                (crop['page_url'],
+                 int(crop['x']), int(crop['y']), int(crop['w']), int(crop['h']))
+                for crop in crops
+            ]
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Invalid Crop Specification!'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        coordinates = dict(
+            (coords[0], coords[1:]) for coords in
+            Coordinates.objects.filter(id__in=ids).values_list(
+                'id', 'page__url', 'left', 'top', 'width', 'height'))
+
+        entries, specs = [], []
+        for coords_id in ids:
+            entries.append({'id': coords_id})
+            specs.append(coordinates.get(coords_id))
+        for i, crop in enumerate(crops):
+            entries.append({'crop': i})
+            specs.append(crop)
+
+        found = [i for i, spec in enumerate(specs) if spec is not None]
+        results = [LookupError('Coordinates not found')] * len(specs)
+        for i, result in zip(found, get_crops([specs[i] for i in found], options)):
+            results[i] = result
+
+        content = pack_crops(entries, results, options.content_type)
+        response = HttpResponse(content, content_type=CROP_BATCH_CONTENT_TYPE)
+        response['Content-Length'] = len(content)
         return response
 
 
-class ManuscriptList(generics.ListAPIView):
+def get_pyramid_path(name, *tile):
+    """ Return the path of the descriptor of pyramid name or, given the
+        level, column, row and format of a tile, of that tile; raise Http404
+        if there's no such (complete) pyramid.
+    """
+    pyramid_store = get_pyramid_store()
+    if pyramid_store is None or not pyramid_store.dzi_path(name).exists():
+        raise Http404('Pyramid not found')
+    if tile:
+        return pyramid_store.tile_path(name, *tile)
+    return pyramid_store.dzi_path(name)
+
+
+def serve_pyramid_file(path, content_type):
+    try:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    except FileNotFoundError:
+        raise Http404('Tile not found')
+    patch_cache_control(
+        response, public=True, max_age=settings.CROP_CACHE_CONTROL_MAX_AGE)
+    return response
+
+
+def get_pyramid_descriptor(request, name):
+    """ Serve the Deep Zoom descriptor of a page image pyramid (see
+        `scripts.pyramid`).
+    """
+    return serve_pyramid_file(get_pyramid_path(name), 'application/xml')
+
+
+def get_pyramid_tile(request, name, level, column, row, tile_format):
+    """ Serve a tile of a page image pyramid. """
+    if tile_format not in PYRAMID_TILE_FORMATS:
+        raise Http404('Tile not found')
+    return serve_pyramid_file(
+        get_pyramid_path(name, level, column, row, tile_format),
+        PYRAMID_TILE_FORMATS[tile_format][1])
+
+
+class ManuscriptList(CachedResponseMixin, generics.ListAPIView):
+    cache_models = (Manuscript,)
     serializer_class = ManuscriptSerializer
 
     def get_queryset(self):
@@ -53,12 +294,14 @@ class ManuscriptList(generics.ListAPIView):
         return queryset
 
 
-class ManuscriptDetail(generics.RetrieveAPIView):
+class ManuscriptDetail(CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = (Manuscript,)
     queryset = Manuscript.objects.all()
     serializer_class = ManuscriptSerializer
 
 
-class PageList(generics.ListAPIView):
+class PageList(CachedResponseMixin, StreamingListMixin, generics.ListAPIView):
+    cache_models = (Page,)
     serializer_class = PageSerializer
 
     def get_queryset(self):
@@ -69,16 +312,19 @@ class PageList(generics.ListAPIView):
         return queryset
 
 
-class PageDetail(generics.RetrieveAPIView):
+class PageDetail(CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = (Page,)
     queryset = Page.objects.all()
     serializer_class = PageSerializer
 
 
-class CoordinatesList(generics.ListAPIView):
+class CoordinatesList(CachedResponseMixin, StreamingListMixin,
+                      generics.ListAPIView):
+    cache_models = (Coordinates, Page)
     serializer_class = CoordinatesSerializer
 
     def get_queryset(self):
-        queryset = Coordinates.objects.all()
+        queryset = Coordinates.objects.select_related('page')
         page_id = self.request.query_params.get('page_id', None)
         letter_id = self.request.query_params.get('letter_id', None)
         if page_id is not None:
@@ -88,6 +334,7 @@ class CoordinatesList(generics.ListAPIView):
         return queryset
 
 
-class CoordinatesDetail(generics.RetrieveAPIView):
+class CoordinatesDetail(CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = (Coordinates, Page)
     queryset = Coordinates.objects.all()
     serializer_class = CoordinatesSerializer